@@ -0,0 +1,109 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure how quickly an engine notices a task finished and starts the next one.
+
+Runs a long linear flow of trivial tasks (each records when it started and
+when it finished) and reports the delay between one task finishing and the
+next one starting; that delay is (mostly) the time the engine spends waiting
+on, analyzing and scheduling completed work.
+
+Each executor is measured with each of the engines waiting strategies (its
+``waiting_strategy`` option); ``futurist`` (the default) waits using
+``futurist.waiters.wait_for_any`` and ``queue`` waits on a completion queue
+that finished futures put themselves into, so that both can be compared.
+"""
+
+import argparse
+import time
+
+from six.moves import range as compat_range
+
+from zag import engines
+from zag.engines.action_engine import builder
+from zag.patterns import linear_flow as lf
+from zag import task
+
+
+class StampTask(task.Task):
+    def execute(self):
+        started = time.time()
+        return (started, time.time())
+
+
+def percentile(ordered, percent):
+    index = int(round((len(ordered) - 1) * (percent / 100.0)))
+    return ordered[index]
+
+
+def measure(executor, waiter, count):
+    f = lf.Flow("root")
+    for i in compat_range(0, count):
+        f.add(StampTask(name="stamp_%s" % i, provides="stamp_%s" % i))
+    if executor == 'serial':
+        e = engines.load(f, engine='serial', waiting_strategy=waiter)
+    else:
+        e = engines.load(f, engine='parallel', executor=executor,
+                         waiting_strategy=waiter)
+    e.compile()
+    e.prepare()
+    started = time.time()
+    e.run()
+    elapsed = time.time() - started
+    stamps = [e.storage.fetch("stamp_%s" % i) for i in compat_range(0, count)]
+    gaps = []
+    for (_prior_start, prior_end), (next_start, _next_end) in zip(stamps,
+                                                                  stamps[1:]):
+        gaps.append(next_start - prior_end)
+    return elapsed, sorted(gaps)
+
+
+def report(executor, waiter, count, elapsed, gaps):
+    print("%s waiting with %s (%s tasks, %0.3f seconds total)"
+          % (executor, waiter, count, elapsed))
+    print("  task end -> next task start (in milliseconds):")
+    print("    mean: %0.3f" % (sum(gaps) * 1000.0 / len(gaps)))
+    print("    p50:  %0.3f" % (percentile(gaps, 50) * 1000.0))
+    print("    p99:  %0.3f" % (percentile(gaps, 99) * 1000.0))
+    print("    max:  %0.3f" % (gaps[-1] * 1000.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', "-t",
+                        dest='tasks', action='store', type=int,
+                        default=1000, metavar="<number>",
+                        help='how many trivial tasks to run in a line'
+                             ' (default: 1000)')
+    parser.add_argument('--executor', "-e",
+                        dest='executors', action='append',
+                        choices=['serial', 'threads', 'processes'],
+                        help='executor(s) to measure (may be repeated,'
+                             ' default: serial and threads)')
+    parser.add_argument('--waiter', "-w",
+                        dest='waiters', action='append',
+                        choices=list(builder.WAITING_STRATEGIES),
+                        help='how the engine waits on finished tasks (may'
+                             ' be repeated, default: futurist and queue)')
+    args = parser.parse_args()
+    executors = args.executors or ['serial', 'threads']
+    waiter_names = args.waiters or ['futurist', 'queue']
+    count = max(2, args.tasks)
+    for executor in executors:
+        for waiter in waiter_names:
+            elapsed, gaps = measure(executor, waiter, count)
+            report(executor, waiter, count, elapsed, gaps)
+
+
+if __name__ == "__main__":
+    main()
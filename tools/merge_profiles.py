@@ -0,0 +1,92 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Merge the profiles of (many runs of) tasks saved in a persistence backend.
+
+Engines that ran with the ``profile_atoms`` option save what profiling the
+tasks they ran collected in the metadata of the tasks atom details; this finds
+those (of the tasks with the given name) in all the logbooks of a backend,
+merges them and prints (or saves, in the ``pstats`` format) the result.
+"""
+
+import argparse
+import contextlib
+import fnmatch
+
+from zag.engines.action_engine import profiling
+from zag.persistence import backends
+from zag.persistence import blobs
+from zag import storage
+
+
+def iter_profiles(conn, pattern, blob_store=None):
+    for book in conn.get_logbooks():
+        for flow_detail in book:
+            for atom_detail in flow_detail:
+                if not fnmatch.fnmatchcase(atom_detail.name, pattern):
+                    continue
+                profile = atom_detail.meta.get(storage.META_PROFILE)
+                if profile is None:
+                    continue
+                if blobs.is_reference(profile):
+                    if blob_store is None:
+                        print("Skipping profile of '%s' (in flow '%s'), it"
+                              " was saved in a blob store (use --blobs to"
+                              " give its directory)" % (atom_detail.name,
+                                                        flow_detail.name))
+                        continue
+                    profile = blobs.load(blob_store, profile)
+                yield profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('connection', metavar="<uri>",
+                        help='connection uri of the persistence backend'
+                             ' (for example sqlite:////tmp/zag.db)')
+    parser.add_argument('task', metavar="<name>",
+                        help='name (or fnmatch pattern) of the task(s) whose'
+                             ' profiles are merged')
+    parser.add_argument('--blobs', dest='blobs', metavar="<path>",
+                        help='directory of the blob store that big profiles'
+                             ' were saved in')
+    parser.add_argument('--output', "-o", dest='output', metavar="<path>",
+                        help='save the merged profile (in the pstats format)'
+                             ' to this file instead of printing it')
+    parser.add_argument('--sort', "-s", dest='sort', default='cumulative',
+                        help='what to sort the printed profile by'
+                             ' (default: cumulative)')
+    parser.add_argument('--limit', "-l", dest='limit', type=int, default=30,
+                        help='how many functions to print (default: 30)')
+    args = parser.parse_args()
+    blob_store = None
+    if args.blobs:
+        blob_store = blobs.DirBlobStore(args.blobs)
+    backend = backends.fetch({'connection': args.connection})
+    with contextlib.closing(backend):
+        with contextlib.closing(backend.get_connection()) as conn:
+            profiles = list(iter_profiles(conn, args.task,
+                                          blob_store=blob_store))
+    merged = profiling.merge(profiles)
+    if merged is None:
+        print("No profiles of '%s' found" % args.task)
+        return
+    print("Merged %s profile(s) of '%s'" % (len(profiles), args.task))
+    if args.output:
+        merged.dump_stats(args.output)
+    else:
+        merged.sort_stats(args.sort).print_stats(args.limit)
+
+
+if __name__ == "__main__":
+    main()
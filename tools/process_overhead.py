@@ -0,0 +1,104 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure the startup and per-task overhead of the process executor.
+
+Starts a process executor, runs a trivial task (that carries some payload,
+to make it more expensive to send to a child) many times and reports how long
+starting (up to the first task finishing) took and how long each following
+task took; this is done with cold workers (the default) and with warm ones
+(preloaded modules and cached tasks).
+"""
+
+import argparse
+import time
+
+from oslo_utils import uuidutils
+from six.moves import range as compat_range
+
+from zag.engines.action_engine import process_executor as pe
+from zag import task
+
+
+class PayloadTask(task.Task):
+    def __init__(self, name, payload_size):
+        super(PayloadTask, self).__init__(name=name)
+        self.payload = [b'x' * 128 for _i in compat_range(0, payload_size)]
+
+    def execute(self):
+        return len(self.payload)
+
+
+def percentile(ordered, percent):
+    index = int(round((len(ordered) - 1) * (percent / 100.0)))
+    return ordered[index]
+
+
+def measure(count, payload_size, workers, **options):
+    t = PayloadTask("payload", payload_size)
+    started = time.time()
+    executor = pe.ParallelProcessTaskExecutor(max_workers=workers, **options)
+    executor.start()
+    try:
+        executor.execute_task(t, uuidutils.generate_uuid(), {}).result()
+        startup = time.time() - started
+        durations = []
+        for _i in compat_range(0, count):
+            started = time.time()
+            executor.execute_task(t, uuidutils.generate_uuid(), {}).result()
+            durations.append(time.time() - started)
+    finally:
+        executor.stop()
+    return startup, sorted(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', "-t",
+                        dest='tasks', action='store', type=int,
+                        default=500, metavar="<number>",
+                        help='how many tasks to run one after another'
+                             ' (default: 500)')
+    parser.add_argument('--payload', "-p",
+                        dest='payload', action='store', type=int,
+                        default=1000, metavar="<number>",
+                        help='how many 128 byte strings each task carries'
+                             ' (default: 1000)')
+    parser.add_argument('--workers', "-w",
+                        dest='workers', action='store', type=int,
+                        default=2, metavar="<number>",
+                        help='how many worker processes to use'
+                             ' (default: 2)')
+    parser.add_argument('--preload', dest='preload', action='append',
+                        default=[], metavar="<module>",
+                        help='module(s) warm workers preload (may be'
+                             ' repeated)')
+    args = parser.parse_args()
+    count = max(1, args.tasks)
+    for kind, options in [('cold', {}),
+                          ('warm', {'preload_modules': args.preload,
+                                    'task_cache_size': 16})]:
+        startup, durations = measure(count, args.payload, args.workers,
+                                     **options)
+        print("%s (%s tasks)" % (kind, count))
+        print("  startup (until first task finished): %0.3f milliseconds"
+              % (startup * 1000.0))
+        print("  per task (in milliseconds):")
+        print("    mean: %0.3f" % (sum(durations) * 1000.0 / len(durations)))
+        print("    p50:  %0.3f" % (percentile(durations, 50) * 1000.0))
+        print("    p99:  %0.3f" % (percentile(durations, 99) * 1000.0))
+        print("    max:  %0.3f" % (durations[-1] * 1000.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Measure what storage costs (in time and collections) per atom transition.
+
+Moves many tasks through the storage calls an engine makes while running one
+(intention, state, progress and result changes) and reports how long each of
+those transitions took and how many garbage collections (which happen more
+often the more objects get allocated) happened while doing so.
+"""
+
+import argparse
+import gc
+import time
+
+from oslo_utils import uuidutils
+from six.moves import range as compat_range
+
+from zag.persistence import models
+from zag import states
+from zag import storage
+from zag import task
+
+
+class NoopTask(task.Task):
+    def execute(self):
+        pass
+
+
+def make_storage(count, meta_size, flush_policy):
+    flow_detail = models.FlowDetail('root', uuid=uuidutils.generate_uuid())
+    s = storage.Storage(flow_detail, flush_policy=flush_policy)
+    names = ["task_%s" % i for i in compat_range(0, count)]
+    s.ensure_atoms([NoopTask(name=name) for name in names])
+    meta = dict(("key_%s" % i, i) for i in compat_range(0, meta_size))
+    for name in names:
+        s.update_atom_metadata(name, meta)
+    return s, names
+
+
+def transition(s, name):
+    s.set_atom_intention(name, states.EXECUTE)
+    s.set_atom_state(name, states.RUNNING)
+    s.set_task_progress(name, 0.5)
+    s.save(name, name)
+    s.set_task_progress(name, 1.0)
+    s.reset(name)
+
+
+def _collections():
+    # How many garbage collections have happened (if this is known).
+    try:
+        return sum(stat['collections'] for stat in gc.get_stats())
+    except AttributeError:
+        return None
+
+
+def measure(count, meta_size, flush_policy):
+    s, names = make_storage(count, meta_size, flush_policy)
+    collections = _collections()
+    started = time.time()
+    for name in names:
+        transition(s, name)
+    s.flush()
+    elapsed = time.time() - started
+    if collections is not None:
+        collections = _collections() - collections
+    return elapsed, collections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', "-t",
+                        dest='tasks', action='store', type=int,
+                        default=5000, metavar="<number>",
+                        help='how many tasks to move through storage'
+                             ' (default: 5000)')
+    parser.add_argument('--meta', "-m",
+                        dest='meta', action='store', type=int,
+                        default=16, metavar="<number>",
+                        help='how many metadata keys each task has'
+                             ' (default: 16)')
+    args = parser.parse_args()
+    count = max(1, args.tasks)
+    for flush_policy in storage.FLUSH_POLICIES:
+        elapsed, collections = measure(count, args.meta, flush_policy)
+        print("%s (%s tasks)" % (flush_policy, count))
+        print("  per transition: %0.3f microseconds"
+              % (elapsed * 1000000.0 / count))
+        if collections is not None:
+            print("  garbage collections: %s" % collections)
+
+
+if __name__ == "__main__":
+    main()
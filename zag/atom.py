@@ -23,6 +23,7 @@ from oslo_utils import reflection
 import six
 from six.moves import zip as compat_zip
 
+from zag.types import cancellation
 from zag.types import sets
 from zag.utils import misc
 
@@ -191,6 +192,12 @@ class Atom(object):
     :param revert_requires: A set or list of required inputs for this atom's
                             ``revert`` method. If unpassed, ``requires`` will
                             be used.
+    :param resources: A dictionary of resource tag to the amount of that
+                      resource this atom uses while it is active (if unpassed
+                      the class level ``resources`` will be used).
+    :param timeout: The number of seconds this atom is allowed to execute
+                    for (if unpassed the class level ``timeout`` will be
+                    used).
     :ivar version: An *immutable* version that associates version information
                    with this atom. It can be useful in resuming older versions
                    of atoms. Standard major, minor versioning concepts
@@ -246,18 +253,49 @@ class Atom(object):
     submission order).
     """
 
+    resources = None
+    """A dictionary of resource tag to the amount of that resource instances
+    of this class use while they are active (for example ``{'db': 1}``), used
+    by engines that have been given limits on how much of some resource can
+    be used at the same time (atoms that would go over those limits are held
+    back until enough of that resource has been freed up by other atoms that
+    have finished). By default atoms use no resources (and are never held
+    back).
+    """
+
+    timeout = None
+    """The number of seconds instances of this class are allowed to spend
+    executing; engines will fail (with a
+    :py:class:`~zag.exceptions.AtomTimeout` failure) and request cancellation
+    of any atom that is still executing once its timeout has passed, so that
+    whatever it is stuck on no longer holds up the rest of the flow. By
+    default atoms are allowed to execute for as long as they need to.
+
+    Do note that engines can not forcefully stop an execution; one that was
+    given up on may keep running (in the executor it was submitted to) while
+    the atom is reverted (or even executed again, when a retry decides
+    to) so atoms with a timeout should stop once their cancellation (see
+    :py:attr:`.cancellation`) is requested.
+    """
+
     default_provides = None
 
     def __init__(self, name=None, provides=None, requires=None,
                  auto_extract=True, rebind=None, inject=None,
-                 ignore_list=None, revert_rebind=None, revert_requires=None):
+                 ignore_list=None, revert_rebind=None, revert_requires=None,
+                 resources=None, timeout=None):
 
         if provides is None:
             provides = self.default_provides
+        if resources is not None:
+            self.resources = dict(resources)
+        if timeout is not None:
+            self.timeout = float(timeout)
 
         self.name = name
         self.version = (1, 0)
         self.inject = inject
+        self._cancellation = cancellation.CancellationToken()
         self.save_as = _save_as_to_mapping(provides)
         self.provides = sets.OrderedSet(self.save_as)
 
@@ -288,6 +326,44 @@ class Atom(object):
         #: requires to function.
         self.requires = exec_requires.union(addl_requires)
 
+    @property
+    def cancellation(self):
+        """Token that tells if the engine would like this atom to stop early.
+
+        Engines (that are configured to do so) request cancellation of atoms
+        that are running when some other atom they are grouped with (by
+        their shared retry controller, or the whole flow if there is none)
+        fails (or when it did not finish executing within its timeout);
+        long running atoms can check (or wait on) this token and return (or
+        raise) early so that reverting can start sooner.
+
+        Each time the atom is scheduled to execute or revert after
+        cancellation was requested it is given a new token (see
+        :py:meth:`.renew_cancellation`); a run that was given up on should
+        therefore keep a reference to the token it started with (instead of
+        looking it up again) so that it keeps seeing its cancellation.
+
+        Only atoms ran in the engines process (not in another process or by a
+        remote worker) will see cancellation requests made after they started
+        running.
+        """
+        return self._cancellation
+
+    @property
+    def cancelled(self):
+        """If the engine has requested that this atom stop early."""
+        return self._cancellation.requested
+
+    def renew_cancellation(self):
+        """Replaces the cancellation token if cancellation was requested.
+
+        The prior token is left as it is (requested) so that whatever is
+        still using it keeps being told to stop.
+        """
+        if self._cancellation.requested:
+            self._cancellation = cancellation.CancellationToken()
+        return self._cancellation
+
     def _build_arg_mapping(self, executor, requires=None, rebind=None,
                            auto_extract=True, ignore_list=None):
 
@@ -16,7 +16,10 @@
 
 import functools
 
+from oslo_utils import excutils
+
 from zag.engines.action_engine.actions import base
+from zag.engines.action_engine import result_cache as rc
 from zag import logging
 from zag import states
 from zag import task as task_atom
@@ -28,9 +31,15 @@ LOG = logging.getLogger(__name__)
 class TaskAction(base.Action):
     """An action that handles scheduling, state changes, ... of task atoms."""
 
-    def __init__(self, storage, notifier, task_executor):
+    def __init__(self, storage, notifier, task_executor, result_cache=None,
+                 profile_selector=None):
         super(TaskAction, self).__init__(storage, notifier)
         self._task_executor = task_executor
+        self._result_cache = result_cache
+        self._profile_selector = profile_selector
+        # Keys of cacheable tasks that are executing (so that their results
+        # can be cached once they finish).
+        self._cache_keys = {}
 
     def _is_identity_transition(self, old_state, state, task, progress=None):
         if state in self.SAVE_RESULT_STATES:
@@ -95,31 +104,79 @@ class TaskAction(base.Action):
                 LOG.exception("Failed setting task progress for %s to %0.3f",
                               task, progress)
 
+    def _on_profiled(self, task, event_type, details):
+        """Should be called when a (profiled) task was profiled."""
+        try:
+            self._storage.set_atom_profile(task.name, details['profile'])
+        except Exception:
+            # Like progress callbacks, these should never fail (so capture
+            # and log the emitted exception instead of raising it).
+            LOG.exception("Failed saving the profile of task %s", task)
+
+    def _should_profile(self, task):
+        return (self._profile_selector is not None and
+                task.notifier.can_be_registered(task_atom.EVENT_PROFILED) and
+                self._profile_selector.wants(task))
+
+    def _submit(self, task, submit_func, *args, **kwargs):
+        if not self._should_profile(task):
+            return submit_func(task, *args, **kwargs)
+        # What the profiler collected is sent to the tasks notifier (before
+        # the future the executor returns is done).
+        callback = functools.partial(self._on_profiled, task)
+        task.notifier.register(task_atom.EVENT_PROFILED, callback)
+
+        def deregister(fut=None):
+            task.notifier.deregister(task_atom.EVENT_PROFILED, callback)
+
+        try:
+            fut = submit_func(task, *args, profile=True, **kwargs)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                deregister()
+        fut.add_done_callback(deregister)
+        return fut
+
     def schedule_execution(self, task):
+        task.renew_cancellation()
         self.change_state(task, states.RUNNING, progress=0.0)
         arguments = self._storage.fetch_mapped_args(
             task.rebind,
             atom_name=task.name,
             optional_args=task.optional
         )
+        if self._result_cache is not None and task.cacheable:
+            key = rc.make_key(task, arguments)
+            if key is not None:
+                try:
+                    result = self._result_cache.get(key)
+                except KeyError:
+                    self._cache_keys[task.name] = key
+                else:
+                    LOG.debug("Using cached result of task '%s'", task)
+                    return self._task_executor.completed_task(task, result)
         if task.notifier.can_be_registered(task_atom.EVENT_UPDATE_PROGRESS):
             progress_callback = functools.partial(self._on_update_progress,
                                                   task)
         else:
             progress_callback = None
         task_uuid = self._storage.get_atom_uuid(task.name)
-        return self._task_executor.execute_task(
-            task, task_uuid, arguments,
-            progress_callback=progress_callback)
+        return self._submit(task, self._task_executor.execute_task,
+                            task_uuid, arguments,
+                            progress_callback=progress_callback)
 
     def complete_execution(self, task, result):
+        key = self._cache_keys.pop(task.name, None)
         if isinstance(result, failure.Failure):
             self.change_state(task, states.FAILURE, result=result)
         else:
             self.change_state(task, states.SUCCESS,
                               result=result, progress=1.0)
+            if key is not None:
+                self._result_cache.put(key, result)
 
     def schedule_reversion(self, task):
+        task.renew_cancellation()
         self.change_state(task, states.REVERTING, progress=0.0)
         arguments = self._storage.fetch_mapped_args(
             task.revert_rebind,
@@ -134,9 +191,9 @@ class TaskAction(base.Action):
                                                   task)
         else:
             progress_callback = None
-        return self._task_executor.revert_task(
-            task, task_uuid, arguments, task_result, failures,
-            progress_callback=progress_callback)
+        return self._submit(task, self._task_executor.revert_task,
+                            task_uuid, arguments, task_result, failures,
+                            progress_callback=progress_callback)
 
     def complete_reversion(self, task, result):
         if isinstance(result, failure.Failure):
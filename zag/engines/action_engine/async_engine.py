@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+
+import fasteners
+
+from zag.engines.action_engine import async_executor
+from zag.engines.action_engine import engine
+from zag import exceptions as exc
+from zag import states
+
+
+class AsyncActionEngine(engine.ActionEngine):
+    """Engine that runs tasks on an asyncio event loop.
+
+    Tasks that define ``async def execute`` (and/or ``async def revert``)
+    are ran as coroutines on the event loop, so thousands of them can be
+    active at the same time without needing a thread for each; tasks with
+    plain (synchronous) methods are ran in a thread pool instead.
+
+    The engine can be ran from a coroutine using ``await engine.run_async()``
+    (in which case the tasks run on that coroutines event loop); the usual
+    blocking ``run`` and ``run_iter`` methods also work (in which case the
+    engine runs its own event loop while it waits for tasks to finish).
+
+    **Additional engine options:**
+
+    * ``max_workers``: a integer that will affect the number of threads that
+      are used to run tasks that are **not** coroutines.
+    """
+
+    def __init__(self, flow, flow_detail, backend, options):
+        super(AsyncActionEngine, self).__init__(flow, flow_detail,
+                                                backend, options)
+        kwargs = {}
+        for (k, value_converter) in \
+                async_executor.AsyncTaskExecutor.constructor_options:
+            try:
+                kwargs[k] = value_converter(self._options[k])
+            except KeyError:
+                pass
+        self._task_executor = async_executor.AsyncTaskExecutor(**kwargs)
+        self._retry_executor = async_executor.AsyncRetryExecutor(
+            self._task_executor)
+
+    async def run_async(self, timeout=None):
+        """Runs the engine on the running event loop (or die trying).
+
+        :param timeout: timeout to wait for any atoms to complete (this timeout
+            will be used during the waiting period that occurs when
+            unfinished atoms are being waited on).
+        """
+        with fasteners.try_lock(self._lock) as was_locked:
+            if not was_locked:
+                raise exc.ExecutionFailure("Engine currently locked, please"
+                                           " try again later")
+            self._task_executor.loop = asyncio.get_event_loop()
+            try:
+                for state in self.run_iter(timeout=timeout):
+                    if state == states.WAITING:
+                        # Let the event loop run the tasks (until at least
+                        # one of them finishes) before the engine goes and
+                        # collects whatever has finished.
+                        await self._task_executor.wait_for_any(
+                            timeout=timeout)
+            finally:
+                self._task_executor.loop = None
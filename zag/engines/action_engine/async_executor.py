@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+import functools
+
+import futurist
+
+from zag.engines.action_engine import executor as base
+from zag import exceptions as exc
+from zag import task as ta
+from zag.types import failure
+from zag.types import notifier
+
+
+async def _execute_task(task, arguments, progress_callback=None):
+    with notifier.register_deregister(task.notifier,
+                                      ta.EVENT_UPDATE_PROGRESS,
+                                      callback=progress_callback):
+        try:
+            task.pre_execute()
+            result = await task.execute(**arguments)
+        except Exception:
+            result = failure.Failure()
+        finally:
+            task.post_execute()
+    return (base.EXECUTED, result)
+
+
+async def _revert_task(task, arguments, result, failures,
+                       progress_callback=None):
+    arguments = arguments.copy()
+    arguments[ta.REVERT_RESULT] = result
+    arguments[ta.REVERT_FLOW_FAILURES] = failures
+    with notifier.register_deregister(task.notifier,
+                                      ta.EVENT_UPDATE_PROGRESS,
+                                      callback=progress_callback):
+        try:
+            task.pre_revert()
+            result = await task.revert(**arguments)
+        except Exception:
+            result = failure.Failure()
+        finally:
+            task.post_revert()
+    return (base.REVERTED, result)
+
+
+class AsyncTaskExecutor(base.TaskExecutor):
+    """Executes tasks on an asyncio event loop.
+
+    Tasks whose ``execute`` (or ``revert``) method is a coroutine function
+    are ran as coroutines on the event loop (so many of them can be active
+    at once using a single thread); tasks with plain methods are ran in a
+    thread pool (so that they do not block the event loop).
+
+    When the engine using this executor is ran via ``run_async`` the event
+    loop that is running that coroutine is used, otherwise this executor
+    creates (and closes) its own event loop and runs it whenever the engine
+    needs to wait for tasks to finish (the engine sets the ``loop`` attribute
+    of this executor to the running event loop before starting it).
+    """
+
+    constructor_options = [
+        ('max_workers', lambda v: v if v is None else int(v)),
+    ]
+    """
+    Optional constructor keyword arguments this executor supports. These will
+    typically be passed via engine options (by a engine user) and converted
+    into the correct type before being sent into this
+    classes ``__init__`` method.
+    """
+
+    def __init__(self, max_workers=None):
+        self._max_workers = max_workers
+        self._pool = None
+        self._loop = None
+        self._own_loop = False
+        self._wakeup = None
+        self._running = set()
+        self.loop = None
+
+    def _notify(self, fut):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(None)
+
+    def track(self, fut):
+        """Arranges for the engine to be woken up when the future is done."""
+        fut.add_done_callback(self._notify)
+        return fut
+
+    async def _run(self, fut, timeout, func, *args, **kwargs):
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            if timeout is None:
+                result = await func(*args, **kwargs)
+            else:
+                # Coroutines that run for too long get cancelled (tasks ran
+                # in the pool can not be, but the engine will still stop
+                # waiting on them).
+                result = await asyncio.wait_for(func(*args, **kwargs),
+                                                timeout)
+        except asyncio.TimeoutError:
+            fut.set_result((base.EXECUTED, failure.Failure.from_exception(
+                exc.AtomTimeout("Atom '%s' did not finish executing within"
+                                " its %s second timeout"
+                                % (fut.atom.name, timeout)))))
+        except BaseException as e:
+            fut.set_exception(e)
+        else:
+            fut.set_result(result)
+
+    async def _run_in_pool(self, func, *args, **kwargs):
+        return await self._loop.run_in_executor(
+            self._pool, functools.partial(func, *args, **kwargs))
+
+    def _submit(self, task, func, *args, **kwargs):
+        timeout = kwargs.pop('timeout', None)
+        fut = futurist.Future()
+        fut.atom = task
+        self.track(fut)
+        runner = self._loop.create_task(self._run(fut, timeout, func,
+                                                  *args, **kwargs))
+        self._running.add(runner)
+        runner.add_done_callback(self._running.discard)
+        return fut
+
+    def execute_task(self, task, task_uuid, arguments, progress_callback=None,
+                     profile=False):
+        # Coroutines are not profiled, since whatever other coroutines run
+        # (while they wait) would be included in the profile.
+        if asyncio.iscoroutinefunction(task.execute):
+            return self._submit(task, _execute_task, task, arguments,
+                                progress_callback=progress_callback,
+                                timeout=task.timeout)
+        else:
+            return self._submit(task, self._run_in_pool,
+                                base._execute_task, task, arguments,
+                                progress_callback=progress_callback,
+                                profile=profile, timeout=task.timeout)
+
+    def completed_task(self, task, result):
+        return self.track(super(AsyncTaskExecutor, self).completed_task(
+            task, result))
+
+    def revert_task(self, task, task_uuid, arguments, result, failures,
+                    progress_callback=None, profile=False):
+        if asyncio.iscoroutinefunction(task.revert):
+            return self._submit(task, _revert_task, task, arguments,
+                                result, failures,
+                                progress_callback=progress_callback)
+        else:
+            return self._submit(task, self._run_in_pool,
+                                base._revert_task, task, arguments,
+                                result, failures,
+                                progress_callback=progress_callback,
+                                profile=profile)
+
+    async def wait_for_any(self, timeout=None):
+        """Waits until some future (that is being tracked) has finished.
+
+        Returns immediately if one has finished since the last time this
+        was called.
+        """
+        if not self._wakeup.done():
+            await asyncio.wait([self._wakeup], timeout=timeout)
+        if self._wakeup.done():
+            self._wakeup = self._loop.create_future()
+
+    def waiter(self, not_done, timeout=None):
+        if self._own_loop:
+            # Nothing else is running our event loop, so run it until some
+            # future has finished (or the timeout has passed).
+            self._loop.run_until_complete(self.wait_for_any(timeout=timeout))
+        # Otherwise the engine awaited on ``wait_for_any`` before getting
+        # here, so just collect whatever has finished.
+        done = set(fut for fut in not_done if fut.done())
+        return (done, not_done - done)
+
+    def start(self):
+        if self.loop is not None:
+            self._loop = self.loop
+            self._own_loop = False
+        else:
+            self._loop = asyncio.new_event_loop()
+            self._own_loop = True
+        self._wakeup = self._loop.create_future()
+        self._pool = futurist.ThreadPoolExecutor(max_workers=self._max_workers)
+
+    def stop(self):
+        if self._own_loop:
+            # Anything left over at this point is not going to be waited
+            # on by anyone, so cancel it before closing up shop.
+            runners = list(self._running)
+            if runners:
+                for runner in runners:
+                    runner.cancel()
+                self._loop.run_until_complete(asyncio.wait(runners))
+            self._loop.close()
+        self._running.clear()
+        self._pool.shutdown(wait=True)
+        self._pool = None
+        self._loop = None
+        self._own_loop = False
+        self._wakeup = None
+
+
+class AsyncRetryExecutor(base.SerialRetryExecutor):
+    """Executes and reverts retries (for a :py:class:`.AsyncTaskExecutor`).
+
+    Retries are ran inline (just like the serial retry executor does); the
+    futures they produce are tracked by the task executor so that the engine
+    knows they are done (and does not wait on tasks to finish instead).
+    """
+
+    def __init__(self, task_executor):
+        super(AsyncRetryExecutor, self).__init__()
+        self._task_executor = task_executor
+
+    def execute_retry(self, retry, arguments):
+        fut = super(AsyncRetryExecutor, self).execute_retry(retry, arguments)
+        return self._task_executor.track(fut)
+
+    def revert_retry(self, retry, arguments):
+        fut = super(AsyncRetryExecutor, self).revert_retry(retry, arguments)
+        return self._task_executor.track(fut)
@@ -14,20 +14,39 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 from concurrent import futures
+import heapq
+import itertools
+import threading
+import time
 import weakref
 
 from automaton import machines
+from oslo_utils import strutils
 from oslo_utils import timeutils
 
+from zag.engines.action_engine import executor as ex
+from zag.engines.action_engine import latency
+from zag import exceptions as exc
 from zag import logging
 from zag import states as st
+from zag import storage
 from zag.types import failure
 from zag.utils import iter_utils
 
 # Default waiting state timeout (in seconds).
 WAITING_TIMEOUT = 60
 
+# How the engine can wait for running atoms to finish.
+WAITING_FUTURIST = 'futurist'
+WAITING_QUEUE = 'queue'
+WAITING_STRATEGIES = (WAITING_FUTURIST, WAITING_QUEUE)
+
+# Reason given when atoms that did not finish within their timeout are asked
+# to stop (whatever they are doing).
+CANCELLED_ON_TIMEOUT = 'timeout'
+
 # Meta states the state machine uses.
 UNDEFINED = 'UNDEFINED'
 GAME_OVER = 'GAME_OVER'
@@ -50,6 +69,15 @@ WAS_CANCELLED = 'was_cancelled'
 SUCCESSFULLY_COMPLETED = 'successfully_completed'
 
 
+# Events (and atom stages) sent to the trace notifier (when something is
+# listening to it) that show what the engine is doing.
+TRACE_MACHINE_STATE = 'machine_state'
+TRACE_ATOM_STAGE = 'atom_stage'
+STAGE_READY = 'ready'
+STAGE_SUBMITTING = 'submitting'
+STAGE_SCHEDULED = 'scheduled'
+STAGE_COMPLETED = 'completed'
+
 # For these states we will gather how long (in seconds) the
 # state was in-progress (cumulatively if the state is entered multiple
 # times)
@@ -66,6 +94,9 @@ class MachineMemory(object):
         self.not_done = set()
         self.failures = []
         self.done = set()
+        # Heap of (deadline, counter, future) for atoms (that are executing)
+        # that have a timeout; the earliest deadline is always first.
+        self.deadlines = []
 
     def cancel_futures(self):
         """Attempts to cancel any not done futures."""
@@ -73,6 +104,44 @@ class MachineMemory(object):
             fut.cancel()
 
 
+class CompletionQueue(object):
+    """Collects futures as they finish (so that they can be waited on).
+
+    Futures that are watched push themselves into this queue when they
+    finish (via a done callback), so waiting only has to block until the
+    queue is non-empty (instead of having to examine and install waiters
+    on every not done future each time some are waited on).
+    """
+
+    def __init__(self):
+        self._done = collections.deque()
+        self._cond = threading.Condition()
+
+    def watch(self, fut):
+        """Arranges for the future to be placed in this queue when done."""
+        fut.add_done_callback(self._on_done)
+
+    def _on_done(self, fut):
+        with self._cond:
+            self._done.append(fut)
+            self._cond.notify()
+
+    def wait(self, not_done, timeout=None):
+        """Waits for any of the (watched) not done futures to finish.
+
+        Returns a tuple of the futures that finished (and were taken out of
+        this queue) and the remaining not done futures, just like
+        :py:func:`futurist.waiters.wait_for_any` does.
+        """
+        with self._cond:
+            if not self._done:
+                self._cond.wait(timeout)
+            done = set()
+            while self._done:
+                done.add(self._done.popleft())
+        return (done, not_done - done)
+
+
 class MachineBuilder(object):
     """State machine *builder* that powers the engine components.
 
@@ -110,12 +179,18 @@ class MachineBuilder(object):
     tasks in parallel, this enables parallel running and/or reversion.
     """
 
-    def __init__(self, runtime, waiter):
+    def __init__(self, runtime, waiter=None):
         self._runtime = weakref.proxy(runtime)
         self._selector = runtime.selector
         self._completer = runtime.completer
         self._scheduler = runtime.scheduler
+        self._prioritizer = runtime.prioritizer
         self._storage = runtime.storage
+        self._result_cache = runtime.options.get('result_cache')
+        self._trace_notifier = runtime.trace_notifier
+        self._save_timings = strutils.bool_from_string(
+            runtime.options.get('atom_timings', False))
+        self._releaser = runtime.releaser
         self._waiter = waiter
 
     def build(self, statistics, timeout=None, gather_statistics=True):
@@ -132,21 +207,58 @@ class MachineBuilder(object):
             statistics['awaiting'] = 0
             statistics['completed'] = 0
             statistics['incomplete'] = 0
+            statistics['timed_out'] = 0
+            if self._releaser is not None:
+                statistics['released_results'] = 0
+            recorder = latency.LatencyRecorder(
+                self._storage, save_timings=self._save_timings)
+            statistics['latencies'] = recorder.histograms
+        else:
+            recorder = None
+        self._scheduler.reset()
+        self._prioritizer.reset()
+        releaser = self._releaser
+        if releaser is not None:
+            releaser.reset()
 
         memory = MachineMemory()
         if timeout is None:
             timeout = WAITING_TIMEOUT
+        if self._waiter is None:
+            # Have finished futures tell us they finished (so that waiting
+            # wakes up as soon as anything completes).
+            completions = CompletionQueue()
+            watch = completions.watch
+            waiter = completions.wait
+        else:
+            watch = None
+            waiter = self._waiter
 
         # Cache some local functions/methods...
         do_complete = self._completer.complete
         do_complete_failure = self._completer.complete_failure
         get_atom_intention = self._storage.get_atom_intention
+        get_atom_state = self._storage.get_atom_state
+        flush_per_cycle = self._storage.flush_policy == storage.FLUSH_PER_CYCLE
+        deadline_counter = itertools.count()
+        # Listeners are registered before running (so this avoids doing any
+        # work to send events to the trace notifier if nothing is listening).
+        trace_notifier = self._trace_notifier
+        tracing = trace_notifier is not None and len(trace_notifier) > 0
+
+        def trace_atoms(atoms, stage):
+            now = timeutils.now()
+            for atom in atoms:
+                trace_notifier.notify(TRACE_ATOM_STAGE, {
+                    'atom_name': atom.name,
+                    'stage': stage,
+                    'timestamp': now,
+                })
 
         def do_schedule(next_nodes):
             with self._storage.lock.write_lock():
                 return self._scheduler.schedule(
-                    sorted(next_nodes,
-                           key=lambda node: getattr(node, 'priority', 0),
+                    sorted(next_nodes, key=self._prioritizer.key,
                            reverse=True))
 
         def iter_next_atoms(atom=None, apply_deciders=True):
@@ -166,9 +278,16 @@ class MachineBuilder(object):
             # attempt, which may be empty if never ran before) and any nodes
             # that are now ready to be ran.
             with self._storage.lock.write_lock():
+                # Ensure what the selector knows matches storage (it may
+                # have been altered while this engine was not running).
+                self._selector.refresh()
                 memory.next_up.update(
                     iter_utils.unique_seen((self._completer.resume(),
                                             iter_next_atoms())))
+            if recorder is not None:
+                recorder.ready(memory.next_up)
+            if tracing:
+                trace_atoms(memory.next_up, STAGE_READY)
             return SCHEDULE
 
         def game_over(old_state, new_state, event):
@@ -206,11 +325,23 @@ class MachineBuilder(object):
                 current_flow_state = self._storage.get_flow_state()
                 if current_flow_state == st.RUNNING and memory.next_up:
                     not_done, failures = do_schedule(memory.next_up)
+                    if recorder is not None:
+                        recorder.scheduled(not_done)
                     if not_done:
+                        if watch is not None:
+                            for fut in not_done:
+                                watch(fut)
+                        track_deadlines(not_done)
                         memory.not_done.update(not_done)
                     if failures:
                         memory.failures.extend(failures)
-                    memory.next_up.intersection_update(not_done)
+                        memory.next_up.clear()
+                    else:
+                        # Anything not scheduled (because the resources it
+                        # uses are being used) stays around until some of
+                        # the active atoms finish (and free them up).
+                        memory.next_up.difference_update(
+                            fut.atom for fut in not_done)
                 elif current_flow_state == st.SUSPENDING and memory.not_done:
                     # Try to force anything not cancelled to now be cancelled
                     # so that the executor that gets it does not continue to
@@ -220,15 +351,60 @@ class MachineBuilder(object):
                     memory.cancel_futures()
             return WAIT
 
+        def track_deadlines(not_done):
+            # Remembers when atoms (that are now executing) that have a
+            # timeout will need to be given up on (reverting is never
+            # limited, since giving up on that would leave things in an
+            # unknown state).
+            now = None
+            for fut in not_done:
+                timeout = fut.atom.timeout
+                if (timeout is not None and
+                        get_atom_state(fut.atom.name) == st.RUNNING):
+                    if now is None:
+                        now = timeutils.now()
+                    heapq.heappush(memory.deadlines,
+                                   (now + timeout, next(deadline_counter),
+                                    fut))
+
+        def time_out(fut):
+            # Gives up on a overdue atom; it is asked to stop (whatever it is
+            # doing) and a failed future is used in its place so that the
+            # engine can move on; whatever the original future finishes with
+            # (if it ever does) is ignored. The resources it was using are
+            # freed now (so that other atoms can use them) even though its
+            # execution may still be going on (executors can not stop it)
+            # and may still be going on while it is being reverted.
+            atom = fut.atom
+            atom.cancellation.request(reason=CANCELLED_ON_TIMEOUT)
+            self._scheduler.release(fut)
+            LOG.warning("Atom '%s' did not finish executing within its"
+                        " %s second timeout", atom, atom.timeout)
+            if gather_statistics:
+                statistics['timed_out'] += 1
+            timed_out = futures.Future()
+            timed_out.atom = atom
+            timed_out.set_result((ex.EXECUTED, failure.Failure.from_exception(
+                exc.AtomTimeout("Atom '%s' did not finish executing within"
+                                " its %s second timeout"
+                                % (atom.name, atom.timeout)))))
+            return timed_out
+
         def complete_an_atom(fut):
             # This completes a single atom saving its result in
             # storage and preparing whatever predecessors or successors will
             # now be ready to execute (or revert or retry...); it also
             # handles failures that occur during this process safely...
             atom = fut.atom
+            if recorder is not None:
+                noticed_at = time.time()
             try:
                 outcome, result = fut.result()
                 do_complete(atom, outcome, result)
+                if recorder is not None:
+                    recorder.completed(fut, noticed_at)
+                if tracing:
+                    trace_atoms([atom], STAGE_COMPLETED)
                 if isinstance(result, failure.Failure):
                     retain = do_complete_failure(atom, outcome, result)
                     if retain:
@@ -248,6 +424,10 @@ class MachineBuilder(object):
                                       result, outcome, atom, intention)
                         if gather_statistics:
                             statistics['discarded_failures'] += 1
+                elif releaser is not None and outcome == ex.EXECUTED:
+                    released = releaser.completed(atom)
+                    if gather_statistics:
+                        statistics['released_results'] += len(released)
                 if gather_statistics:
                     statistics['completed'] += 1
             except futures.CancelledError:
@@ -255,6 +435,8 @@ class MachineBuilder(object):
                 # and move on; at a further time it will be resumed
                 # and something should be done with it to get it
                 # going again.
+                if recorder is not None:
+                    recorder.discard(atom)
                 return WAS_CANCELLED
             except Exception:
                 memory.failures.append(failure.Failure())
@@ -268,8 +450,31 @@ class MachineBuilder(object):
             # TODO(harlowja): maybe we should start doing 'yield from' this
             # call sometime in the future, or equivalent that will work in
             # py2 and py3.
+            if flush_per_cycle:
+                # Save whatever this cycle changed before blocking (the
+                # storage unit has been buffering those changes).
+                self._storage.flush()
             if memory.not_done:
-                done, not_done = self._waiter(memory.not_done, timeout=timeout)
+                deadlines = memory.deadlines
+                # Forget about deadlines of atoms that finished in time.
+                while deadlines and deadlines[0][2] not in memory.not_done:
+                    heapq.heappop(deadlines)
+                if deadlines:
+                    wait_timeout = min(timeout, max(0.0, deadlines[0][0] -
+                                                    timeutils.now()))
+                else:
+                    wait_timeout = timeout
+                done, not_done = waiter(memory.not_done, timeout=wait_timeout)
+                # Only futures that are still being waited on count (ones
+                # that were given up on may finish at any later time).
+                done = set(fut for fut in done if fut in memory.not_done)
+                if deadlines:
+                    now = timeutils.now()
+                    while deadlines and deadlines[0][0] <= now:
+                        fut = heapq.heappop(deadlines)[2]
+                        if fut in not_done:
+                            not_done.discard(fut)
+                            done.add(time_out(fut))
                 memory.done.update(done)
                 memory.not_done = not_done
             return ANALYZE
@@ -300,9 +505,22 @@ class MachineBuilder(object):
                                 " next atom searching failed", atom)
                         else:
                             next_up.update(more_work)
+                if memory.next_up:
+                    # Atoms held back from being scheduled earlier may no
+                    # longer be ready (for example if some other atom failed
+                    # and the flow is now reverting).
+                    memory.next_up.difference_update(
+                        [atom for atom in memory.next_up
+                         if not self._selector.is_ready(atom)])
             current_flow_state = self._storage.get_flow_state()
             if (current_flow_state == st.RUNNING and
-                    next_up and not memory.failures):
+                    (next_up or memory.next_up) and not memory.failures):
+                if recorder is not None or tracing:
+                    now_ready = next_up.difference(memory.next_up)
+                    if recorder is not None:
+                        recorder.ready(now_ready)
+                    if tracing:
+                        trace_atoms(now_ready, STAGE_READY)
                 memory.next_up.update(next_up)
                 return SCHEDULE
             elif memory.not_done:
@@ -315,6 +533,12 @@ class MachineBuilder(object):
         def on_exit(old_state, event):
             LOG.trace("Exiting old state '%s' in response to event '%s'",
                       old_state, event)
+            if tracing:
+                trace_notifier.notify(TRACE_MACHINE_STATE, {
+                    'state': old_state,
+                    'entered': False,
+                    'timestamp': timeutils.now(),
+                })
             if gather_statistics:
                 if old_state in watches:
                     w = watches[old_state]
@@ -324,12 +548,25 @@ class MachineBuilder(object):
                     statistics['incomplete'] = len(memory.not_done)
                 if old_state in (st.ANALYZING, st.SCHEDULING):
                     statistics['awaiting'] = len(memory.next_up)
+                if old_state in (st.WAITING, GAME_OVER):
+                    resources = self._scheduler.resource_statistics()
+                    if resources is not None:
+                        statistics['resources'] = resources
+                    cache = self._result_cache
+                    if cache is not None:
+                        statistics['result_cache'] = cache.statistics()
 
         def on_enter(new_state, event):
             LOG.trace("Entering new state '%s' in response to event '%s'",
                       new_state, event)
             if gather_statistics and new_state in watches:
                 watches[new_state].restart()
+            if tracing:
+                trace_notifier.notify(TRACE_MACHINE_STATE, {
+                    'state': new_state,
+                    'entered': True,
+                    'timestamp': timeutils.now(),
+                })
 
         state_kwargs = {
             'on_exit': on_exit,
@@ -14,10 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import threading
 
 import fasteners
 from oslo_utils import excutils
+from oslo_utils import reflection
 import six
 
 from zag import flow
@@ -397,3 +399,170 @@ class PatternCompiler(object):
                     node.freeze()
                 self._compilation = Compilation(graph, node)
         return self._compilation
+
+
+def _fingerprint_link_value(value):
+    if six.callable(value):
+        # These (typically deciders) are specific to each flow instance, so
+        # only their presence matters (they get rebound when reused).
+        return '<callable>'
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(value))
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    else:
+        return value
+
+
+def _fingerprint(root):
+    """Creates a structural fingerprint of a flow (or atom).
+
+    Returns the fingerprint, all the flows and atoms that are contained
+    in the given root (in the order they were fingerprinted) and all the
+    link metadata (also in the order it was fingerprinted). Two roots with
+    the same fingerprint will compile into the same structure (and
+    those returned sequences can be zipped together to map one roots
+    contents to the others contents).
+    """
+    items = []
+    links = []
+    parts = []
+    item_indexes = {}
+
+    def describe_atom(atom):
+        return (reflection.get_class_name(atom), atom.name,
+                tuple(sorted(six.iteritems(atom.rebind))),
+                tuple(atom.provides))
+
+    def visit(item):
+        item_indexes[item] = len(items)
+        items.append(item)
+        if isinstance(item, flow.Flow):
+            parts.append((reflection.get_class_name(item), item.name,
+                          len(item)))
+            if item.retry is not None:
+                items.append(item.retry)
+                parts.append(describe_atom(item.retry))
+            else:
+                parts.append(None)
+            for child in item:
+                visit(child)
+            for u, v, attr_dict in item.iter_links():
+                links.append(attr_dict)
+                parts.append((item_indexes[u], item_indexes[v],
+                              tuple((key, _fingerprint_link_value(value))
+                                    for key, value in
+                                    sorted(six.iteritems(attr_dict)))))
+        else:
+            parts.append(describe_atom(item))
+
+    visit(root)
+    return (tuple(parts), items, links)
+
+
+class CompilationCache(object):
+    """Shares compilations between flows (or atoms) of the same structure.
+
+    Flows that are created over and over by the same factory (for example
+    one per job) will typically have the same structure; compiling each one
+    of them repeats the same work. This cache compiles the first flow with a
+    given structure (as determined by a fingerprint of the contained atom
+    classes, names, argument mappings, provides, and links) and hands
+    back compilations for later flows with the same structure by rebinding
+    that prior compilation to the later flows atoms (which is
+    much cheaper than compiling them from scratch).
+
+    At most ``max_size`` compilations are retained (the least recently used
+    ones are discarded first).
+    """
+
+    #: Default maximum number of compilations retained.
+    DEFAULT_MAX_SIZE = 128
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        if max_size <= 0:
+            raise ValueError("Maximum size must be greater than zero")
+        self._max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Removes all retained compilations."""
+        with self._lock:
+            self._entries.clear()
+
+    def compile(self, root):
+        """Compiles (or rebinds a prior compilation for) the given root."""
+        key, items, links = _fingerprint(root)
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                entry = None
+            else:
+                # Re-insert it, so that it is now the most recently used...
+                self._entries[key] = entry
+        if entry is None:
+            compilation = PatternCompiler(root).compile()
+            with self._lock:
+                self.misses += 1
+                self._entries[key] = (compilation, items, links)
+                while len(self._entries) > self._max_size:
+                    self._entries.popitem(last=False)
+            return compilation
+        else:
+            compilation, prior_items, prior_links = entry
+            with self._lock:
+                self.hits += 1
+            return self._rebind(compilation,
+                                dict(zip(prior_items, items)),
+                                zip(prior_links, links))
+
+    @staticmethod
+    def _rebind(compilation, item_mapping, link_pairs):
+        replacements = {}
+        for prior_attr_dict, attr_dict in link_pairs:
+            for key, prior_value in six.iteritems(prior_attr_dict):
+                value = attr_dict[key]
+                if value is not prior_value:
+                    replacements[id(prior_value)] = value
+        prior_graph = compilation.execution_graph
+        for node in prior_graph.nodes_iter():
+            if isinstance(node, Terminator):
+                item_mapping[node] = Terminator(item_mapping[node.flow])
+
+        def rebind_attrs(attr_dict):
+            n_attr_dict = {}
+            for key, value in six.iteritems(attr_dict):
+                try:
+                    n_attr_dict[key] = item_mapping[value]
+                except (KeyError, TypeError):
+                    n_attr_dict[key] = replacements.get(id(value), value)
+            return n_attr_dict
+
+        graph = prior_graph.__class__(name=prior_graph.name)
+        for node, node_data in prior_graph.nodes_iter(data=True):
+            graph.add_node(item_mapping[node],
+                           attr_dict=rebind_attrs(node_data))
+        for u, v, u_v_data in prior_graph.edges_iter(data=True):
+            graph.add_edge(item_mapping[u], item_mapping[v],
+                           attr_dict=rebind_attrs(u_v_data))
+
+        def rebind_node(prior_node):
+            node = tr.Node(item_mapping[prior_node.item],
+                           **prior_node.metadata)
+            for prior_child in prior_node:
+                node.add(rebind_node(prior_child))
+            return node
+
+        hierarchy = rebind_node(compilation.hierarchy)
+        graph.freeze()
+        hierarchy.freeze()
+        return Compilation(graph, hierarchy)
@@ -29,6 +29,10 @@ from zag import states as st
 
 LOG = logging.getLogger(__name__)
 
+# Reason given when running atoms are asked to stop early because some other
+# atom failed (see the ``cancel_on_failure`` engine option).
+CANCELLED_ON_FAILURE = 'failure'
+
 
 @six.add_metaclass(abc.ABCMeta)
 class Strategy(object):
@@ -111,6 +115,8 @@ class Completer(object):
             self._runtime.options.get('defer_reverts', False))
         self._resolve = not strutils.bool_from_string(
             self._runtime.options.get('never_resolve', False))
+        self._cancel_on_failure = strutils.bool_from_string(
+            self._runtime.options.get('cancel_on_failure', False))
 
     def resume(self):
         """Resumes atoms in the contained graph.
@@ -153,7 +159,16 @@ class Completer(object):
         failures or whether this should not be done.
         """
         if outcome == ex.EXECUTED and self._resolve:
-            self._process_atom_failure(node, failure)
+            if (node.cancelled and
+                    node.cancellation.reason == CANCELLED_ON_FAILURE):
+                # This atom was asked to stop early because of some other
+                # atoms failure (which is already being resolved), so there
+                # is nothing more to resolve here; atoms cancelled for other
+                # reasons (for example because they timed out) still are.
+                LOG.debug("Atom '%s' failed after its cancellation was"
+                          " requested (skipping resolving it)", node)
+            else:
+                self._process_atom_failure(node, failure)
             # We resolved something, carry on...
             return False
         else:
@@ -222,3 +237,17 @@ class Completer(object):
         else:
             LOG.debug("Modified/tweaked %s nodes while applying"
                       " resolver '%s'", len(tweaked), resolver)
+        if self._cancel_on_failure:
+            self._cancel_running(atom for atom, _state, _intention in tweaked)
+
+    def _cancel_running(self, atoms):
+        """Requests that any of the given atoms that are running stop early."""
+        atoms = list(atoms)
+        atom_states = self._storage.get_atoms_states(atom.name
+                                                     for atom in atoms)
+        for atom in atoms:
+            atom_state, _atom_intention = atom_states[atom.name]
+            if atom_state == st.RUNNING and not atom.cancelled:
+                LOG.debug("Requesting that running atom '%s' stop early",
+                          atom)
+                atom.cancellation.request(reason=CANCELLED_ON_FAILURE)
@@ -22,6 +22,7 @@ import threading
 from automaton import runners
 from concurrent import futures
 import fasteners
+import futurist
 import networkx as nx
 from oslo_utils import excutils
 from oslo_utils import strutils
@@ -39,6 +40,7 @@ from zag import logging
 from zag import states
 from zag import storage
 from zag.types import failure
+from zag.types import notifier
 from zag.utils import misc
 
 LOG = logging.getLogger(__name__)
@@ -101,46 +103,223 @@ class ActionEngine(base.Engine):
 
     **Engine options:**
 
-    +----------------------+-----------------------+------+------------+
-    | Name/key             | Description           | Type | Default    |
-    +======================+=======================+======+============+
-    | ``defer_reverts``    | This option lets you  | bool | ``False``  |
-    |                      | safely nest flows     |      |            |
-    |                      | with retries inside   |      |            |
-    |                      | flows without retries |      |            |
-    |                      | and it still behaves  |      |            |
-    |                      | as a user would       |      |            |
-    |                      | expect (for example   |      |            |
-    |                      | if the retry gets     |      |            |
-    |                      | exhausted it reverts  |      |            |
-    |                      | the outer flow unless |      |            |
-    |                      | the outer flow has a  |      |            |
-    |                      | has a separate retry  |      |            |
-    |                      | behavior).            |      |            |
-    +----------------------+-----------------------+------+------------+
-    | ``never_resolve``    | When true, instead    | bool | ``False``  |
-    |                      | of reverting          |      |            |
-    |                      | and trying to resolve |      |            |
-    |                      | a atom failure the    |      |            |
-    |                      | engine will skip      |      |            |
-    |                      | reverting and abort   |      |            |
-    |                      | instead of reverting  |      |            |
-    |                      | and/or retrying.      |      |            |
-    +----------------------+-----------------------+------+------------+
-    | ``inject_transient`` | When true, values     | bool | ``True``   |
-    |                      | that are local to     |      |            |
-    |                      | each atoms scope      |      |            |
-    |                      | are injected into     |      |            |
-    |                      | storage into a        |      |            |
-    |                      | transient location    |      |            |
-    |                      | (typically a local    |      |            |
-    |                      | dictionary), when     |      |            |
-    |                      | false those values    |      |            |
-    |                      | are instead persisted |      |            |
-    |                      | into atom details     |      |            |
-    |                      | (and saved in a non-  |      |            |
-    |                      | transient manner).    |      |            |
-    +----------------------+-----------------------+------+------------+
+    +----------------------+-----------------------+------+-------------------+
+    | Name/key             | Description           | Type | Default           |
+    +======================+=======================+======+===================+
+    | ``defer_reverts``    | This option lets you  | bool | ``False``         |
+    |                      | safely nest flows     |      |                   |
+    |                      | with retries inside   |      |                   |
+    |                      | flows without retries |      |                   |
+    |                      | and it still behaves  |      |                   |
+    |                      | as a user would       |      |                   |
+    |                      | expect (for example   |      |                   |
+    |                      | if the retry gets     |      |                   |
+    |                      | exhausted it reverts  |      |                   |
+    |                      | the outer flow unless |      |                   |
+    |                      | the outer flow has a  |      |                   |
+    |                      | has a separate retry  |      |                   |
+    |                      | behavior).            |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``never_resolve``    | When true, instead    | bool | ``False``         |
+    |                      | of reverting          |      |                   |
+    |                      | and trying to resolve |      |                   |
+    |                      | a atom failure the    |      |                   |
+    |                      | engine will skip      |      |                   |
+    |                      | reverting and abort   |      |                   |
+    |                      | instead of reverting  |      |                   |
+    |                      | and/or retrying.      |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``inject_transient`` | When true, values     | bool | ``True``          |
+    |                      | that are local to     |      |                   |
+    |                      | each atoms scope      |      |                   |
+    |                      | are injected into     |      |                   |
+    |                      | storage into a        |      |                   |
+    |                      | transient location    |      |                   |
+    |                      | (typically a local    |      |                   |
+    |                      | dictionary), when     |      |                   |
+    |                      | false those values    |      |                   |
+    |                      | are instead persisted |      |                   |
+    |                      | into atom details     |      |                   |
+    |                      | (and saved in a non-  |      |                   |
+    |                      | transient manner).    |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``flush_policy``     | When atom state       | str  | ``'immediately'`` |
+    |                      | changes are saved to  |      |                   |
+    |                      | the backend; one of   |      |                   |
+    |                      | ``'immediately'``,    |      |                   |
+    |                      | ``'per_cycle'`` (once |      |                   |
+    |                      | per engine cycle) or  |      |                   |
+    |                      | ``'on_flow_state'``   |      |                   |
+    |                      | (only when the flow   |      |                   |
+    |                      | changes state), all   |      |                   |
+    |                      | changes are always    |      |                   |
+    |                      | saved before the      |      |                   |
+    |                      | engine stops running. |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``compilation_cache``| A compilation cache   | obj  | ``None``          |
+    |                      | object that flow      |      |                   |
+    |                      | compilations are      |      |                   |
+    |                      | taken from (and added |      |                   |
+    |                      | to), it can be shared |      |                   |
+    |                      | between many engines  |      |                   |
+    |                      | whose flows have the  |      |                   |
+    |                      | same structure (see   |      |                   |
+    |                      | ``CompilationCache``  |      |                   |
+    |                      | in the compiler       |      |                   |
+    |                      | module).              |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``resource_limits``  | A dictionary of       | dict | ``None``          |
+    |                      | resource tag to how   |      |                   |
+    |                      | much of that resource |      |                   |
+    |                      | the active atoms can  |      |                   |
+    |                      | use at the same time  |      |                   |
+    |                      | (atoms declare what   |      |                   |
+    |                      | they use via their    |      |                   |
+    |                      | ``resources``), atoms |      |                   |
+    |                      | that would go over a  |      |                   |
+    |                      | limit wait until some |      |                   |
+    |                      | of it is freed up.    |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``scheduling_policy``| The order atoms that  | str  | ``'priority'``    |
+    |                      | are ready at the same |      |                   |
+    |                      | time are scheduled    |      |                   |
+    |                      | in; ``'priority'``    |      |                   |
+    |                      | (by atom priority) or |      |                   |
+    |                      | ``'critical_path'``   |      |                   |
+    |                      | (by atom priority and |      |                   |
+    |                      | then by the estimated |      |                   |
+    |                      | duration of the       |      |                   |
+    |                      | longest path from the |      |                   |
+    |                      | atom to the end of    |      |                   |
+    |                      | the flow).            |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``duration_history`` | A duration history    | obj  | ``None``          |
+    |                      | object (see           |      |                   |
+    |                      | ``DurationHistory``   |      |                   |
+    |                      | in the scheduler      |      |                   |
+    |                      | module) that the      |      |                   |
+    |                      | ``'critical_path'``   |      |                   |
+    |                      | policy estimates atom |      |                   |
+    |                      | durations from (and   |      |                   |
+    |                      | records them to), it  |      |                   |
+    |                      | can be shared between |      |                   |
+    |                      | many engines.         |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``cancel_on_failure``| When true, and an     | bool | ``False``         |
+    |                      | atom fails, the atoms |      |                   |
+    |                      | affected by that      |      |                   |
+    |                      | failure (typically    |      |                   |
+    |                      | those under the same  |      |                   |
+    |                      | retry controller)     |      |                   |
+    |                      | that are running are  |      |                   |
+    |                      | asked to stop early   |      |                   |
+    |                      | (via their            |      |                   |
+    |                      | ``cancellation``      |      |                   |
+    |                      | token) so that        |      |                   |
+    |                      | reverting can start   |      |                   |
+    |                      | sooner.               |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``result_cache``     | A result cache object | obj  | ``None``          |
+    |                      | (see the              |      |                   |
+    |                      | ``result_cache``      |      |                   |
+    |                      | module) that results  |      |                   |
+    |                      | of ``cacheable``      |      |                   |
+    |                      | tasks are looked up   |      |                   |
+    |                      | in before they are    |      |                   |
+    |                      | executed (and saved   |      |                   |
+    |                      | to after they         |      |                   |
+    |                      | succeed), it can be   |      |                   |
+    |                      | shared between many   |      |                   |
+    |                      | engines.              |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``blob_store``       | A blob store object   | obj  | ``None``          |
+    |                      | (see the ``blobs``    |      |                   |
+    |                      | persistence module)   |      |                   |
+    |                      | that large task       |      |                   |
+    |                      | results are saved in  |      |                   |
+    |                      | (atom details then    |      |                   |
+    |                      | only contain a        |      |                   |
+    |                      | reference to them).   |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``blob_threshold``   | How big (in bytes) a  | int  | ``1048576``       |
+    |                      | task result must be   |      |                   |
+    |                      | (once serialized) to  |      |                   |
+    |                      | be saved in the blob  |      |                   |
+    |                      | store.                |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``event_dispatcher`` | A dispatcher (a       | obj  | ``None``          |
+    |                      | ``Dispatcher`` from   |      |                   |
+    |                      | the notifier module)  |      |                   |
+    |                      | that calls the engine |      |                   |
+    |                      | and atom notifier     |      |                   |
+    |                      | listeners from its    |      |                   |
+    |                      | own thread, so that   |      |                   |
+    |                      | slow listeners do not |      |                   |
+    |                      | slow down the engine  |      |                   |
+    |                      | (it waits for all     |      |                   |
+    |                      | calls to be made      |      |                   |
+    |                      | before a run ends).   |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``atom_timings``     | When true (and        | bool | ``False``         |
+    |                      | statistics are being  |      |                   |
+    |                      | gathered) when each   |      |                   |
+    |                      | atom became ready,    |      |                   |
+    |                      | was scheduled,        |      |                   |
+    |                      | started, finished and |      |                   |
+    |                      | was saved is stored   |      |                   |
+    |                      | in its metadata       |      |                   |
+    |                      | (under ``timings``).  |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``profile_atoms``    | A list of ``fnmatch`` | list | ``None``          |
+    |                      | style patterns, the   |      |                   |
+    |                      | tasks whose name      |      |                   |
+    |                      | matches are ran under |      |                   |
+    |                      | ``cProfile`` (where   |      |                   |
+    |                      | the executor runs     |      |                   |
+    |                      | them) and what was    |      |                   |
+    |                      | collected is saved in |      |                   |
+    |                      | their metadata (see   |      |                   |
+    |                      | ``get_atom_profile``  |      |                   |
+    |                      | of storage).          |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``profile_rate``     | The fraction (between | float| ``1.0``           |
+    |                      | zero and one) of the  |      |                   |
+    |                      | runs of matching      |      |                   |
+    |                      | tasks that are        |      |                   |
+    |                      | (randomly picked to   |      |                   |
+    |                      | be) profiled.         |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``release_results``  | When true the results | bool | ``False``         |
+    |                      | of tasks are moved    |      |                   |
+    |                      | into the blob store   |      |                   |
+    |                      | (which must be given) |      |                   |
+    |                      | as soon as every atom |      |                   |
+    |                      | that consumes them    |      |                   |
+    |                      | has finished (tasks   |      |                   |
+    |                      | under a retry are     |      |                   |
+    |                      | left alone).          |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``release_threshold``| How big (in bytes) a  | int  | ``65536``         |
+    |                      | task result must be   |      |                   |
+    |                      | (once serialized) to  |      |                   |
+    |                      | be released (smaller  |      |                   |
+    |                      | ones are kept in      |      |                   |
+    |                      | memory).              |      |                   |
+    +----------------------+-----------------------+------+-------------------+
+    | ``waiting_strategy`` | How the engine waits  | str  | ``'futurist'``    |
+    |                      | for running atoms to  |      |                   |
+    |                      | finish; ``'futurist'``|      |                   |
+    |                      | (with futurist's      |      |                   |
+    |                      | ``wait_for_any``) or  |      |                   |
+    |                      | ``'queue'`` (finished |      |                   |
+    |                      | futures put           |      |                   |
+    |                      | themselves into a     |      |                   |
+    |                      | queue the engine      |      |                   |
+    |                      | waits on), executors  |      |                   |
+    |                      | that need their own   |      |                   |
+    |                      | way of waiting always |      |                   |
+    |                      | use it.               |      |                   |
+    +----------------------+-----------------------+------+-------------------+
     """
 
     NO_RERAISING_STATES = frozenset([states.SUSPENDED, states.SUCCESS])
@@ -182,6 +361,7 @@ class ActionEngine(base.Engine):
         self._gather_statistics = strutils.bool_from_string(
             self._options.get('gather_statistics', True))
         self._statistics = {}
+        self._trace_notifier = notifier.Notifier()
 
     @_pre_check(check_compiled=True,
                 # NOTE(harlowja): We can alter the state of the
@@ -197,6 +377,18 @@ class ActionEngine(base.Engine):
     def statistics(self):
         return self._statistics
 
+    @property
+    def trace_notifier(self):
+        """Notifier of what the engine (internally) is doing while running.
+
+        Listeners registered (before running) receive events when the
+        engines state machine enters and exits its states and as atoms move
+        through the stages of being scheduled (these are meant for tracing
+        and profiling tools, the events and their details are **not** as
+        stable as the ones the other notifiers send).
+        """
+        return self._trace_notifier
+
     @property
     def compilation(self):
         """The compilation result.
@@ -229,9 +421,16 @@ class ActionEngine(base.Engine):
                 return self._runtime.fetch_scopes_for(atom_name)
             else:
                 return None
+        flush_policy = self._options.get('flush_policy',
+                                         storage.FLUSH_IMMEDIATELY)
+        blob_threshold = self._options.get('blob_threshold',
+                                           storage.DEFAULT_BLOB_THRESHOLD)
         return storage.Storage(self._flow_detail,
                                backend=self._backend,
-                               scope_fetcher=_scope_fetcher)
+                               scope_fetcher=_scope_fetcher,
+                               flush_policy=flush_policy,
+                               blob_store=self._options.get('blob_store'),
+                               blob_threshold=int(blob_threshold))
 
     def run(self, timeout=None):
         """Runs the engine (or die trying).
@@ -339,6 +538,12 @@ class ActionEngine(base.Engine):
                                 six.itervalues(r_failures))
                             failure.Failure.reraise_if_any(er_failures)
             finally:
+                # Changing the flow state already saves any buffered atom
+                # changes, but not all exits change it (so just make sure).
+                self.storage.flush()
+                dispatcher = self._options.get('event_dispatcher')
+                if dispatcher is not None:
+                    dispatcher.flush()
                 if w is not None:
                     w.stop()
                     self._statistics['active_for'] = w.elapsed()
@@ -460,13 +665,19 @@ class ActionEngine(base.Engine):
     def compile(self):
         if self._compiled:
             return
-        self._compilation = self._check_compilation(self._compiler.compile())
+        compilation_cache = self._options.get('compilation_cache')
+        if compilation_cache is not None:
+            compilation = compilation_cache.compile(self._flow)
+        else:
+            compilation = self._compiler.compile()
+        self._compilation = self._check_compilation(compilation)
         self._runtime = runtime.Runtime(self._compilation,
                                         self.storage,
                                         self.atom_notifier,
                                         self._task_executor,
                                         self._retry_executor,
-                                        options=self._options)
+                                        options=self._options,
+                                        trace_notifier=self._trace_notifier)
         self._runtime.compile()
         self._compiled = True
 
@@ -507,6 +718,8 @@ Type provided              Executor used
 =========================  ===============================================
 |cft|.ThreadPoolExecutor   :class:`~.executor.ParallelThreadTaskExecutor`
 |cfp|.ProcessPoolExecutor  :class:`~.|pe|.ParallelProcessTaskExecutor`
+|gtpe|                     :class:`~.executor.ParallelThreadTaskExecutor`
+                           (greened version)
 |cf|._base.Executor        :class:`~.executor.ParallelThreadTaskExecutor`
 =========================  ===============================================
 
@@ -544,10 +757,20 @@ String (case insensitive)    Executor used
       polling while a higher number will involve less polling but a slower time
       for an engine to notice a task has completed.
 
+    * ``shared_executor``: a name that, when provided, makes the engine use
+      a executor that is shared (by that name) with all other engines (in
+      the same process) that also use it; it is created by the first engine
+      that runs (with that engine's executor options), is reference counted
+      across engines and is only stopped once it has not been used for
+      ``shared_executor_grace_period`` seconds (defaulting to five). This
+      avoids creating (and for processes forking) a new pool for each engine
+      that is ran, for example for each job a conductor claims.
+
     .. |pe|  replace:: process_executor
     .. |cfp| replace:: concurrent.futures.process
     .. |cft| replace:: concurrent.futures.thread
     .. |cf| replace:: concurrent.futures
+    .. |gtpe| replace:: futurist.GreenThreadPoolExecutor
     """
 
     # One of these types should match when a object (non-string) is provided
@@ -561,6 +784,8 @@ String (case insensitive)    Executor used
                            executor.ParallelThreadTaskExecutor),
         _ExecutorTypeMatch((futures.ProcessPoolExecutor,),
                            process_executor.ParallelProcessTaskExecutor),
+        _ExecutorTypeMatch((futurist.GreenThreadPoolExecutor,),
+                           executor.ParallelGreenThreadTaskExecutor),
         _ExecutorTypeMatch((futures.Executor,),
                            executor.ParallelThreadTaskExecutor),
     ]
@@ -634,4 +859,12 @@ String (case insensitive)    Executor used
                     pass
         except AttributeError:
             pass
+        shared_name = options.get('shared_executor')
+        if shared_name:
+            grace_period = options.get('shared_executor_grace_period')
+            if grace_period is not None:
+                grace_period = float(grace_period)
+            return executor.SharedTaskExecutor(shared_name, executor_cls,
+                                               kwargs,
+                                               grace_period=grace_period)
         return executor_cls(**kwargs)
@@ -15,10 +15,16 @@
 #    under the License.
 
 import abc
+import contextlib
+import threading
+import time
 
 import futurist
+from futurist import waiters
 import six
 
+from zag.engines.action_engine import profiling
+from zag import logging
 from zag import task as ta
 from zag.types import failure
 from zag.types import notifier
@@ -27,6 +33,8 @@ from zag.types import notifier
 EXECUTED = 'executed'
 REVERTED = 'reverted'
 
+LOG = logging.getLogger(__name__)
+
 
 def _execute_retry(retry, arguments):
     try:
@@ -44,38 +52,76 @@ def _revert_retry(retry, arguments):
     return (REVERTED, result)
 
 
-def _execute_task(task, arguments, progress_callback=None):
+def _run_timed(timings, func, *args, **kwargs):
+    # Records when (by the wall clock) the function started and finished
+    # running (the engine uses these to tell apart time spent in the atom
+    # from time spent waiting on the engine or the executor).
+    timings['started'] = time.time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        timings['finished'] = time.time()
+
+
+@contextlib.contextmanager
+def _profiled(task, enabled):
+    # Profiles whatever runs (in this thread) while active and then has the
+    # task notifier send out what was collected (executors that run tasks
+    # elsewhere send it back to the engine like they do for progress).
+    if not enabled:
+        yield
+        return
+    profile = profiling.new_profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Some other profiler is already active (so just skip it).
+        LOG.warning("Unable to profile task '%s'", task, exc_info=True)
+        yield
+        return
+    try:
+        yield
+    finally:
+        profile.disable()
+        task.notifier.notify(ta.EVENT_PROFILED,
+                             {'profile': profiling.dumps(profile)})
+
+
+def _execute_task(task, arguments, progress_callback=None, profile=False):
     with notifier.register_deregister(task.notifier,
                                       ta.EVENT_UPDATE_PROGRESS,
                                       callback=progress_callback):
-        try:
-            task.pre_execute()
-            result = task.execute(**arguments)
-        except Exception:
-            # NOTE(imelnikov): wrap current exception with Failure
-            # object and return it.
-            result = failure.Failure()
-        finally:
-            task.post_execute()
+        with _profiled(task, profile):
+            try:
+                task.pre_execute()
+                result = task.execute(**arguments)
+            except Exception:
+                # NOTE(imelnikov): wrap current exception with Failure
+                # object and return it.
+                result = failure.Failure()
+            finally:
+                task.post_execute()
     return (EXECUTED, result)
 
 
-def _revert_task(task, arguments, result, failures, progress_callback=None):
+def _revert_task(task, arguments, result, failures, progress_callback=None,
+                 profile=False):
     arguments = arguments.copy()
     arguments[ta.REVERT_RESULT] = result
     arguments[ta.REVERT_FLOW_FAILURES] = failures
     with notifier.register_deregister(task.notifier,
                                       ta.EVENT_UPDATE_PROGRESS,
                                       callback=progress_callback):
-        try:
-            task.pre_revert()
-            result = task.revert(**arguments)
-        except Exception:
-            # NOTE(imelnikov): wrap current exception with Failure
-            # object and return it.
-            result = failure.Failure()
-        finally:
-            task.post_revert()
+        with _profiled(task, profile):
+            try:
+                task.pre_revert()
+                result = task.revert(**arguments)
+            except Exception:
+                # NOTE(imelnikov): wrap current exception with Failure
+                # object and return it.
+                result = failure.Failure()
+            finally:
+                task.post_revert()
     return (REVERTED, result)
 
 
@@ -113,18 +159,45 @@ class TaskExecutor(object):
     This class takes task and its arguments and executes or reverts it.
     It encapsulates knowledge on how task should be executed or reverted:
     right now, on separate thread, on another machine, etc.
+
+    The futures returned may have a ``timings`` dictionary attribute that
+    contains the (wall clock) times the task ``started`` and ``finished``
+    running at (when the executor knows them).
+
+    When asked to ``profile`` a task the executor runs it under ``cProfile``
+    and emits what was collected (see :py:mod:`.profiling`) as a
+    ``profiled`` event of the tasks notifier (so that listeners of it, in
+    the engines process, receive it no matter where the task was ran).
+    """
+
+    waiter = None
+    """
+    Function the engine uses to wait on the futures this executor returns
+    (or ``None`` if those futures can be waited on in whichever way the
+    engine ``waiting_strategy`` option picks, which is the typical case).
     """
 
     @abc.abstractmethod
     def execute_task(self, task, task_uuid, arguments,
-                     progress_callback=None):
+                     progress_callback=None, profile=False):
         """Schedules task execution."""
 
     @abc.abstractmethod
     def revert_task(self, task, task_uuid, arguments, result, failures,
-                    progress_callback=None):
+                    progress_callback=None, profile=False):
         """Schedules task reversion."""
 
+    def completed_task(self, task, result):
+        """Returns a future of a task that has already been executed.
+
+        This is used when the result of executing a task is already known
+        (so that the task does not have to be executed again).
+        """
+        fut = futurist.Future()
+        fut.atom = task
+        fut.set_result((EXECUTED, result))
+        return fut
+
     def start(self):
         """Prepare to execute tasks."""
 
@@ -144,19 +217,26 @@ class SerialTaskExecutor(TaskExecutor):
     def stop(self):
         self._executor.shutdown()
 
-    def execute_task(self, task, task_uuid, arguments, progress_callback=None):
-        fut = self._executor.submit(_execute_task,
+    def execute_task(self, task, task_uuid, arguments, progress_callback=None,
+                     profile=False):
+        timings = {}
+        fut = self._executor.submit(_run_timed, timings, _execute_task,
                                     task, arguments,
-                                    progress_callback=progress_callback)
+                                    progress_callback=progress_callback,
+                                    profile=profile)
         fut.atom = task
+        fut.timings = timings
         return fut
 
     def revert_task(self, task, task_uuid, arguments, result, failures,
-                    progress_callback=None):
-        fut = self._executor.submit(_revert_task,
+                    progress_callback=None, profile=False):
+        timings = {}
+        fut = self._executor.submit(_run_timed, timings, _revert_task,
                                     task, arguments, result, failures,
-                                    progress_callback=progress_callback)
+                                    progress_callback=progress_callback,
+                                    profile=profile)
         fut.atom = task
+        fut.timings = timings
         return fut
 
 
@@ -187,18 +267,24 @@ class ParallelTaskExecutor(TaskExecutor):
         """Called when an executor has not been provided to make one."""
 
     def _submit_task(self, func, task, *args, **kwargs):
-        fut = self._executor.submit(func, task, *args, **kwargs)
+        timings = {}
+        fut = self._executor.submit(_run_timed, timings, func,
+                                    task, *args, **kwargs)
         fut.atom = task
+        fut.timings = timings
         return fut
 
-    def execute_task(self, task, task_uuid, arguments, progress_callback=None):
+    def execute_task(self, task, task_uuid, arguments, progress_callback=None,
+                     profile=False):
         return self._submit_task(_execute_task, task, arguments,
-                                 progress_callback=progress_callback)
+                                 progress_callback=progress_callback,
+                                 profile=profile)
 
     def revert_task(self, task, task_uuid, arguments, result, failures,
-                    progress_callback=None):
+                    progress_callback=None, profile=False):
         return self._submit_task(_revert_task, task, arguments, result,
-                                 failures, progress_callback=progress_callback)
+                                 failures, progress_callback=progress_callback,
+                                 profile=profile)
 
     def start(self):
         if self._own_executor:
@@ -230,7 +316,165 @@ class ParallelGreenThreadTaskExecutor(ParallelThreadTaskExecutor):
     does).
     """
 
+    # Green futures finish inside of greenthreads, so waiting on them has to be
+    # done in a green friendly manner (which the futurist waiters know how to
+    # do).
+    waiter = staticmethod(waiters.wait_for_any)
+
     def _create_executor(self, max_workers=None):
         if max_workers is None:
             max_workers = self.DEFAULT_WORKERS
         return futurist.GreenThreadPoolExecutor(max_workers=max_workers)
+
+
+class _SharedEntry(object):
+    def __init__(self, executor):
+        self.executor = executor
+        self.refs = 0
+        self.idle_timer = None
+
+
+class SharedExecutors(object):
+    """Registry of (named) task executors that many engines can share.
+
+    Executors are created (and started) when first acquired, are reference
+    counted across the engines that acquire them and are only stopped once
+    they have not been acquired by anyone for a grace period (so that engines
+    that run one after another, for example engines created by a conductor
+    for each job it claims, do not each have to create a new pool).
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, executor_cls, kwargs):
+        """Acquires the named executor (creating and starting it if needed).
+
+        Raises ``TypeError`` if a executor of a different type has already
+        been created under that name (the options of the acquirer that
+        creates the executor are the ones it is created with).
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                executor = executor_cls(**kwargs)
+                executor.start()
+                entry = _SharedEntry(executor)
+                self._entries[name] = entry
+                LOG.debug("Started shared executor '%s' (%s)", name, executor)
+            elif type(entry.executor) is not executor_cls:
+                raise TypeError("Shared executor '%s' is a %s and not a %s"
+                                % (name, type(entry.executor).__name__,
+                                   executor_cls.__name__))
+            if entry.idle_timer is not None:
+                entry.idle_timer.cancel()
+                entry.idle_timer = None
+            entry.refs += 1
+            return entry.executor
+
+    def release(self, name, grace_period=0):
+        """Releases the named executor (stopping it once it becomes idle)."""
+        with self._lock:
+            entry = self._entries[name]
+            entry.refs -= 1
+            if entry.refs > 0:
+                return
+            if grace_period > 0:
+                entry.idle_timer = threading.Timer(
+                    grace_period, self._stop_idle, args=(name, entry))
+                entry.idle_timer.daemon = True
+                entry.idle_timer.start()
+                return
+            self._entries.pop(name)
+        self._stop(name, entry)
+
+    def _stop_idle(self, name, entry):
+        with self._lock:
+            if self._entries.get(name) is not entry or entry.refs > 0:
+                return
+            self._entries.pop(name)
+        self._stop(name, entry)
+
+    @staticmethod
+    def _stop(name, entry):
+        LOG.debug("Stopping idle shared executor '%s' (%s)", name,
+                  entry.executor)
+        entry.executor.stop()
+
+    def shutdown(self):
+        """Stops all (currently idle) executors (without any grace period)."""
+        with self._lock:
+            idle = [(name, entry)
+                    for name, entry in six.iteritems(self._entries)
+                    if entry.refs == 0]
+            for name, entry in idle:
+                if entry.idle_timer is not None:
+                    entry.idle_timer.cancel()
+                    entry.idle_timer = None
+                self._entries.pop(name)
+        for name, entry in idle:
+            self._stop(name, entry)
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._entries
+
+
+#: The registry that shared task executors (of this process) come from.
+shared_executors = SharedExecutors()
+
+
+class SharedTaskExecutor(TaskExecutor):
+    """Executes tasks using a (named) executor that engines share.
+
+    Starting acquires the shared executor (see :py:class:`.SharedExecutors`)
+    and stopping releases it (it is only really stopped once it has been
+    idle for the grace period).
+    """
+
+    #: Default number of seconds a idle shared executor is kept around for.
+    GRACE_PERIOD = 5.0
+
+    def __init__(self, name, executor_cls, kwargs,
+                 grace_period=None, registry=None):
+        self.name = name
+        self.waiter = executor_cls.waiter
+        self._executor_cls = executor_cls
+        self._kwargs = kwargs
+        if grace_period is None:
+            grace_period = self.GRACE_PERIOD
+        elif grace_period < 0:
+            raise ValueError("Provided grace period must be greater than"
+                             " or equal to zero and not '%s'" % grace_period)
+        self._grace_period = grace_period
+        if registry is None:
+            registry = shared_executors
+        self._registry = registry
+        self._executor = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = self._registry.acquire(
+                self.name, self._executor_cls, self._kwargs)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor = None
+            self._registry.release(self.name,
+                                   grace_period=self._grace_period)
+
+    def execute_task(self, task, task_uuid, arguments, progress_callback=None,
+                     profile=False):
+        return self._executor.execute_task(
+            task, task_uuid, arguments, progress_callback=progress_callback,
+            profile=profile)
+
+    def revert_task(self, task, task_uuid, arguments, result, failures,
+                    progress_callback=None, profile=False):
+        return self._executor.revert_task(
+            task, task_uuid, arguments, result, failures,
+            progress_callback=progress_callback, profile=profile)
+
+    def completed_task(self, task, result):
+        return self._executor.completed_task(task, result)
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import time
+
+from zag import logging
+
+LOG = logging.getLogger(__name__)
+
+#: Atom metadata key the timestamps of an atoms last run are saved under.
+META_TIMINGS = 'timings'
+
+# The (wall clock) timestamps recorded for each atom as it goes through
+# the engine (and its executor).
+READY = 'ready'
+SCHEDULED = 'scheduled'
+STARTED = 'started'
+FINISHED = 'finished'
+PERSISTED = 'persisted'
+
+#: Histograms (kept in the engines statistics) and the timestamps each one
+#: measures the time between.
+LATENCIES = (
+    ('ready_to_scheduled', READY, SCHEDULED),
+    ('scheduled_to_started', SCHEDULED, STARTED),
+    ('started_to_finished', STARTED, FINISHED),
+    ('finished_to_persisted', FINISHED, PERSISTED),
+    ('ready_to_persisted', READY, PERSISTED),
+)
+
+#: Upper bounds (in seconds) of the buckets histograms count values in (a
+#: final bucket counts values greater than the last of these).
+BUCKETS = tuple(base * (10 ** exponent)
+                for exponent in range(-5, 3) for base in (1, 2, 5))
+
+
+class Histogram(object):
+    """Counts (non-negative) values in exponentially sized buckets."""
+
+    def __init__(self, bounds=BUCKETS):
+        self._bounds = tuple(bounds)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def record(self, value):
+        """Adds a value to this histogram."""
+        value = max(0.0, value)
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def mean(self):
+        """The mean of the recorded values (or ``None`` if there are none)."""
+        if not self.count:
+            return None
+        return self.total / self.count
+
+    def percentile(self, percent):
+        """Estimates a percentile (from the buckets values were counted in).
+
+        The upper bound of the bucket the percentile falls in is returned (or
+        the largest value recorded, if that is smaller); ``None`` is returned
+        if nothing has been recorded.
+        """
+        if not self.count:
+            return None
+        wanted = max(1, int(round(self.count * (percent / 100.0))))
+        seen = 0
+        for bound, count in zip(self._bounds, self._counts):
+            seen += count
+            if seen >= wanted:
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def buckets(self):
+        """Returns a list of (upper bound, count) of the non-empty buckets."""
+        bounds = self._bounds + (float('inf'),)
+        return [(bound, count)
+                for bound, count in zip(bounds, self._counts) if count]
+
+    def to_dict(self):
+        """Returns a dictionary summarizing this histogram."""
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.minimum,
+            'max': self.maximum,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': self.buckets(),
+        }
+
+
+class LatencyRecorder(object):
+    """Records when atoms pass through the stages of being ran.
+
+    Each atom gets a (wall clock) timestamp recorded when it became ready,
+    when it was scheduled (submitted to its executor), when it started and
+    finished running (if the future its executor returned has ``timings``
+    of these, otherwise only when the engine found out it finished is known)
+    and when its completion was saved to storage; once it has completed the
+    time between these is added to the histograms in ``histograms``.
+
+    If ``save_timings`` is true the timestamps are also saved into the atoms
+    metadata (under the ``timings`` key).
+    """
+
+    def __init__(self, storage, save_timings=False):
+        self._storage = storage
+        self._save_timings = save_timings
+        self._timings = {}
+        self.histograms = dict((name, Histogram())
+                               for name, _start, _end in LATENCIES)
+
+    def ready(self, atoms):
+        now = time.time()
+        for atom in atoms:
+            self._timings[atom.name] = {READY: now}
+
+    def scheduled(self, futs):
+        now = time.time()
+        for fut in futs:
+            timings = self._timings.setdefault(fut.atom.name, {})
+            timings[SCHEDULED] = now
+
+    def discard(self, atom):
+        self._timings.pop(atom.name, None)
+
+    def completed(self, fut, noticed_at):
+        """Records an atom (whose future finished) completing.
+
+        The ``noticed_at`` timestamp (when the engine found out the atom
+        finished) is used if its executor did not say when it finished.
+        """
+        timings = self._timings.pop(fut.atom.name, {})
+        timings[PERSISTED] = time.time()
+        executor_timings = getattr(fut, 'timings', None)
+        if executor_timings:
+            timings.update(executor_timings)
+        timings.setdefault(FINISHED, noticed_at)
+        for name, start, end in LATENCIES:
+            try:
+                self.histograms[name].record(timings[end] - timings[start])
+            except KeyError:
+                pass
+        if self._save_timings:
+            try:
+                self._storage.update_atom_metadata(fut.atom.name,
+                                                   {META_TIMINGS: timings})
+            except Exception:
+                LOG.warning("Failed saving the timings of atom '%s'",
+                            fut.atom, exc_info=True)
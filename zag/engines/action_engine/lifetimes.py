@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import weakref
+
+import six
+
+from zag.engines.action_engine import compiler as co
+from zag import logging
+from zag import states as st
+from zag import storage
+
+LOG = logging.getLogger(__name__)
+
+
+class ResultReleaser(object):
+    """Releases task results once nothing that will run still needs them.
+
+    When compiled this finds (for each task that provides something) the
+    atoms that consume what it provides (the atoms that require a symbol the
+    task provides and that can see the task in one of their scopes); once
+    the task and all of those consumers have finished executing the task
+    result is moved out of memory into the blob store (where it is still
+    fetched from, when asked for, for example when the task is reverted).
+
+    Tasks (and consumers of them) that are under the control of a retry are
+    left alone (the retry may run them again, which would mean fetching
+    their results back from the blob store every time), and so are results
+    that are smaller (once serialized) than the release threshold.
+    """
+
+    #: States of consumers that no longer need what they consume.
+    DONE_STATES = (st.SUCCESS, st.IGNORE)
+
+    def __init__(self, runtime, threshold=storage.DEFAULT_RELEASE_THRESHOLD):
+        self._runtime = weakref.proxy(runtime)
+        self._storage = runtime.storage
+        self._threshold = threshold
+        self._consumers = {}
+        self._producers = {}
+        self._released = set()
+
+    def compile(self):
+        """Finds the consumers of what each (releasable) task provides."""
+        graph = self._runtime.compilation.execution_graph
+        atoms = list(self._runtime.iterate_nodes(co.ATOMS))
+        providers = {}
+        for atom in atoms:
+            if graph.node[atom]['kind'] != co.TASK:
+                continue
+            for name in atom.provides:
+                providers.setdefault(name, set()).add(atom.name)
+        consumers = {}
+        for names in six.itervalues(providers):
+            for name in names:
+                consumers[name] = set()
+        blocked = set()
+        for atom in atoms:
+            visible = set()
+            for atom_names in self._runtime.fetch_scopes_for(atom.name):
+                visible.update(atom_names)
+            for name in six.itervalues(atom.rebind):
+                for producer in providers.get(name, ()):
+                    if producer not in visible:
+                        continue
+                    consumers[producer].add(atom.name)
+                    if (graph.node[atom]['kind'] == co.RETRY or
+                            self._runtime.find_retry(atom) is not None):
+                        blocked.add(producer)
+        for atom in atoms:
+            if atom.name in consumers and (
+                    self._runtime.find_retry(atom) is not None):
+                blocked.add(atom.name)
+        self._consumers = dict((name, frozenset(names))
+                               for name, names in six.iteritems(consumers)
+                               if name not in blocked)
+        self._producers = {}
+        for producer, names in six.iteritems(self._consumers):
+            for name in names:
+                self._producers.setdefault(name, set()).add(producer)
+        LOG.trace("Compiled result consumers %s (ignoring %s)",
+                  self._consumers, blocked)
+
+    def reset(self):
+        """Forgets what was released (results may have been reset)."""
+        self._released.clear()
+
+    def completed(self, atom):
+        """Releases the results that the (executed) atom was the last user of.
+
+        Returns the names of the tasks whose results were released.
+        """
+        released = []
+        candidates = [atom.name]
+        candidates.extend(self._producers.get(atom.name, ()))
+        for producer in candidates:
+            if producer in self._released:
+                continue
+            try:
+                consumers = self._consumers[producer]
+            except KeyError:
+                continue
+            atom_states = self._storage.get_atoms_states(
+                [producer] + list(consumers))
+            producer_state, _intention = atom_states.pop(producer)
+            if producer_state != st.SUCCESS:
+                continue
+            if all(state in self.DONE_STATES
+                   for (state, _intention) in six.itervalues(atom_states)):
+                self._released.add(producer)
+                if self._storage.release_result(producer,
+                                                threshold=self._threshold):
+                    released.append(producer)
+        return released
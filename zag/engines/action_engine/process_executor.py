@@ -14,32 +14,47 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import asyncore
 import binascii
 import collections
 import errno
 import functools
+import hashlib
 import hmac
 import math
 import os
 import pickle
+import shutil
+import signal
 import socket
 import struct
+import tempfile
+import threading
 import time
+import weakref
 
 import futurist
 from oslo_utils import excutils
+from oslo_utils import importutils
+from oslo_utils import reflection
 import six
 
 from zag.engines.action_engine import executor as base
+from zag.engines.action_engine import shared_buffers
+from zag import exceptions as exc
 from zag import logging
 from zag import task as ta
+from zag.types import failure
 from zag.types import notifier as nt
 from zag.utils import iter_utils
 from zag.utils import misc
 from zag.utils import schema_utils as su
 from zag.utils import threading_utils
 
+try:
+    import selectors
+except ImportError:
+    import selectors2 as selectors
+
 LOG = logging.getLogger(__name__)
 
 # Internal parent <-> child process protocol schema, message constants...
@@ -48,6 +63,7 @@ CHALLENGE = 'identify_yourself'
 CHALLENGE_RESPONSE = 'worker_reporting_in'
 ACK = 'ack'
 EVENT = 'event'
+EVENTS = 'events'
 SCHEMAS = {
     # Basic jsonschemas for verifying that the data we get back and
     # forth from parent <-> child observes at least a basic expected
@@ -67,6 +83,9 @@ SCHEMAS = {
     EVENT: {
         "type": "object",
         "properties": {
+            'target': {
+                "type": "string",
+            },
             'event_type': {
                 "type": "string",
             },
@@ -74,10 +93,26 @@ SCHEMAS = {
                 "type": "number",
             },
         },
-        "required": ['event_type', 'sent_on'],
+        "required": ['target', 'event_type', 'sent_on'],
         "additionalProperties": True,
     },
 }
+SCHEMAS[EVENTS] = {
+    # A batch of events (sent together); when sync is true the sender
+    # waits for a acknowledgement that all of them were dispatched.
+    "type": "object",
+    "properties": {
+        'events': {
+            "type": "array",
+            "items": SCHEMAS[EVENT],
+        },
+        'sync': {
+            "type": "boolean",
+        },
+    },
+    "required": ['events', 'sync'],
+    "additionalProperties": False,
+}
 
 # See http://bugs.python.org/issue1457119 for why this is so complex...
 _DECODE_ENCODE_ERRORS = [pickle.PickleError, TypeError]
@@ -265,7 +300,7 @@ def _create_random_string(desired_length):
 
 
 def _calculate_hmac(auth_key, body):
-    mac = hmac.new(auth_key, body).hexdigest()
+    mac = hmac.new(auth_key, body, digestmod=hashlib.sha256).hexdigest()
     if isinstance(mac, six.text_type):
         mac = mac.encode("ascii")
     return mac
@@ -296,36 +331,57 @@ def _decode_message(auth_key, message, message_mac):
 
 
 class Channel(object):
-    """Object that workers use to communicate back to their creator."""
+    """Connection a child process uses to send events back to its creator.
+
+    A child process keeps a single channel (per creator) that is reused for
+    all the tasks it runs; events are queued and sent in batches (by a
+    background thread) so that emitting an event does not have to wait for
+    it to be sent (or for the creator to acknowledge it).
+    """
 
-    def __init__(self, port, identity, auth_key):
+    #: Maximum number of events sent in a single message.
+    BATCH_SIZE = 64
+
+    #: Maximum time (in seconds) a event waits for others to be sent with.
+    BATCH_DELAY = 0.01
+
+    def __init__(self, address, identity, auth_key):
         self.identity = identity
-        self.port = port
+        self.address = address
         self.auth_key = auth_key
         self.dead = False
+        self.pid = os.getpid()
         self._sent = self._received = 0
         self._socket = None
         self._read_pipe = None
         self._write_pipe = None
+        self._pending = []
+        self._cond = threading.Condition()
+        self._flusher = None
+        self._closed = False
 
     def close(self):
-        if self._socket is not None:
-            self._socket.close()
-            self._socket = None
-            self._read_pipe = None
-            self._write_pipe = None
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+                self._read_pipe = None
+                self._write_pipe = None
 
     def _ensure_connected(self):
         if self._socket is None:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            family, where = self.address
+            s = socket.socket(family, socket.SOCK_STREAM)
             s.setblocking(1)
             try:
-                s.connect(("", self.port))
+                s.connect(where)
             except socket.error as e:
                 with excutils.save_and_reraise_exception():
                     s.close()
                     if e.errno in (errno.ECONNREFUSED, errno.ENOTCONN,
-                                   errno.ECONNRESET):
+                                   errno.ECONNRESET, errno.ENOENT):
                         # Don't bother with further connections...
                         self.dead = True
             read_pipe = s.makefile("rb", 0)
@@ -349,10 +405,6 @@ class Channel(object):
                 self._read_pipe = read_pipe
                 self._write_pipe = write_pipe
 
-    def recv(self):
-        self._ensure_connected()
-        return self._do_recv()
-
     def _do_recv(self, read_pipe=None):
         if read_pipe is None:
             read_pipe = self._read_pipe
@@ -380,57 +432,146 @@ class Channel(object):
     def _do_send(self, pieces, write_pipe=None):
         if write_pipe is None:
             write_pipe = self._write_pipe
-        for piece in pieces:
-            write_pipe.write(piece)
+        write_pipe.write(b"".join(pieces))
         write_pipe.flush()
+        self._sent += 1
 
     def _do_send_and_ack(self, pieces, write_pipe=None, read_pipe=None):
         self._do_send(pieces, write_pipe=write_pipe)
-        self._sent += 1
         msg = self._do_recv(read_pipe=read_pipe)
         su.schema_validate(msg, SCHEMAS[ACK])
         if msg != ACK:
             raise IOError("Failed receiving ack for sent"
-                          " message %s" % self._metrics['sent'])
-
-    def send(self, message):
-        self._ensure_connected()
-        self._do_send_and_ack(_encode_message(self.auth_key, message,
-                                              self.identity))
+                          " message %s" % self._sent)
+
+    def _flush(self, sync=False):
+        # Must be called with the condition held.
+        events, self._pending = self._pending, []
+        if not events and not sync:
+            return
+        if self.dead:
+            return
+        message = {'events': events, 'sync': sync}
+        try:
+            self._ensure_connected()
+            pieces = _encode_message(self.auth_key, message, self.identity)
+            if sync:
+                self._do_send_and_ack(pieces)
+            else:
+                self._do_send(pieces)
+        except Exception:
+            LOG.warning("Failed sending %s events (from child %s), no"
+                        " further events will be sent", len(events),
+                        self.pid, exc_info=True)
+            self.dead = True
+
+    def _run_flusher(self):
+        with self._cond:
+            while not self._closed and not self.dead:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                # Give some time for more events to show up (so that they
+                # can all be sent together).
+                deadline = time.time() + self.BATCH_DELAY
+                while (self._pending and
+                       len(self._pending) < self.BATCH_SIZE and
+                       not self._closed):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                self._flush()
+
+    def send(self, event):
+        """Queues a event to be sent (in the next batch)."""
+        with self._cond:
+            if self.dead or self._closed:
+                return
+            self._pending.append(event)
+            if len(self._pending) >= self.BATCH_SIZE:
+                self._flush()
+            elif len(self._pending) == 1:
+                if self._flusher is None:
+                    self._flusher = threading_utils.daemon_thread(
+                        self._run_flusher)
+                    self._flusher.start()
+                self._cond.notify_all()
+
+    def sync(self):
+        """Sends all queued events and waits for them to be received."""
+        with self._cond:
+            self._flush(sync=True)
+
+
+# Channels of the current (child) process, one per creator it talks with.
+_channels = {}
+_channels_lock = threading.Lock()
+
+
+def _fetch_channel(address, auth_key, create=True):
+    key = (address, auth_key)
+    with _channels_lock:
+        channel = _channels.get(key)
+        if channel is not None and channel.pid != os.getpid():
+            # Inherited from the process we were forked from; not usable.
+            channel = None
+        if channel is None and create:
+            # A new address means the creator restarted its dispatcher (or
+            # the process is now used by another creator), so channels to
+            # the old ones (and their flusher threads) are no longer of use.
+            for stale_key in list(_channels):
+                stale_channel = _channels.pop(stale_key)
+                if stale_channel.pid == os.getpid():
+                    stale_channel.close()
+            channel = Channel(address, _create_random_string(32), auth_key)
+            _channels[key] = channel
+        return channel
 
 
 class EventSender(object):
     """Sends event information from a child worker process to its creator."""
 
-    def __init__(self, channel):
-        self._channel = channel
-        self._pid = None
+    def __init__(self, address, auth_key, target):
+        self._address = address
+        self._auth_key = auth_key
+        self._target = target
 
     def __call__(self, event_type, details):
-        if not self._channel.dead:
-            if self._pid is None:
-                self._pid = os.getpid()
-            message = {
+        channel = _fetch_channel(self._address, self._auth_key)
+        if not channel.dead:
+            event = {
+                'target': self._target,
                 'event_type': event_type,
                 'details': details,
                 'sent_on': time.time(),
             }
-            LOG.trace("Sending %s (from child %s)", message, self._pid)
-            self._channel.send(message)
+            LOG.trace("Sending %s (from child %s)", event, channel.pid)
+            channel.send(event)
 
 
-class DispatcherHandler(asyncore.dispatcher):
-    """Dispatches from a single connection into a target."""
+def _run_and_sync(address, auth_key, func, task, *args, **kwargs):
+    """Runs a task function (in a child) then syncs any events it sent.
+
+    This ensures all the events the task sent have been received (and
+    dispatched) by the creator before the result of the task is.
+    """
+    try:
+        return func(task, *args, **kwargs)
+    finally:
+        channel = _fetch_channel(address, auth_key, create=False)
+        if channel is not None:
+            channel.sync()
+
+
+class DispatcherHandler(object):
+    """Dispatches from a single connection into its targets."""
 
     #: Read/write chunk size.
     CHUNK_SIZE = 8192
 
     def __init__(self, sock, addr, dispatcher):
-        if six.PY2:
-            asyncore.dispatcher.__init__(self, map=dispatcher.map, sock=sock)
-        else:
-            super(DispatcherHandler, self).__init__(map=dispatcher.map,
-                                                    sock=sock)
+        self.socket = sock
         self.blobs_to_write = list(dispatcher.challenge_pieces)
         self.reader = Reader(dispatcher.auth_key, self._dispatch)
         self.targets = dispatcher.targets
@@ -440,9 +581,15 @@ class DispatcherHandler(asyncore.dispatcher):
                                           dispatcher.identity,
                                           reverse=True)
         self.addr = addr
+        self.events = None
+        self._dispatcher = dispatcher
 
-    def handle_close(self):
-        self.close()
+    def fileno(self):
+        return self.socket.fileno()
+
+    def close(self):
+        self._dispatcher.forget(self)
+        self.socket.close()
 
     def writable(self):
         return bool(self.blobs_to_write)
@@ -453,7 +600,16 @@ class DispatcherHandler(asyncore.dispatcher):
         except IndexError:
             pass
         else:
-            sent = self.send(blob[0:self.CHUNK_SIZE])
+            try:
+                sent = self.socket.send(blob[0:self.CHUNK_SIZE])
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    sent = 0
+                else:
+                    LOG.warning("Failed sending to %s", self.addr,
+                                exc_info=True)
+                    self.close()
+                    return
             if sent < len(blob):
                 self.blobs_to_write.append(blob[sent:])
 
@@ -481,92 +637,322 @@ class DispatcherHandler(asyncore.dispatcher):
                                     " challenge sequence" % (self.addr,
                                                              self.tied_to,
                                                              from_who))
-            try:
-                task = self.targets[from_who]
-            except KeyError:
-                raise UnknownSender("Unknown message from %s (%s) not matched"
-                                    " to any known target" % (self.addr,
-                                                              from_who))
             msg = msg_decoder_func()
-            su.schema_validate(msg, SCHEMAS[EVENT])
-            if LOG.isEnabledFor(logging.TRACE):
-                msg_delay = max(0, time.time() - msg['sent_on'])
-                LOG.trace("Dispatching message from %s (%s) (it took %0.3f"
-                          " seconds for it to arrive for processing after"
-                          " being sent)", self.addr, from_who, msg_delay)
-            task.notifier.notify(msg['event_type'], msg.get('details'))
-            self._send_ack()
+            su.schema_validate(msg, SCHEMAS[EVENTS])
+            for event in msg['events']:
+                try:
+                    task = self.targets[event['target']]
+                except KeyError:
+                    LOG.warning("Discarding event from %s (%s) not matched"
+                                " to any known target", self.addr, from_who)
+                    continue
+                if LOG.isEnabledFor(logging.TRACE):
+                    msg_delay = max(0, time.time() - event['sent_on'])
+                    LOG.trace("Dispatching event from %s (%s) (it took"
+                              " %0.3f seconds for it to arrive for"
+                              " processing after being sent)", self.addr,
+                              from_who, msg_delay)
+                task.notifier.notify(event['event_type'],
+                                     event.get('details'))
+            if msg['sync']:
+                self._send_ack()
 
     def handle_read(self):
-        data = self.recv(self.CHUNK_SIZE)
+        try:
+            data = self.socket.recv(self.CHUNK_SIZE)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b''
         if len(data) == 0:
-            self.handle_close()
+            self.close()
         else:
             try:
                 self.reader.feed(data)
             except (IOError, UnknownSender):
                 LOG.warning("Invalid received message", exc_info=True)
-                self.handle_close()
+                self.close()
             except _DECODE_ENCODE_ERRORS:
                 LOG.warning("Badly formatted message", exc_info=True)
-                self.handle_close()
+                self.close()
             except (ValueError, su.ValidationError):
                 LOG.warning("Failed validating message", exc_info=True)
-                self.handle_close()
+                self.close()
             except ChallengeIgnored:
                 LOG.warning("Failed challenge sequence", exc_info=True)
-                self.handle_close()
+                self.close()
 
 
-class Dispatcher(asyncore.dispatcher):
-    """Accepts messages received from child worker processes."""
+class Dispatcher(object):
+    """Accepts messages received from child worker processes.
+
+    Child processes connect (and stay connected) to a unix domain socket (or
+    a local TCP socket where those are not available) that this listens on,
+    all connections are then serviced by a ``selectors`` driven loop
+    (see :py:meth:`.run`) that dispatches the events they send.
+    """
 
     #: See https://docs.python.org/2/library/socket.html#socket.socket.listen
-    MAX_BACKLOG = 5
+    MAX_BACKLOG = 128
 
-    def __init__(self, map, auth_key, identity):
-        if six.PY2:
-            asyncore.dispatcher.__init__(self, map=map)
-        else:
-            super(Dispatcher, self).__init__(map=map)
+    def __init__(self, auth_key, identity):
         self.identity = identity
         self.challenge_pieces = _encode_message(auth_key, CHALLENGE,
                                                 identity, reverse=True)
         self.auth_key = auth_key
         self.targets = {}
-
-    @property
-    def port(self):
-        if self.socket is not None:
-            return self.socket.getsockname()[1]
-        else:
-            return None
+        self.address = None
+        self.socket = None
+        self._selector = None
+        self._handlers = {}
+        self._tmp_dir = None
+        self._closing = False
+        self._running = False
 
     def setup(self):
         self.targets.clear()
-        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.bind(("", 0))
-        LOG.trace("Accepting dispatch requests on port %s", self.port)
-        self.listen(self.MAX_BACKLOG)
+        self._closing = False
+        self._selector = selectors.DefaultSelector()
+        if hasattr(socket, 'AF_UNIX'):
+            self._tmp_dir = tempfile.mkdtemp(prefix='zag-')
+            where = os.path.join(self._tmp_dir, 'dispatch.sock')
+            s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            s.bind(where)
+            self.address = (socket.AF_UNIX, where)
+        else:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(("127.0.0.1", 0))
+            self.address = (socket.AF_INET, s.getsockname())
+        s.listen(self.MAX_BACKLOG)
+        s.setblocking(0)
+        self.socket = s
+        self._selector.register(s, selectors.EVENT_READ, self)
+        LOG.trace("Accepting dispatch requests on %s", self.address[1])
 
-    def writable(self):
-        return False
+    def handle_read(self):
+        try:
+            sock, addr = self.socket.accept()
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        sock.setblocking(0)
+        addr = addr or 'child-%s' % sock.fileno()
+        LOG.trace("Potentially accepted new connection from %s", addr)
+        handler = DispatcherHandler(sock, addr, self)
+        self._handlers[handler] = selectors.EVENT_WRITE
+        self._selector.register(sock, selectors.EVENT_WRITE, handler)
+
+    def forget(self, handler):
+        if self._handlers.pop(handler, None) is not None:
+            self._selector.unregister(handler.socket)
+
+    def _update_interests(self):
+        for handler, events in list(six.iteritems(self._handlers)):
+            wanted = selectors.EVENT_READ
+            if handler.writable():
+                wanted |= selectors.EVENT_WRITE
+            if wanted != events:
+                self._selector.modify(handler.socket, wanted, handler)
+                self._handlers[handler] = wanted
+
+    def run(self, timeout):
+        """Dispatches (until closed) what connected children send."""
+        self._running = True
+        try:
+            while not self._closing:
+                for key, events in self._selector.select(timeout):
+                    handler = key.data
+                    if events & selectors.EVENT_READ:
+                        handler.handle_read()
+                    if (events & selectors.EVENT_WRITE and
+                            handler is not self and
+                            handler in self._handlers):
+                        handler.handle_write()
+                self._update_interests()
+        finally:
+            self._running = False
+            self._cleanup()
+
+    def _cleanup(self):
+        for handler in list(self._handlers):
+            handler.close()
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
 
-    @property
-    def map(self):
-        return self._map
+    def close(self):
+        """Stops dispatching (closing all connections)."""
+        self._closing = True
+        if not self._running:
+            self._cleanup()
 
-    def handle_close(self):
-        if self.socket is not None:
-            self.close()
 
-    def handle_accept(self):
-        pair = self.accept()
-        if pair is not None:
-            sock, addr = pair
-            addr = "%s:%s" % (addr[0], addr[1])
-            LOG.trace("Potentially accepted new connection from %s", addr)
-            DispatcherHandler(sock, addr, self)
+def _on_deadline(signum, frame):
+    raise exc.AtomTimeout("Execution did not finish before its deadline")
+
+
+def _execute_task_with_deadline(deadline, task, arguments,
+                                progress_callback=None, profile=False):
+    """Executes a task (in a child process) until the given deadline.
+
+    The child process is a (shared) pool worker, so it can not just be killed
+    when the task runs for too long (that would break the pool that created
+    it); instead a alarm is set up that interrupts the task (which will then
+    fail with a timeout) so that the worker gets freed up to do something else.
+    """
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        return (base.EXECUTED, failure.Failure.from_exception(
+            exc.AtomTimeout("Execution did not start before its deadline")))
+    try:
+        previous_handler = signal.signal(signal.SIGALRM, _on_deadline)
+    except ValueError:
+        # Not in the main thread (so alarms can not be used).
+        return base._execute_task(task, arguments,
+                                  progress_callback=progress_callback,
+                                  profile=profile)
+    signal.setitimer(signal.ITIMER_REAL, remaining)
+    try:
+        return base._execute_task(task, arguments,
+                                  progress_callback=progress_callback,
+                                  profile=profile)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _run_with_shared_buffers(threshold, prefix, func, task, arguments,
+                             *args, **kwargs):
+    """Runs a task function (in a child process) sharing its big results.
+
+    Big arguments have already been rebuilt (from the shared memory the
+    parent placed them in) by the time this runs; once the task is done with
+    them they are released and any big results are placed in new shared
+    memory segments (that the parent will take over); these are named using
+    the given prefix so that the parent can remove them if it never receives
+    them.
+    """
+    try:
+        outcome, result = func(task, arguments, *args, **kwargs)
+        if not isinstance(result, failure.Failure):
+            result, _buffers = shared_buffers.share_all(result, threshold,
+                                                        owned=True,
+                                                        prefix=prefix)
+        return (outcome, result)
+    finally:
+        shared_buffers.release_attached()
+
+
+#: What a task is sent to children as; the pickled (and listener-free) copy
+#: of the task (its blob) is only sent along when a child may not have it.
+_TaskSpec = collections.namedtuple('_TaskSpec', ['class_path', 'name',
+                                                 'version', 'digest', 'blob'])
+
+# The pickled copies of tasks that children have already received (keyed by
+# their digest); only used (and filled) in child processes.
+_task_cache = collections.OrderedDict()
+
+
+class _SpecMissing(Exception):
+    """Raised (in a child) when sent a task it does not have the blob of."""
+
+
+def _preload(modules):
+    """Imports the given modules (so that tasks do not have to)."""
+    for module in modules:
+        importutils.import_module(module)
+    return os.getpid()
+
+
+def _parse_modules(value):
+    if isinstance(value, six.string_types):
+        value = value.split(",")
+    return [module.strip() for module in value if module.strip()]
+
+
+def _fetch_task(spec, cache_size):
+    try:
+        blob = _task_cache.pop(spec.digest)
+    except KeyError:
+        if spec.blob is None:
+            raise _SpecMissing("Task '%s' (%s, version %s) is not cached"
+                               % (spec.name, spec.class_path, spec.version))
+        blob = spec.blob
+        while len(_task_cache) >= cache_size:
+            _task_cache.popitem(last=False)
+    # (Re)inserted so that it becomes the most recently used one.
+    _task_cache[spec.digest] = blob
+    # Each run gets its own copy, so that nothing a task does to itself
+    # while running is seen by later runs of it.
+    return pickle.loads(blob)
+
+
+def _run_cached_task(cache_size, spec, proxy, func, *args, **kwargs):
+    """Runs a task function (in a child) using its cached copy of the task.
+
+    The task is only sent to (and cached by) a child with its pickled bytes
+    the first time that child runs it; the listeners that proxy its events
+    back to the parent are attached to the copy made for this run.
+    """
+    try:
+        task = _fetch_task(spec, cache_size)
+    except _SpecMissing:
+        # The arguments (possibly rebuilt from shared memory) will be sent
+        # again along with the task, so these ones are not going to be used.
+        shared_buffers.release_attached()
+        raise
+    if not proxy:
+        return func(task, *args, **kwargs)
+    address, auth_key, identity, event_types = proxy
+    sender = EventSender(address, auth_key, identity)
+    for event_type in event_types:
+        task.notifier.register(event_type, sender)
+    return _run_and_sync(address, auth_key, func, task, *args, **kwargs)
+
+
+class _SpecFuture(futurist.Future):
+    """Future of a task that was sent to a child without its blob.
+
+    When the child that got it does not have that task cached the task is
+    sent again (this time along with its blob). Cancelling this future
+    cancels the submission that is currently pending (if it still can be).
+    """
+
+    def __init__(self, submit, spec):
+        super(_SpecFuture, self).__init__()
+        self._submit = submit
+        self._spec = spec
+        self._inner = submit(spec._replace(blob=None))
+        self._inner.add_done_callback(self._on_done)
+
+    def cancel(self):
+        if not self._inner.cancel():
+            return False
+        return super(_SpecFuture, self).cancel()
+
+    def _on_done(self, inner):
+        if inner.cancelled():
+            super(_SpecFuture, self).cancel()
+            return
+        e = inner.exception()
+        if isinstance(e, _SpecMissing):
+            try:
+                self._inner = self._submit(self._spec)
+            except Exception as e:
+                self.set_exception(e)
+            else:
+                self._inner.add_done_callback(self._on_done)
+        elif e is not None:
+            self.set_exception(e)
+        else:
+            self.set_result(inner.result())
 
 
 class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
@@ -579,14 +965,33 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
     particular) are proxied correctly from that external process to the one
     that is alive in the parent process to ensure that callbacks registered in
     the parent are executed on events in the child.
+
+    When a shared memory threshold is provided, arguments (and results) that
+    are ``bytes``, ``bytearray``, ``memoryview`` or numpy arrays of at least
+    that many bytes are passed via shared memory instead of being pickled (the
+    memory used for arguments is released when the future of the task
+    finishes).
+
+    When modules to preload are provided they are imported (in this process, so
+    that forked children inherit them, and in the children) when this executor
+    starts and the children are created right away (instead of on first use),
+    so that the first tasks ran do not pay for that work. When a task cache
+    size is provided each child keeps (up to that many) pickled tasks around,
+    so that a task is only pickled (here) and sent along with what it is to
+    run with when a child may not have it yet (which is only the case once
+    one of the attributes of the task is replaced); each run still gets its
+    own (freshly unpickled) copy of the task.
     """
 
-    #: Default timeout used by asyncore io loop (and eventually select/poll).
+    #: Default timeout used by the dispatching (selectors driven) io loop.
     WAIT_TIMEOUT = 0.01
 
     constructor_options = [
         ('max_workers', lambda v: v if v is None else int(v)),
         ('wait_timeout', lambda v: v if v is None else float(v)),
+        ('shared_memory_threshold', lambda v: v if v is None else int(v)),
+        ('preload_modules', lambda v: v if v is None else _parse_modules(v)),
+        ('task_cache_size', lambda v: v if v is None else int(v)),
     ]
     """
     Optional constructor keyword arguments this executor supports. These will
@@ -596,11 +1001,28 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
     """
 
     def __init__(self, executor=None,
-                 max_workers=None, wait_timeout=None):
+                 max_workers=None, wait_timeout=None,
+                 shared_memory_threshold=None, preload_modules=None,
+                 task_cache_size=None):
         super(ParallelProcessTaskExecutor, self).__init__(
             executor=executor, max_workers=max_workers)
+        if (shared_memory_threshold is not None and
+                shared_memory_threshold <= 0):
+            raise ValueError("Provided shared memory threshold must be"
+                             " greater than zero and not '%s'"
+                             % shared_memory_threshold)
+        self._shared_memory_threshold = shared_memory_threshold
+        if task_cache_size is not None and task_cache_size <= 0:
+            raise ValueError("Provided task cache size must be greater"
+                             " than zero and not '%s'" % task_cache_size)
+        self._task_cache_size = task_cache_size
+        self._specs = weakref.WeakKeyDictionary()
+        self._specs_lock = threading.Lock()
+        if preload_modules is not None:
+            preload_modules = tuple(preload_modules)
+        self._preload_modules = preload_modules
         self._auth_key = _create_random_string(32)
-        self._dispatcher = Dispatcher({}, self._auth_key,
+        self._dispatcher = Dispatcher(self._auth_key,
                                       _create_random_string(32))
         if wait_timeout is None:
             self._wait_timeout = self.WAIT_TIMEOUT
@@ -619,11 +1041,16 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
         if threading_utils.is_alive(self._worker):
             raise RuntimeError("Worker thread must be stopped via stop()"
                                " before starting/restarting")
+        if self._preload_modules is not None:
+            _preload(self._preload_modules)
         super(ParallelProcessTaskExecutor, self).start()
+        if self._preload_modules is not None:
+            # This makes the pool create its children now (they will also
+            # import the modules, in case they were not forked from here).
+            self._executor.submit(_preload, self._preload_modules).result()
         self._dispatcher.setup()
         self._worker = threading_utils.daemon_thread(
-            asyncore.loop, map=self._dispatcher.map,
-            timeout=self._wait_timeout)
+            self._dispatcher.run, self._wait_timeout)
         self._worker.start()
 
     def stop(self):
@@ -633,6 +1060,74 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
             self._worker.join()
             self._worker = None
 
+    def execute_task(self, task, task_uuid, arguments, progress_callback=None,
+                     profile=False):
+        func = base._execute_task
+        if task.timeout is not None and hasattr(signal, 'setitimer'):
+            # Have the child process interrupt the task itself, since the
+            # engine (in this process) can not stop it from running.
+            func = functools.partial(_execute_task_with_deadline,
+                                     time.time() + task.timeout)
+        return self._submit_shared(func, task, arguments,
+                                   progress_callback=progress_callback,
+                                   profile=profile)
+
+    def revert_task(self, task, task_uuid, arguments, result, failures,
+                    progress_callback=None, profile=False):
+        return self._submit_shared(base._revert_task, task, arguments,
+                                   result, failures,
+                                   progress_callback=progress_callback,
+                                   profile=profile)
+
+    def _submit_shared(self, func, task, arguments, *args, **kwargs):
+        threshold = self._shared_memory_threshold
+        if threshold is None or not shared_buffers.SUPPORTED:
+            return self._submit_task(func, task, arguments, *args, **kwargs)
+        arguments, buffers = shared_buffers.share_all(arguments, threshold)
+        prefix = shared_buffers.make_prefix()
+        func = functools.partial(_run_with_shared_buffers, threshold, prefix,
+                                 func)
+
+        def release(fut=None):
+            for buf in buffers:
+                buf.release()
+            # Results the child shared (but that never made it back here,
+            # for example because the pool broke) are removed as well.
+            shared_buffers.remove_all(prefix)
+
+        try:
+            fut = self._submit_task(func, task, arguments, *args, **kwargs)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                release()
+        fut.add_done_callback(release)
+        return fut
+
+    def _fetch_spec(self, task):
+        # Tasks are only pickled again (and so get a new digest) when one of
+        # their attributes was replaced since they were last pickled, so
+        # that children never run a stale copy of a task that was altered
+        # (without its version changing) since it last ran. Returns the spec
+        # and if it is new (in which case no child can have it cached).
+        attrs = vars(task)
+        with self._specs_lock:
+            found = self._specs.get(task)
+        if found is not None:
+            seen_attrs, spec = found
+            if len(seen_attrs) == len(attrs) and all(
+                    k in seen_attrs and seen_attrs[k] is v
+                    for k, v in six.iteritems(attrs)):
+                return (spec, False)
+        seen_attrs = dict(attrs)
+        blob = pickle.dumps(task.copy(retain_listeners=False),
+                            pickle.HIGHEST_PROTOCOL)
+        spec = _TaskSpec(reflection.get_class_name(task), task.name,
+                         misc.get_version_string(task),
+                         hashlib.sha1(blob).hexdigest(), blob)
+        with self._specs_lock:
+            self._specs[task] = (seen_attrs, spec)
+        return (spec, True)
+
     def _submit_task(self, func, task, *args, **kwargs):
         """Submit a function to run the given task (with given args/kwargs).
 
@@ -656,10 +1151,17 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
         any listeners) and then reattach a new set of listeners that will
         now instead of calling the desired listeners just place messages
         for this process (a dispatcher thread that is created in this class)
-        to dispatch to the original task (using a common accepting socket and
-        per task sender socket that is used and associated to know
-        which task to proxy back too, since it is possible that there many
-        be *many* subprocess running at the same time).
+        to dispatch to the original task (using a common accepting socket
+        that each child process keeps a single long-lived connection to; each
+        event sent over it carries a per task target identity that is used to
+        know which task to proxy back too, since it is possible that there
+        many be *many* tasks running in the same child and *many* subprocess
+        running at the same time).
+
+        Events are sent in batches (from a background thread in the child)
+        and once the task function finishes all of its events are flushed and
+        acknowledged (one round-trip per task) so that they are all
+        dispatched before the result of the task is returned.
 
         Once the subprocess task has finished execution, the executor will
         then trigger a callback that will remove the task + target from the
@@ -667,14 +1169,13 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
         task).
         """
         progress_callback = kwargs.pop('progress_callback', None)
-        clone = task.copy(retain_listeners=False)
-        identity = _create_random_string(32)
-        channel = Channel(self._dispatcher.port, identity, self._auth_key)
-
-        def rebind_task():
-            # Creates and binds proxies for all events the task could receive
-            # so that when the clone runs in another process that this task
-            # can receive the same notifications (thus making it look like the
+        identity = _create_random_string(32).decode('ascii')
+        address = self._dispatcher.address
+
+        def find_proxy_event_types():
+            # Finds all events the task could receive, proxies for these are
+            # bound so that when the clone runs in another process that this
+            # task can receive the same notifications (thus making it look like
             # the notifications are transparently happening in this process).
             proxy_event_types = set()
             for (event_type, listeners) in task.notifier.listeners_iter():
@@ -698,16 +1199,18 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
                 # causes more local callback triggering than we want
                 # to actually happen.
                 proxy_event_types = set([nt.Notifier.ANY])
+            return proxy_event_types
+
+        def rebind_task(clone, proxy_event_types):
             if proxy_event_types:
                 # This sender acts as our forwarding proxy target, it
                 # will be sent pickled to the process that will execute
                 # the needed task and it will do the work of using the
                 # channel object to send back messages to this process for
                 # dispatch into the local task.
-                sender = EventSender(channel)
+                sender = EventSender(address, self._auth_key, identity)
                 for event_type in proxy_event_types:
                     clone.notifier.register(event_type, sender)
-            return bool(proxy_event_types)
 
         def register():
             if progress_callback is not None:
@@ -721,11 +1224,37 @@ class ParallelProcessTaskExecutor(base.ParallelTaskExecutor):
                                          progress_callback)
             self._dispatcher.targets.pop(identity, None)
 
-        should_register = rebind_task()
+        proxy_event_types = find_proxy_event_types()
+        should_register = bool(proxy_event_types)
         if should_register:
             register()
+        if self._task_cache_size is not None:
+            # The child binds the proxies itself (to its copy of the task).
+            proxy = None
+            if should_register:
+                proxy = (address, self._auth_key, identity,
+                         tuple(proxy_event_types))
+            spec, is_new = self._fetch_spec(task)
+
+            def submit_spec(spec):
+                return self._executor.submit(
+                    _run_cached_task, self._task_cache_size, spec, proxy,
+                    func, *args, **kwargs)
+
+            if is_new:
+                submit = functools.partial(submit_spec, spec)
+            else:
+                submit = functools.partial(_SpecFuture, submit_spec, spec)
+        else:
+            clone = task.copy(retain_listeners=False)
+            rebind_task(clone, proxy_event_types)
+            if should_register:
+                func = functools.partial(_run_and_sync, address,
+                                         self._auth_key, func)
+            submit = functools.partial(self._executor.submit, func, clone,
+                                       *args, **kwargs)
         try:
-            fut = self._executor.submit(func, clone, *args, **kwargs)
+            fut = submit()
         except RuntimeError:
             with excutils.save_and_reraise_exception():
                 if should_register:
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+import cProfile
+import fnmatch
+import marshal
+import pstats
+import random
+
+import six
+
+
+class _Loaded(object):
+    # What pstats needs to load (already collected) profile statistics.
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def dumps(profile):
+    """Turns what a profiler collected into (ascii) text.
+
+    The text is the base64 encoded ``marshal`` format that ``pstats`` (and
+    :py:meth:`cProfile.Profile.dump_stats`) uses, base64 encoded so that it
+    can be sent (and saved) anywhere json can be.
+    """
+    profile.create_stats()
+    return base64.b64encode(marshal.dumps(profile.stats)).decode('ascii')
+
+
+def loads(data):
+    """Turns text (made by :py:func:`.dumps`) back into ``pstats.Stats``."""
+    if isinstance(data, six.text_type):
+        data = data.encode('ascii')
+    return pstats.Stats(_Loaded(marshal.loads(base64.b64decode(data))))
+
+
+def merge(datas):
+    """Merges many profiles (made by :py:func:`.dumps`) into one.
+
+    Returns ``None`` if there was nothing to merge.
+    """
+    merged = None
+    for data in datas:
+        stats = loads(data)
+        if merged is None:
+            merged = stats
+        else:
+            merged.add(stats)
+    return merged
+
+
+def new_profile():
+    """Makes a new (not yet enabled) profiler."""
+    return cProfile.Profile()
+
+
+class Selector(object):
+    """Selects which atoms are profiled (each time they are ran).
+
+    Atoms whose name matches one of the given (``fnmatch`` style) patterns
+    are profiled; if a ``rate`` (between zero and one) is given, only that
+    fraction of those (randomly picked) are profiled.
+    """
+
+    def __init__(self, patterns, rate=1.0):
+        if isinstance(patterns, six.string_types):
+            patterns = [patterns]
+        if not 0.0 <= rate <= 1.0:
+            raise ValueError("Profiling rate must be greater than or equal"
+                             " to zero and less than or equal to one (not"
+                             " %s)" % rate)
+        self._patterns = tuple(patterns)
+        self._rate = rate
+
+    def wants(self, atom):
+        """Returns if the atom should be profiled (this time it is ran)."""
+        if not any(fnmatch.fnmatchcase(atom.name, pattern)
+                   for pattern in self._patterns):
+            return False
+        return self._rate >= 1.0 or random.random() < self._rate
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+import collections
+import contextlib
+import copy
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from oslo_utils import reflection
+from oslo_utils import timeutils
+import six
+
+from zag import exceptions as exc
+from zag import logging
+from zag.persistence import models
+from zag import states
+
+LOG = logging.getLogger(__name__)
+
+# Namespace the uuids of (persisted) cache entries are generated in.
+_UUID_NAMESPACE = uuid.UUID('0f4a5d2e-6c27-4b8e-9a51-27a34c3e5b1d')
+
+
+def make_key(task, arguments):
+    """Makes the key the result of running the task with the arguments has.
+
+    Tasks of the same class (and version) ran with the same arguments have
+    the same key; if the arguments can not be turned into a key (because
+    they are not json serializable) then ``None`` is returned.
+    """
+    try:
+        blob = json.dumps([reflection.get_class_name(task),
+                           list(task.version), arguments],
+                          sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        return None
+    if isinstance(blob, six.text_type):
+        blob = blob.encode('utf-8')
+    return hashlib.sha256(blob).hexdigest()
+
+
+@six.add_metaclass(abc.ABCMeta)
+class ResultCache(object):
+    """Base class for caches of (previously computed) task results."""
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Gets the result stored under key (raises ``KeyError`` if absent)."""
+
+    @abc.abstractmethod
+    def put(self, key, result):
+        """Stores a result under key."""
+
+    @abc.abstractmethod
+    def statistics(self):
+        """Returns a dictionary of counters about how the cache is doing."""
+
+
+class MemoryCache(ResultCache):
+    """Least recently used (and optionally expiring) in-process cache.
+
+    :param max_size: the maximum number of results kept (the least recently
+                     used ones are evicted to make room for new ones).
+    :param ttl: the number of seconds a result is kept for (or ``None`` to
+                keep results until they are evicted).
+
+    Results are deep copied when stored and when handed out (so that a task
+    altering a result it was given does not alter what is cached).
+    """
+
+    def __init__(self, max_size=1024, ttl=None):
+        if max_size <= 0:
+            raise ValueError("Maximum size must be greater than zero")
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                result, expires_at = self._entries.pop(key)
+            except KeyError:
+                self._counters['misses'] += 1
+                raise
+            if expires_at is not None and expires_at <= timeutils.now():
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                raise KeyError(key)
+            # Re-inserted so that it becomes the most recently used one.
+            self._entries[key] = (result, expires_at)
+            self._counters['hits'] += 1
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        result = copy.deepcopy(result)
+        if self._ttl is not None:
+            expires_at = timeutils.now() + self._ttl
+        else:
+            expires_at = None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (result, expires_at)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def statistics(self):
+        with self._lock:
+            stats = {
+                'size': len(self._entries),
+            }
+            for name in ('hits', 'misses', 'evictions', 'expirations'):
+                stats[name] = self._counters[name]
+            return stats
+
+
+class BackendCache(ResultCache):
+    """Cache that keeps results in a persistence backend (to share them).
+
+    Results are saved as atom details (under a dedicated logbook) so that
+    any engine (in any process) that uses the same backend can use them.
+
+    :param backend: the persistence backend to store results in.
+    :param ttl: the number of seconds a result is usable for (or ``None`` to
+                use results no matter how old they are).
+    """
+
+    #: Name (and basis of the uuid) of the logbook results are kept in.
+    BOOK_NAME = 'zag-result-cache'
+
+    def __init__(self, backend, ttl=None):
+        self._backend = backend
+        self._ttl = ttl
+        self._book_uuid = str(uuid.uuid5(_UUID_NAMESPACE, self.BOOK_NAME))
+        self._flow_uuid = str(uuid.uuid5(_UUID_NAMESPACE,
+                                         self.BOOK_NAME + '.results'))
+        self._ready = False
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+
+    def _ensure_book(self, conn):
+        if self._ready:
+            return
+        try:
+            conn.get_logbook(self._book_uuid, lazy=True)
+        except exc.NotFound:
+            book = models.LogBook(self.BOOK_NAME, uuid=self._book_uuid)
+            book.add(models.FlowDetail(self.BOOK_NAME, self._flow_uuid))
+            conn.save_logbook(book)
+        self._ready = True
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key):
+        ad_uuid = str(uuid.uuid5(_UUID_NAMESPACE, key))
+        try:
+            with contextlib.closing(self._backend.get_connection()) as conn:
+                ad = conn.get_atom_details(ad_uuid)
+        except exc.NotFound:
+            self._count('misses')
+            raise KeyError(key)
+        except exc.StorageFailure:
+            LOG.warning("Failed looking up cached result '%s'", key,
+                        exc_info=True)
+            self._count('misses')
+            raise KeyError(key)
+        if self._ttl is not None:
+            cached_at = ad.meta.get('cached_at', 0)
+            if cached_at + self._ttl <= time.time():
+                self._count('expirations')
+                self._count('misses')
+                raise KeyError(key)
+        self._count('hits')
+        return ad.results
+
+    def put(self, key, result):
+        ad = models.TaskDetail(key, str(uuid.uuid5(_UUID_NAMESPACE, key)))
+        ad.state = states.SUCCESS
+        ad.results = result
+        ad.meta['cached_at'] = time.time()
+        try:
+            with contextlib.closing(self._backend.get_connection()) as conn:
+                self._ensure_book(conn)
+                try:
+                    conn.update_atom_details(ad)
+                except exc.NotFound:
+                    # Not cached before, so it has to be added to the flow
+                    # (only this atom detail is sent, the flow itself is not
+                    # rewritten).
+                    fd = models.FlowDetail(self.BOOK_NAME, self._flow_uuid)
+                    fd.add(ad)
+                    conn.update_flow_details(fd)
+        except exc.StorageFailure:
+            LOG.warning("Failed saving cached result '%s'", key,
+                        exc_info=True)
+
+    def statistics(self):
+        with self._lock:
+            stats = {}
+            for name in ('hits', 'misses', 'expirations'):
+                stats[name] = self._counters[name]
+            return stats
+
+
+class TieredCache(ResultCache):
+    """Cache that looks in each of its tiers (in order) for results.
+
+    Results found in a later tier are copied into the earlier tiers (so that
+    typically a fast in-process cache is checked before a slower but shared
+    one, and the in-process cache fills up from the shared one).
+    """
+
+    def __init__(self, *tiers):
+        if not tiers:
+            raise ValueError("At least one tier must be provided")
+        self._tiers = tiers
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+
+    def get(self, key):
+        for i, tier in enumerate(self._tiers):
+            try:
+                result = tier.get(key)
+            except KeyError:
+                pass
+            else:
+                for earlier_tier in self._tiers[0:i]:
+                    earlier_tier.put(key, result)
+                with self._lock:
+                    self._counters['hits'] += 1
+                return result
+        with self._lock:
+            self._counters['misses'] += 1
+        raise KeyError(key)
+
+    def put(self, key, result):
+        for tier in self._tiers:
+            tier.put(key, result)
+
+    def statistics(self):
+        with self._lock:
+            stats = {
+                'hits': self._counters['hits'],
+                'misses': self._counters['misses'],
+            }
+        stats['evictions'] = sum(tier.statistics().get('evictions', 0)
+                                 for tier in self._tiers)
+        stats['tiers'] = [tier.statistics() for tier in self._tiers]
+        return stats
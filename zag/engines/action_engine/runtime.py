@@ -18,6 +18,7 @@ import collections
 import functools
 
 from futurist import waiters
+from oslo_utils import strutils
 
 from zag import deciders as de
 from zag.engines.action_engine.actions import retry as ra
@@ -25,6 +26,8 @@ from zag.engines.action_engine.actions import task as ta
 from zag.engines.action_engine import builder as bu
 from zag.engines.action_engine import compiler as com
 from zag.engines.action_engine import completer as co
+from zag.engines.action_engine import lifetimes
+from zag.engines.action_engine import profiling
 from zag.engines.action_engine import scheduler as sched
 from zag.engines.action_engine import scopes as sc
 from zag.engines.action_engine import selector as se
@@ -32,6 +35,7 @@ from zag.engines.action_engine import traversal as tr
 from zag import exceptions as exc
 from zag import logging
 from zag import states as st
+from zag import storage
 from zag.utils import misc
 
 from zag.flow import (LINK_DECIDER, LINK_DECIDER_DEPTH)  # noqa
@@ -53,8 +57,9 @@ class Runtime(object):
 
     def __init__(self, compilation, storage, atom_notifier,
                  task_executor, retry_executor,
-                 options=None):
+                 options=None, trace_notifier=None):
         self._atom_notifier = atom_notifier
+        self._trace_notifier = trace_notifier
         self._task_executor = task_executor
         self._retry_executor = retry_executor
         self._storage = storage
@@ -145,6 +150,13 @@ class Runtime(object):
             LOG.trace("Compiled %s metadata for node %s (%s)",
                       metadata, node.name, node_kind)
             self._atom_cache[node.name] = metadata
+        # Build the selectors readiness index now (so that it can start to
+        # track atom state changes, instead of rescanning the graph when
+        # looking for the next atoms to run).
+        self.selector.compile()
+        self.prioritizer.compile()
+        if self.releaser is not None:
+            self.releaser.compile()
         # TODO(harlowja): optimize the different decider depths to avoid
         # repeated full successor searching; this can be done by searching
         # for the widest depth of parent(s), and limiting the search of
@@ -162,13 +174,56 @@ class Runtime(object):
     def options(self):
         return self._options
 
+    @property
+    def trace_notifier(self):
+        return self._trace_notifier
+
     @misc.cachedproperty
     def selector(self):
         return se.Selector(self)
 
+    @misc.cachedproperty
+    def prioritizer(self):
+        policy = self._options.get('scheduling_policy',
+                                   sched.POLICY_PRIORITY)
+        if policy == sched.POLICY_CRITICAL_PATH:
+            return sched.CriticalPathPrioritizer(
+                self, history=self._options.get('duration_history'))
+        elif policy == sched.POLICY_PRIORITY:
+            return sched.Prioritizer(self)
+        else:
+            raise ValueError("Unknown scheduling policy '%s' expected one"
+                             " of %s" % (policy, list(sched.POLICIES)))
+
+    @misc.cachedproperty
+    def releaser(self):
+        release_results = strutils.bool_from_string(
+            self._options.get('release_results', False))
+        if not release_results:
+            return None
+        if self._storage.blob_store is None:
+            raise ValueError("Releasing results requires a blob store (to"
+                             " move the released results into)")
+        release_threshold = self._options.get(
+            'release_threshold', storage.DEFAULT_RELEASE_THRESHOLD)
+        return lifetimes.ResultReleaser(self,
+                                        threshold=int(release_threshold))
+
     @misc.cachedproperty
     def builder(self):
-        return bu.MachineBuilder(self, waiters.wait_for_any)
+        waiter = self._task_executor.waiter
+        if waiter is None:
+            strategy = self._options.get('waiting_strategy',
+                                         bu.WAITING_FUTURIST)
+            if strategy == bu.WAITING_FUTURIST:
+                waiter = waiters.wait_for_any
+            elif strategy != bu.WAITING_QUEUE:
+                raise ValueError("Unknown waiting strategy '%s' expected one"
+                                 " of %s" % (strategy,
+                                             list(bu.WAITING_STRATEGIES)))
+        # No waiter means the builder waits on its own completion queue (that
+        # finished futures put themselves into).
+        return bu.MachineBuilder(self, waiter)
 
     @misc.cachedproperty
     def completer(self):
@@ -194,9 +249,17 @@ class Runtime(object):
 
     @misc.cachedproperty
     def task_action(self):
+        patterns = self._options.get('profile_atoms')
+        if patterns:
+            profile_selector = profiling.Selector(
+                patterns, rate=float(self._options.get('profile_rate', 1.0)))
+        else:
+            profile_selector = None
         return ta.TaskAction(self._storage,
                              self._atom_notifier,
-                             self._task_executor)
+                             self._task_executor,
+                             result_cache=self._options.get('result_cache'),
+                             profile_selector=profile_selector)
 
     def _fetch_atom_metadata_entry(self, atom_name, metadata_key):
         return self._atom_cache[atom_name][metadata_key]
@@ -14,13 +14,281 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import threading
 import weakref
 
+from oslo_utils import timeutils
+import six
+
+from zag.engines.action_engine import builder as bu
+from zag.engines.action_engine import compiler as co
 from zag import exceptions as excp
 from zag import states as st
 from zag.types import failure
 
 
+# Policies that can be used to order the atoms that are ready to be scheduled.
+POLICY_PRIORITY = 'priority'
+POLICY_CRITICAL_PATH = 'critical_path'
+POLICIES = (POLICY_PRIORITY, POLICY_CRITICAL_PATH)
+
+
+class DurationHistory(object):
+    """Keeps track of how long atoms (typically) take to execute.
+
+    An exponentially weighted moving average of the execution duration of
+    each atom (by its name and version) is kept, newer durations being
+    weighted by ``alpha`` (and older ones by ``1 - alpha``). A history object
+    can be shared between engines (via the ``duration_history`` engine option)
+    so that engines running the same (or similar) flows can make use of what
+    the prior engines observed.
+    """
+
+    def __init__(self, alpha=0.3):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("Alpha must be greater than zero and less than"
+                             " or equal to one (not %s)" % alpha)
+        self._alpha = alpha
+        self._averages = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(atom):
+        return (atom.name, atom.version)
+
+    def record(self, atom, duration):
+        """Records how long an atom took to execute."""
+        key = self._key(atom)
+        with self._lock:
+            try:
+                average = self._averages[key]
+            except KeyError:
+                self._averages[key] = duration
+            else:
+                self._averages[key] = (self._alpha * duration +
+                                       (1.0 - self._alpha) * average)
+
+    def estimate(self, atom):
+        """Returns how long an atom is estimated to take (or none)."""
+        with self._lock:
+            return self._averages.get(self._key(atom))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._averages)
+
+
+class Prioritizer(object):
+    """Orders the atoms that are ready to be scheduled by their priority."""
+
+    def __init__(self, runtime):
+        self._runtime = weakref.proxy(runtime)
+
+    def compile(self):
+        """Prepares for prioritizing (called once the runtime is compiled)."""
+
+    def reset(self):
+        """Prepares for prioritizing (called each time the engine runs)."""
+
+    def key(self, atom):
+        """Returns the key to sort an atom by (higher sorts first)."""
+        return getattr(atom, 'priority', 0)
+
+
+class CriticalPathPrioritizer(Prioritizer):
+    """Orders the atoms that are ready to be scheduled by their critical path.
+
+    Atoms are ordered by their priority and then by the (estimated) length of
+    the longest path from the atom to the end of the execution graph (the
+    atoms own duration included), so that when there are more atoms ready
+    than there are workers to run them the atoms that everything else ends
+    up waiting on are ran first.
+
+    Path lengths are computed (each time the engine runs) from a
+    :py:class:`.DurationHistory` that this prioritizer adds the execution
+    durations it observes to; atoms without any history use the
+    ``duration`` an atom detail has in its metadata (which is where the
+    :py:class:`~zag.listeners.timing.DurationListener` saves it) or the
+    average of the known durations (or ``1.0`` if nothing is known).
+    """
+
+    def __init__(self, runtime, history=None):
+        super(CriticalPathPrioritizer, self).__init__(runtime)
+        if history is None:
+            history = DurationHistory()
+        self._history = history
+        self._storage = runtime.storage
+        self._atoms = {}
+        self._watches = {}
+        self._weights = {}
+        self._watching = False
+
+    @property
+    def history(self):
+        """The duration history used to compute the critical paths."""
+        return self._history
+
+    def compile(self):
+        self._atoms = dict((atom.name, atom)
+                           for atom in self._runtime.iterate_nodes(co.ATOMS))
+        # Recompiling only refreshes the atoms, the (single) watcher that
+        # was added the first time keeps recording their durations.
+        if not self._watching:
+            self._storage.add_atom_watcher(self._on_atom_changed)
+            self._watching = True
+
+    def _on_atom_changed(self, atom_name, state, intention):
+        if state == st.RUNNING:
+            self._watches[atom_name] = timeutils.StopWatch().start()
+        elif state in (st.SUCCESS, st.FAILURE):
+            watch = self._watches.pop(atom_name, None)
+            if watch is not None:
+                try:
+                    atom = self._atoms[atom_name]
+                except KeyError:
+                    pass
+                else:
+                    self._history.record(atom, watch.elapsed())
+        else:
+            self._watches.pop(atom_name, None)
+
+    def _estimate_durations(self):
+        durations = {}
+        for atom in six.itervalues(self._atoms):
+            duration = self._history.estimate(atom)
+            if duration is None:
+                duration = self._storage.get_atom_metadata(
+                    atom.name).get('duration')
+                if duration is not None:
+                    self._history.record(atom, duration)
+            durations[atom] = duration
+        known = [d for d in six.itervalues(durations) if d is not None]
+        if known:
+            default = sum(known) / len(known)
+        else:
+            default = 1.0
+        for atom, duration in six.iteritems(durations):
+            if duration is None:
+                durations[atom] = default
+        return durations
+
+    def reset(self):
+        durations = self._estimate_durations()
+        graph = self._runtime.compilation.execution_graph
+        weights = {}
+        for node in reversed(list(graph.topological_sort())):
+            after = [weights[successor]
+                     for successor in graph.successors_iter(node)]
+            longest_after = max(after) if after else 0.0
+            weights[node] = durations.get(node, 0.0) + longest_after
+        self._weights = weights
+
+    def key(self, atom):
+        return (getattr(atom, 'priority', 0), self._weights.get(atom, 0.0))
+
+
+class ResourceLimiter(object):
+    """Limits how much of some resource the atoms that are active can use.
+
+    Atoms declare what they use via their ``resources`` attribute (a
+    dictionary of resource tag to the amount of that resource they use while
+    they are active) and this limiter only lets an atom become active if the
+    amount of each limited resource it uses is still available (resources
+    that do not have a limit are never limited).
+
+    An atom that uses more of a resource than its limit is allowed to become
+    active **only** when nothing else is using that resource (otherwise it
+    would never be able to become active).
+    """
+
+    def __init__(self, limits):
+        self._limits = dict(limits)
+        self._lock = threading.Lock()
+        self._watch = timeutils.StopWatch()
+        self._in_use = {}
+        self._peak = {}
+        self._deferred = {}
+        self._busy = {}
+        self.reset()
+
+    def reset(self):
+        """Resets the gathered statistics (nothing should be active)."""
+        with self._lock:
+            self._in_use = dict((tag, 0) for tag in self._limits)
+            self._peak = dict((tag, 0) for tag in self._limits)
+            self._deferred = dict((tag, 0) for tag in self._limits)
+            self._busy = dict((tag, 0.0) for tag in self._limits)
+            self._last_changed = 0.0
+            self._watch.restart()
+
+    def _wanted(self, atom):
+        resources = getattr(atom, 'resources', None)
+        if not resources:
+            return {}
+        return dict((tag, amount)
+                    for tag, amount in six.iteritems(resources)
+                    if tag in self._limits and amount > 0)
+
+    def _accumulate(self):
+        # Keeps track of how much of each resource has been used over
+        # time (so that a utilization can be computed from it).
+        now = self._watch.elapsed()
+        elapsed = now - self._last_changed
+        if elapsed > 0:
+            for tag, in_use in six.iteritems(self._in_use):
+                self._busy[tag] += in_use * elapsed
+        self._last_changed = now
+
+    def acquire(self, atom):
+        """Reserves the resources an atom uses (if they are available)."""
+        wanted = self._wanted(atom)
+        if not wanted:
+            return True
+        with self._lock:
+            blocked = [tag for tag, amount in six.iteritems(wanted)
+                       if (self._in_use[tag] and
+                           self._in_use[tag] + amount > self._limits[tag])]
+            if blocked:
+                for tag in blocked:
+                    self._deferred[tag] += 1
+                return False
+            self._accumulate()
+            for tag, amount in six.iteritems(wanted):
+                self._in_use[tag] += amount
+                self._peak[tag] = max(self._peak[tag], self._in_use[tag])
+            return True
+
+    def release(self, atom):
+        """Releases the resources an atom reserved."""
+        wanted = self._wanted(atom)
+        if not wanted:
+            return
+        with self._lock:
+            self._accumulate()
+            for tag, amount in six.iteritems(wanted):
+                self._in_use[tag] -= amount
+
+    def statistics(self):
+        """Returns per resource tag usage & utilization statistics."""
+        with self._lock:
+            self._accumulate()
+            elapsed = self._last_changed
+            stats = {}
+            for tag, limit in six.iteritems(self._limits):
+                if elapsed > 0 and limit > 0:
+                    utilization = self._busy[tag] / (limit * elapsed)
+                else:
+                    utilization = 0.0
+                stats[tag] = {
+                    'limit': limit,
+                    'in_use': self._in_use[tag],
+                    'peak': self._peak[tag],
+                    'deferred': self._deferred[tag],
+                    'utilization': utilization,
+                }
+            return stats
+
+
 class RetryScheduler(object):
     """Schedules retry atoms."""
 
@@ -80,6 +348,40 @@ class Scheduler(object):
 
     def __init__(self, runtime):
         self._runtime = weakref.proxy(runtime)
+        limits = runtime.options.get('resource_limits')
+        if limits:
+            self._limiter = ResourceLimiter(limits)
+        else:
+            self._limiter = None
+        # Futures whose atoms are holding (limited) resources.
+        self._holding = set()
+        self._holding_lock = threading.Lock()
+        self._trace_notifier = runtime.trace_notifier
+        self._tracing = False
+
+    def reset(self):
+        """Resets any resource usage statistics (before running)."""
+        if self._limiter is not None:
+            with self._holding_lock:
+                # Anything from a prior run that is still going (because it
+                # was given up on) no longer counts.
+                self._holding.clear()
+            self._limiter.reset()
+        self._tracing = (self._trace_notifier is not None and
+                         len(self._trace_notifier) > 0)
+
+    def _trace(self, atom, stage):
+        self._trace_notifier.notify(bu.TRACE_ATOM_STAGE, {
+            'atom_name': atom.name,
+            'stage': stage,
+            'timestamp': timeutils.now(),
+        })
+
+    def resource_statistics(self):
+        """Returns resource usage statistics (or none if not limited)."""
+        if self._limiter is not None:
+            return self._limiter.statistics()
+        return None
 
     def schedule(self, atoms):
         """Schedules the provided atoms for *future* completion.
@@ -89,15 +391,50 @@ class Scheduler(object):
         purposes). It should also return any failure objects that represented
         scheduling failures that may have occurred during this scheduling
         process.
+
+        Atoms that can not be scheduled yet (because the resources they use
+        are currently all being used by other atoms) are skipped over (and
+        do **not** have a future returned for them).
         """
         futures = set()
+        limiter = self._limiter
         for atom in atoms:
+            if limiter is not None and not limiter.acquire(atom):
+                continue
             scheduler = self._runtime.fetch_scheduler(atom)
+            if self._tracing:
+                self._trace(atom, bu.STAGE_SUBMITTING)
             try:
-                futures.add(scheduler.schedule(atom))
+                fut = scheduler.schedule(atom)
             except Exception:
+                if limiter is not None:
+                    limiter.release(atom)
                 # Immediately stop scheduling future work so that we can
                 # exit execution early (rather than later) if a single atom
                 # fails to schedule correctly.
                 return (futures, [failure.Failure()])
+            else:
+                if self._tracing:
+                    self._trace(atom, bu.STAGE_SCHEDULED)
+                if limiter is not None:
+                    with self._holding_lock:
+                        self._holding.add(fut)
+                    fut.add_done_callback(self.release)
+                futures.add(fut)
         return (futures, [])
+
+    def release(self, fut):
+        """Frees the resources the atom of the given future was using.
+
+        This happens automatically once the future is done; it may also be
+        done before that (for example when the engine stops waiting on the
+        future) in which case the later (automatic) release does nothing.
+        """
+        if self._limiter is None:
+            return
+        with self._holding_lock:
+            try:
+                self._holding.remove(fut)
+            except KeyError:
+                return
+        self._limiter.release(fut.atom)
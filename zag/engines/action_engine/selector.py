@@ -14,12 +14,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import operator
 import weakref
 
 from zag.engines.action_engine import compiler as co
 from zag.engines.action_engine import deciders
-from zag.engines.action_engine import traversal
 from zag import logging
 from zag import states as st
 from zag.utils import iter_utils
@@ -27,6 +27,70 @@ from zag.utils import iter_utils
 LOG = logging.getLogger(__name__)
 
 
+class _ReadinessIndex(object):
+    """Incrementally maintained index of nodes that are no longer blocked.
+
+    A node is considered *done* when its own state is acceptable (as decided
+    by the provided ``is_done`` callback) and all of the nodes that block it
+    are also done (so done-ness is transitive); a node is considered
+    *unblocked* when all of the nodes that block it are done.
+
+    Each node keeps a count of its blockers that are not done, so that when
+    a node changes state only the edges of the nodes whose done-ness actually
+    flips are touched (instead of re-examining all the nodes blocking or
+    blocked by the node that changed).
+    """
+
+    def __init__(self, order, blockers_iter, blocked_iter, is_done):
+        self._order = order
+        self._blockers_iter = blockers_iter
+        self._blocked_iter = blocked_iter
+        self._is_done = is_done
+        self._pending = {}
+        self._done = {}
+        #: Nodes that *may* have become unblocked (or whose own state
+        #: changed while being unblocked) since this was last cleared.
+        self.unblocked = collections.deque()
+
+    def reset(self):
+        """Recalculates the blocked counts and done-ness of all nodes."""
+        self._pending.clear()
+        self._done.clear()
+        self.unblocked.clear()
+        for node in self._order:
+            pending = 0
+            for blocker in self._blockers_iter(node):
+                if not self._done[blocker]:
+                    pending += 1
+            self._pending[node] = pending
+            self._done[node] = not pending and self._is_done(node)
+
+    def is_unblocked(self, node):
+        """Returns if all of the nodes blocking the given node are done."""
+        return not self._pending[node]
+
+    def changed(self, node):
+        """Reacts to the given nodes own state changing."""
+        if not self._pending[node]:
+            self.unblocked.append(node)
+        to_visit = [node]
+        while to_visit:
+            node = to_visit.pop()
+            done = not self._pending[node] and self._is_done(node)
+            if done == self._done[node]:
+                continue
+            self._done[node] = done
+            if done:
+                adjustment = -1
+            else:
+                adjustment = 1
+            for blocked in self._blocked_iter(node):
+                self._pending[blocked] += adjustment
+                if not self._pending[blocked]:
+                    self.unblocked.append(blocked)
+                to_visit.append(blocked)
+
+
 class Selector(object):
     """Selector that uses a compilation and aids in execution processes.
 
@@ -35,12 +99,81 @@ class Selector(object):
     edge relations...) and using this information along with the atom
     state/states stored in storage to provide other useful functionality to
     the rest of the runtime system.
+
+    To avoid having to re-examine every predecessor (or successor) of an
+    atom to determine if it is ready it maintains a readiness index (for
+    both executing and reverting) that is updated as atoms change state, so
+    that finding newly ready atoms only costs time proportional to the edges
+    that those state changes actually touched.
     """
 
+    #: Predecessor states (and intentions) that allow an atom to execute.
+    EXECUTE_OK_STATES = (st.SUCCESS, st.IGNORE)
+    EXECUTE_OK_INTENTIONS = (st.EXECUTE, st.IGNORE)
+
+    #: Successor states that allow an atom to revert.
+    REVERT_OK_STATES = (st.PENDING, st.REVERTED, st.IGNORE)
+
     def __init__(self, runtime):
         self._runtime = weakref.proxy(runtime)
         self._storage = runtime.storage
         self._execution_graph = runtime.compilation.execution_graph
+        self._atoms = {}
+        self._atom_states = {}
+        self._execute_index = None
+        self._revert_index = None
+        self._watching = False
+
+    def compile(self):
+        """Builds the readiness indexes & starts tracking atom changes."""
+        graph = self._execution_graph
+        self._atoms = dict((node.name, node)
+                           for node in self._runtime.iterate_nodes(co.ATOMS))
+        order = list(graph.topological_sort())
+        self._execute_index = _ReadinessIndex(
+            order, graph.predecessors_iter, graph.successors_iter,
+            self._is_execute_done)
+        self._revert_index = _ReadinessIndex(
+            list(reversed(order)), graph.successors_iter,
+            graph.predecessors_iter, self._is_revert_done)
+        # Recompiling only rebuilds the indexes, the (single) watcher that
+        # was added the first time keeps them updated.
+        if not self._watching:
+            self._storage.add_atom_watcher(self._on_atom_changed)
+            self._watching = True
+
+    def refresh(self):
+        """Reloads the readiness indexes from the atom states in storage."""
+        self._atom_states = self._storage.get_atoms_states(self._atoms)
+        self._execute_index.reset()
+        self._revert_index.reset()
+
+    def _is_execute_done(self, node):
+        if self._execution_graph.node[node]['kind'] not in co.ATOMS:
+            # Flow nodes (which have no state) are always done.
+            return True
+        state, intention = self._atom_states[node.name]
+        return (state in self.EXECUTE_OK_STATES and
+                intention in self.EXECUTE_OK_INTENTIONS)
+
+    def _is_revert_done(self, node):
+        if self._execution_graph.node[node]['kind'] not in co.ATOMS:
+            # Flow nodes (which have no state) are always done.
+            return True
+        state, _intention = self._atom_states[node.name]
+        return state in self.REVERT_OK_STATES
+
+    def _on_atom_changed(self, atom_name, state, intention):
+        try:
+            atom = self._atoms[atom_name]
+        except KeyError:
+            return
+        if atom_name not in self._atom_states:
+            # Not yet refreshed (so there is nothing to keep updated).
+            return
+        self._atom_states[atom_name] = (state, intention)
+        self._execute_index.changed(atom)
+        self._revert_index.changed(atom)
 
     def iter_next_atoms(self, atom=None):
         """Iterate next atoms to run (originating from atom or all atoms)."""
@@ -48,8 +181,7 @@ class Selector(object):
             return iter_utils.unique_seen((self._browse_atoms_for_execute(),
                                            self._browse_atoms_for_revert()),
                                           seen_selector=operator.itemgetter(0))
-        state = self._storage.get_atom_state(atom.name)
-        intention = self._storage.get_atom_intention(atom.name)
+        state, intention = self._atom_states[atom.name]
         if state == st.SUCCESS:
             if intention == st.REVERT:
                 return iter([
@@ -66,25 +198,54 @@ class Selector(object):
         else:
             return iter([])
 
+    def is_ready(self, atom):
+        """Checks if an atom (that was found ready earlier) is still ready.
+
+        This does **not** re-apply any deciders (they were applied when the
+        atom was found to be ready); it only checks that the atoms state and
+        intention (and the atoms it depends on) still allow it to proceed.
+        """
+        _state, intention = self._atom_states[atom.name]
+        if intention == st.EXECUTE:
+            is_ready, _late_decider = self._get_maybe_ready_for_execute(atom)
+        else:
+            is_ready, _late_decider = self._get_maybe_ready_for_revert(atom)
+        return is_ready
+
+    def _iter_unblocked(self, index):
+        # Consumes the atoms that *may* have become ready; atoms may be
+        # added to the index while this is being iterated (for example
+        # when deciders ignore atoms), so this must keep on going until
+        # nothing is left.
+        seen = set()
+        unblocked = index.unblocked
+        graph = self._execution_graph
+        while unblocked:
+            node = unblocked.popleft()
+            if node in seen or graph.node[node]['kind'] not in co.ATOMS:
+                continue
+            seen.add(node)
+            yield node
+
     def _browse_atoms_for_execute(self, atom=None):
         """Browse next atoms to execute.
 
         This returns a iterator of atoms that *may* be ready to be
-        executed, if given a specific atom, it will only examine the successors
-        of that atom, otherwise it will examine the whole graph.
+        executed, if given a specific atom, it will only examine the atoms
+        that were unblocked (by that atom or any other state changes since
+        the last examination), otherwise it will examine the whole graph.
         """
         if atom is None:
+            self._execute_index.unblocked.clear()
             atom_it = self._runtime.iterate_nodes(co.ATOMS)
         else:
-            # NOTE(harlowja): the reason this uses breadth first is so that
-            # when deciders are applied that those deciders can be applied
-            # from top levels to lower levels since lower levels *may* be
-            # able to run even if top levels have deciders that decide to
-            # ignore some atoms... (going deeper first would make this
-            # problematic to determine as top levels can have their deciders
-            # applied **after** going deeper).
-            atom_it = traversal.breadth_first_iterate(
-                self._execution_graph, atom, traversal.Direction.FORWARD)
+            # The index is updated as state changes happen and only unblocks
+            # atoms once all of there predecessors have finished; this means
+            # that the deciders of higher levels will always be applied before
+            # lower levels get examined (so lower levels *may* be able to run
+            # even if top levels have deciders that decide to ignore some
+            # atoms...).
+            atom_it = self._iter_unblocked(self._execute_index)
         for atom in atom_it:
             is_ready, late_decider = self._get_maybe_ready_for_execute(atom)
             if is_ready:
@@ -94,40 +255,22 @@ class Selector(object):
         """Browse next atoms to revert.
 
         This returns a iterator of atoms that *may* be ready to be be
-        reverted, if given a specific atom it will only examine the
-        predecessors of that atom, otherwise it will examine the whole
-        graph.
+        reverted, if given a specific atom it will only examine the atoms
+        that were unblocked (by that atom or any other state changes since
+        the last examination), otherwise it will examine the whole graph.
         """
         if atom is None:
+            self._revert_index.unblocked.clear()
             atom_it = self._runtime.iterate_nodes(co.ATOMS)
         else:
-            atom_it = traversal.breadth_first_iterate(
-                self._execution_graph, atom, traversal.Direction.BACKWARD,
-                # Stop at the retry boundary (as retries 'control' there
-                # surronding atoms, and we don't want to back track over
-                # them so that they can correctly affect there associated
-                # atoms); we do though need to jump through all tasks since
-                # if a predecessor Y was ignored and a predecessor Z before Y
-                # was not it should be eligible to now revert...
-                through_retries=False)
+            atom_it = self._iter_unblocked(self._revert_index)
         for atom in atom_it:
             is_ready, late_decider = self._get_maybe_ready_for_revert(atom)
             if is_ready:
                 yield (atom, late_decider)
 
     def _get_maybe_ready(self, atom, transition_to, allowed_intentions,
-                         connected_fetcher, ready_checker,
-                         decider_fetcher, for_what="?"):
-        def iter_connected_states():
-            # Lazily iterate over connected states so that ready checkers
-            # can stop early (vs having to consume and check all the
-            # things...)
-            for atom in connected_fetcher():
-                # TODO(harlowja): make this storage api better, its not
-                # especially clear what the following is doing (mainly
-                # to avoid two calls into storage).
-                atom_states = self._storage.get_atoms_states([atom.name])
-                yield (atom, atom_states[atom.name])
+                         index, decider_fetcher, for_what="?"):
         # NOTE(harlowja): How this works is the following...
         #
         # 1. First check if the current atom can even transition to the
@@ -136,16 +279,14 @@ class Selector(object):
         # 2. Check if the actual atoms intention is in one of the desired/ok
         #    intentions, if it is not there we are still not ready to execute
         #    or revert.
-        # 3. Iterate over (atom, atom_state, atom_intention) for all the
-        #    atoms the 'connected_fetcher' callback yields from underlying
-        #    storage and direct that iterator into the 'ready_checker'
-        #    callback, that callback should then iterate over these entries
-        #    and determine if it is ok to execute or revert.
-        # 4. If (and only if) 'ready_checker' returns true, then
+        # 3. Check with the readiness index if all of the atoms that this
+        #    atom depends on (predecessors for executing and successors for
+        #    reverting) are in states that allow this atom to proceed.
+        # 4. If (and only if) the index says it is unblocked, then
         #    the 'decider_fetcher' callback is called to get a late decider
         #    which can (if it desires) affect this ready result (but does
         #    so right before the atom is about to be scheduled).
-        state = self._storage.get_atom_state(atom.name)
+        state, intention = self._atom_states[atom.name]
         ok_to_transition = self._runtime.check_atom_transition(atom, state,
                                                                transition_to)
         if not ok_to_transition:
@@ -153,70 +294,35 @@ class Selector(object):
                       " transition to %s from its current state %s",
                       atom, for_what, transition_to, state)
             return (False, None)
-        intention = self._storage.get_atom_intention(atom.name)
         if intention not in allowed_intentions:
             LOG.trace("Atom '%s' is not ready to %s since its current"
                       " intention %s is not in allowed intentions %s",
                       atom, for_what, intention, allowed_intentions)
             return (False, None)
-        ok_to_run = ready_checker(iter_connected_states())
-        if not ok_to_run:
+        if not index.is_unblocked(atom):
+            LOG.trace("Unable to begin to %s '%s' since it is still"
+                      " blocked by atoms that have not finished",
+                      for_what, atom)
             return (False, None)
-        else:
-            return (True, decider_fetcher())
+        LOG.trace("Able to let '%s' %s", atom, for_what)
+        return (True, decider_fetcher())
 
     def _get_maybe_ready_for_execute(self, atom):
         """Returns if an atom is *likely* ready to be executed."""
-        def ready_checker(pred_connected_it):
-            for pred in pred_connected_it:
-                pred_atom, (pred_atom_state, pred_atom_intention) = pred
-                if (pred_atom_state in (st.SUCCESS, st.IGNORE) and
-                        pred_atom_intention in (st.EXECUTE, st.IGNORE)):
-                    continue
-                LOG.trace("Unable to begin to execute since predecessor"
-                          " atom '%s' is in state %s with intention %s",
-                          pred_atom, pred_atom_state, pred_atom_intention)
-                return False
-            LOG.trace("Able to let '%s' execute", atom)
-            return True
         decider_fetcher = lambda: \
             deciders.IgnoreDecider(
                 atom, self._runtime.fetch_edge_deciders(atom))
-        connected_fetcher = lambda: \
-            traversal.depth_first_iterate(self._execution_graph, atom,
-                                          # Whether the desired atom
-                                          # can execute is dependent on its
-                                          # predecessors outcomes (thus why
-                                          # we look backwards).
-                                          traversal.Direction.BACKWARD)
         # If this atoms current state is able to be transitioned to RUNNING
         # and its intention is to EXECUTE and all of its predecessors executed
         # successfully or were ignored then this atom is ready to execute.
         LOG.trace("Checking if '%s' is ready to execute", atom)
         return self._get_maybe_ready(atom, st.RUNNING, [st.EXECUTE],
-                                     connected_fetcher, ready_checker,
-                                     decider_fetcher, for_what='execute')
+                                     self._execute_index, decider_fetcher,
+                                     for_what='execute')
 
     def _get_maybe_ready_for_revert(self, atom):
         """Returns if an atom is *likely* ready to be reverted."""
-        def ready_checker(succ_connected_it):
-            for succ in succ_connected_it:
-                succ_atom, (succ_atom_state, _succ_atom_intention) = succ
-                if succ_atom_state not in (st.PENDING, st.REVERTED, st.IGNORE):
-                    LOG.trace("Unable to begin to revert since successor"
-                              " atom '%s' is in state %s", succ_atom,
-                              succ_atom_state)
-                    return False
-            LOG.trace("Able to let '%s' revert", atom)
-            return True
         noop_decider = deciders.NoOpDecider()
-        connected_fetcher = lambda: \
-            traversal.depth_first_iterate(self._execution_graph, atom,
-                                          # Whether the desired atom
-                                          # can revert is dependent on its
-                                          # successors states (thus why we
-                                          # look forwards).
-                                          traversal.Direction.FORWARD)
         decider_fetcher = lambda: noop_decider
         # If this atoms current state is able to be transitioned to REVERTING
         # and its intention is either REVERT or RETRY and all of its
@@ -224,5 +330,5 @@ class Selector(object):
         # to revert.
         LOG.trace("Checking if '%s' is ready to revert", atom)
         return self._get_maybe_ready(atom, st.REVERTING, [st.REVERT, st.RETRY],
-                                     connected_fetcher, ready_checker,
-                                     decider_fetcher, for_what='revert')
+                                     self._revert_index, decider_fetcher,
+                                     for_what='revert')
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Passing of large buffers between processes via shared memory.
+
+Large ``bytes``, ``bytearray``, ``memoryview`` and (numpy) ``ndarray``
+values are copied into shared memory segments (instead of being pickled and
+sent through a pipe); only the name of the segment (and how to rebuild the
+value from it) is then pickled.
+"""
+
+import binascii
+import itertools
+import mmap
+import os
+import sys
+import tempfile
+
+import six
+
+from zag import logging
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing import shared_memory
+except ImportError:
+    resource_tracker = None
+    shared_memory = None
+
+LOG = logging.getLogger(__name__)
+
+#: If buffers can be shared (memory views are needed to do it).
+SUPPORTED = six.PY3
+
+# Where file backed segments are created (when the shared memory module is
+# not available); a memory backed filesystem is preferred if there is one.
+if os.path.isdir('/dev/shm'):
+    _SEGMENT_DIR = '/dev/shm'
+else:
+    _SEGMENT_DIR = tempfile.gettempdir()
+
+# Segments the arguments of the currently running task were rebuilt from
+# (these are only used in child processes).
+_attached = []
+
+# Segments are removed by whichever process ends up being responsible for
+# them (which often is not the one that made or attached to them), so they are
+# kept away from the resource tracker; it would otherwise warn about them
+# having leaked (and try to remove them again) once the process that made or
+# attached to them exits.
+_UNTRACKED_OPTION = sys.version_info >= (3, 13)
+_TRACKED = shared_memory is not None and os.name == 'posix'
+
+# Names of (prefixed) owned segments that were received (and so removed);
+# remembered until :py:func:`.remove_all` is called with their prefix.
+_received = set()
+
+
+class _FileSegment(object):
+    """A shared memory segment backed by a (memory mapped) file."""
+
+    def __init__(self, name, size=None):
+        self.name = name
+        self._path = os.path.join(_SEGMENT_DIR, name)
+        if size is not None:
+            fd = os.open(self._path, os.O_CREAT | os.O_EXCL | os.O_RDWR,
+                         0o600)
+            try:
+                os.ftruncate(fd, size)
+            except Exception:
+                os.close(fd)
+                os.unlink(self._path)
+                raise
+        else:
+            fd = os.open(self._path, os.O_RDWR)
+            size = os.fstat(fd).st_size
+        try:
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.buf = memoryview(self._mmap)
+
+    def close(self):
+        self.buf.release()
+        self._mmap.close()
+
+    def unlink(self):
+        os.unlink(self._path)
+
+
+def _open_shared_memory(**kwargs):
+    if _UNTRACKED_OPTION:
+        return shared_memory.SharedMemory(track=False, **kwargs)
+    segment = shared_memory.SharedMemory(**kwargs)
+    if _TRACKED:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+    return segment
+
+
+def _create_segment(size, name=None):
+    if shared_memory is not None:
+        return _open_shared_memory(name=name, create=True, size=size)
+    if name is None:
+        name = make_prefix()
+    return _FileSegment(name, size=size)
+
+
+def _attach_segment(name):
+    if shared_memory is not None:
+        return _open_shared_memory(name=name)
+    return _FileSegment(name)
+
+
+def _unlink_segment(segment):
+    if _TRACKED and not _UNTRACKED_OPTION:
+        # Unlinking unregisters it (again), which the resource tracker would
+        # complain about if it was not (re)registered first.
+        resource_tracker.register(segment._name, 'shared_memory')
+    segment.unlink()
+
+
+def _close_segment(segment):
+    try:
+        segment.close()
+    except BufferError:
+        # Something still uses the memory (it will be unmapped once that
+        # something goes away).
+        pass
+
+
+def _as_bytes_view(value):
+    # Returns (kind, byte view, metadata to rebuild the value) of values that
+    # can be shared (or none if the value can not be).
+    if isinstance(value, (six.binary_type, bytearray)):
+        return (type(value).__name__, memoryview(value), None)
+    if isinstance(value, memoryview):
+        if not value.contiguous:
+            return None
+        return ('memoryview', value.cast('B'), None)
+    # Only look for arrays if numpy is already in use (if it is not, then
+    # there can not be any numpy arrays to share).
+    numpy = sys.modules.get('numpy')
+    if (numpy is not None and isinstance(value, numpy.ndarray) and
+            not value.dtype.hasobject):
+        array = numpy.ascontiguousarray(value)
+        return ('ndarray', memoryview(array).cast('B'),
+                (array.dtype.str, array.shape))
+    return None
+
+
+def _rebuild(kind, view, meta, copy):
+    if kind == 'bytes':
+        return view.tobytes()
+    elif kind == 'bytearray':
+        return bytearray(view)
+    elif kind == 'memoryview':
+        if copy:
+            return memoryview(bytearray(view))
+        return view
+    else:
+        import numpy
+        dtype, shape = meta
+        array = numpy.frombuffer(view, dtype=dtype).reshape(shape)
+        if copy:
+            array = array.copy()
+        return array
+
+
+def _materialize(kind, name, size, meta, owned, tracked=False):
+    segment = _attach_segment(name)
+    view = segment.buf[0:size]
+    if not owned:
+        # The creator of the segment will remove it (once it knows it is no
+        # longer used); so just use it as is (without copying it).
+        _attached.append(segment)
+        return _rebuild(kind, view, meta, False)
+    # Nothing else will use this segment (its creator is gone) so copy the
+    # value out of it and remove it.
+    try:
+        return _rebuild(kind, view, meta, True)
+    finally:
+        view.release()
+        _close_segment(segment)
+        _unlink_segment(segment)
+        if tracked:
+            _received.add(name)
+
+
+class SharedBuffer(object):
+    """A value that has been placed in a shared memory segment.
+
+    When pickled only the segment name is sent; when unpickled (in the other
+    process) the value is rebuilt from the segment. If the segment is
+    ``owned`` the receiver becomes its owner and removes it after copying
+    the value out, otherwise the receiver uses the memory directly (without
+    copying) and the creator removes it (see :py:meth:`.release`) once the
+    receiver is done with it.
+    """
+
+    def __init__(self, kind, segment, size, meta=None, owned=False,
+                 tracked=False):
+        self.kind = kind
+        self.name = segment.name
+        self.size = size
+        self.meta = meta
+        self.owned = owned
+        self.tracked = tracked
+        if owned:
+            self._segment = None
+            _close_segment(segment)
+        else:
+            self._segment = segment
+
+    def release(self):
+        """Removes the segment (if this process is responsible for it)."""
+        if self._segment is not None:
+            segment, self._segment = self._segment, None
+            _close_segment(segment)
+            try:
+                _unlink_segment(segment)
+            except OSError:
+                LOG.warning("Failed removing shared memory segment '%s'",
+                            segment.name, exc_info=True)
+
+    def __reduce__(self):
+        return (_materialize,
+                (self.kind, self.name, self.size, self.meta, self.owned,
+                 self.tracked))
+
+
+def make_prefix():
+    """Makes a (random) prefix that segment names can be made from."""
+    return 'zag-%s' % binascii.hexlify(os.urandom(8)).decode('ascii')
+
+
+def share(value, threshold, owned=False, name=None):
+    """Returns a shared buffer for the value (if it is big enough)."""
+    if not SUPPORTED:
+        return value
+    found = _as_bytes_view(value)
+    if found is None:
+        return value
+    kind, view, meta = found
+    if view.nbytes < threshold:
+        return value
+    segment = _create_segment(view.nbytes, name=name)
+    try:
+        segment.buf[0:view.nbytes] = view
+    except Exception:
+        _close_segment(segment)
+        _unlink_segment(segment)
+        raise
+    return SharedBuffer(kind, segment, view.nbytes, meta=meta, owned=owned,
+                        tracked=name is not None)
+
+
+def share_all(values, threshold, owned=False, prefix=None):
+    """Shares the big enough values contained in a dict, list or tuple.
+
+    Returns the new container and the shared buffers that were created. If
+    a prefix is provided the segments are named ``<prefix>-0``,
+    ``<prefix>-1`` (and so on) so that they can be found (and removed, see
+    :py:func:`.remove_all`) by a process that never receives them.
+    """
+    buffers = []
+
+    def maybe_share(value):
+        if prefix is not None:
+            name = '%s-%s' % (prefix, len(buffers))
+        else:
+            name = None
+        shared = share(value, threshold, owned=owned, name=name)
+        if shared is not value:
+            buffers.append(shared)
+        return shared
+
+    if isinstance(values, dict):
+        values = dict((k, maybe_share(v)) for k, v in six.iteritems(values))
+    elif isinstance(values, list):
+        values = [maybe_share(v) for v in values]
+    elif type(values) is tuple:
+        values = tuple(maybe_share(v) for v in values)
+    else:
+        values = maybe_share(values)
+    return (values, buffers)
+
+
+def remove_all(prefix):
+    """Removes the segments :py:func:`.share_all` made with a prefix.
+
+    Returns how many segments were removed (segments that were received,
+    and so already removed by their receiver, are not counted).
+    """
+    removed = 0
+    for i in itertools.count():
+        name = '%s-%s' % (prefix, i)
+        if name in _received:
+            _received.discard(name)
+            continue
+        try:
+            segment = _attach_segment(name)
+        except (OSError, ValueError):
+            # Segments are made one after the other, so none come after
+            # the first one that is missing (and was not received).
+            break
+        _close_segment(segment)
+        try:
+            _unlink_segment(segment)
+        except OSError:
+            LOG.warning("Failed removing shared memory segment '%s'",
+                        name, exc_info=True)
+        else:
+            removed += 1
+    return removed
+
+
+def release_attached():
+    """Releases segments that were (zero-copy) used by the current task."""
+    while _attached:
+        _close_segment(_attached.pop())
@@ -40,8 +40,9 @@ class Engine(object):
         self._flow_detail = flow_detail
         self._backend = backend
         self._options = misc.safe_copy_dict(options)
-        self._notifier = notifier.Notifier()
-        self._atom_notifier = notifier.Notifier()
+        dispatcher = self._options.get('event_dispatcher')
+        self._notifier = notifier.Notifier(dispatcher=dispatcher)
+        self._atom_notifier = notifier.Notifier(dispatcher=dispatcher)
 
     @property
     def notifier(self):
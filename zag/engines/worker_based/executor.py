@@ -209,11 +209,12 @@ class WorkerTaskExecutor(executor.TaskExecutor):
 
     def _submit_task(self, task, task_uuid, action, arguments,
                      progress_callback=None, result=pr.NO_RESULT,
-                     failures=None):
+                     failures=None, profile=False):
         """Submit task request to a worker."""
         request = pr.Request(task, task_uuid, action, arguments,
                              timeout=self._transition_timeout,
-                             result=result, failures=failures)
+                             result=result, failures=failures,
+                             profile=profile)
 
         # Register the callback, so that we can proxy the progress correctly.
         if (progress_callback is not None and
@@ -261,15 +262,17 @@ class WorkerTaskExecutor(executor.TaskExecutor):
                     request.set_result(failure)
 
     def execute_task(self, task, task_uuid, arguments,
-                     progress_callback=None):
+                     progress_callback=None, profile=False):
         return self._submit_task(task, task_uuid, pr.EXECUTE, arguments,
-                                 progress_callback=progress_callback)
+                                 progress_callback=progress_callback,
+                                 profile=profile)
 
     def revert_task(self, task, task_uuid, arguments, result, failures,
-                    progress_callback=None):
+                    progress_callback=None, profile=False):
         return self._submit_task(task, task_uuid, pr.REVERT, arguments,
                                  result=result, failures=failures,
-                                 progress_callback=progress_callback)
+                                 progress_callback=progress_callback,
+                                 profile=profile)
 
     def start(self):
         """Starts proxy thread and associated topic notification thread."""
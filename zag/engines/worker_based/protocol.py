@@ -17,6 +17,7 @@
 import abc
 import collections
 import threading
+import time
 
 from automaton import exceptions as machine_excp
 from automaton import machines
@@ -319,14 +320,20 @@ class Request(Message):
             'arguments': {
                 "type": "object",
             },
+            # Only sent when the engine wants the task to be profiled (what
+            # was collected is sent back as a task notifier event).
+            'profile': {
+                "type": "boolean",
+            },
         },
         'required': ['task_cls', 'task_name', 'task_version', 'action'],
     }
 
     def __init__(self, task, uuid, action,
                  arguments, timeout=REQUEST_TIMEOUT, result=NO_RESULT,
-                 failures=None):
+                 failures=None, profile=False):
         self._action = action
+        self._profile = profile
         self._event = ACTION_TO_EVENT[action]
         self._arguments = arguments
         self._result = result
@@ -340,6 +347,9 @@ class Request(Message):
         self.created_on = timeutils.now()
         self.future = futurist.Future()
         self.future.atom = task
+        # When the worker (says it) started running the task and when the
+        # result of doing that arrived.
+        self.future.timings = {}
         self._worker = None
 
     @property
@@ -349,6 +359,7 @@ class Request(Message):
 
     def set_result(self, result):
         """Sets the responses futures result."""
+        self.future.timings['finished'] = time.time()
         self.future.set_result((self._event, result))
 
     @property
@@ -380,6 +391,8 @@ class Request(Message):
             'action': self._action,
             'arguments': self._arguments,
         }
+        if self._profile:
+            request['profile'] = True
         if self._result is not NO_RESULT:
             result = self._result
             if isinstance(result, ft.Failure):
@@ -434,6 +447,8 @@ class Request(Message):
         else:
             if new_state in STOP_TIMER_STATES:
                 self._watch.stop()
+            if new_state == RUNNING:
+                self.future.timings['started'] = time.time()
             LOG.debug("Transitioned '%s' from %s state to %s state", self,
                       old_state, new_state)
 
@@ -488,6 +503,8 @@ class Request(Message):
         }
         if task_uuid is not None:
             arguments['task_uuid'] = task_uuid
+        if data.get('profile'):
+            arguments['profile'] = True
         if result is not None:
             result_data_type, result_data = result
             if result_data_type == 'failure':
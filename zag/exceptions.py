@@ -158,6 +158,10 @@ class RequestTimeout(ExecutionFailure):
     """Raised when a worker request was not finished within allotted time."""
 
 
+class AtomTimeout(ExecutionFailure):
+    """Raised when a atom did not finish executing within its timeout."""
+
+
 class InvalidState(ExecutionFailure):
     """Raised when a invalid state transition is attempted while executing."""
 
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from __future__ import absolute_import
+
+import functools
+import io
+import itertools
+import json
+import os
+import threading
+
+from oslo_utils import timeutils
+import six
+
+from zag.engines.action_engine import builder as bu
+from zag.listeners import base
+from zag import logging
+from zag import states
+
+LOG = logging.getLogger(__name__)
+
+#: Storage methods (that the engine uses while running) that are traced.
+TRACED_STORAGE_METHODS = (
+    'change_flow_state', 'cleanup_retry_history', 'ensure_atoms', 'fetch',
+    'fetch_all', 'fetch_mapped_args', 'flush', 'get_atom_intention',
+    'get_atom_state', 'get_atoms_states', 'get_execute_failures',
+    'get_flow_state', 'get_revert_failures', 'reset', 'save',
+    'save_retry_failure', 'set_atom_intention', 'set_atom_state',
+    'set_task_progress', 'update_atom_metadata',
+)
+
+# What each atom (track) spans are named (while the atom is in a stage).
+_STAGE_SPANS = {
+    bu.STAGE_READY: 'queued',
+    bu.STAGE_SUBMITTING: 'submit',
+}
+_STARTING_STATES = {
+    states.RUNNING: 'execute',
+    states.REVERTING: 'revert',
+}
+_FINISHED_STATES = frozenset(base.FINISH_STATES + (states.REVERTED,))
+
+# Atoms get (made up) thread ids of their own that start here (so that they
+# do not get confused with real thread ids).
+_ATOM_TID_START = 1000000
+
+
+class ChromeTraceListener(base.Listener):
+    """Listener that records a timeline of what an engine does.
+
+    Records spans of the engines (internal) state machine states, of the
+    stages atoms go through (waiting to be scheduled, being submitted to
+    the executor, executing or reverting), of the flows states and of the
+    storage calls the engine makes; these are saved (when this listener is
+    deregistered, or by calling :py:meth:`.dump`) in the `trace event`_ json
+    format (which can be loaded by ``chrome://tracing`` or `perfetto`_).
+
+    Each atom gets a track of its own (so that atoms that run at the same
+    time can be told apart) while engine, flow and storage spans are placed
+    on the track of the thread they happened in.
+
+    Only engines that have a ``trace_notifier`` (the action engines, which
+    includes the worker-based one) have their state machine states and atom
+    scheduling stages traced; only the flow and atom states (and storage
+    calls) of other engines will be recorded.
+
+    .. _trace event: https://docs.google.com/document/d/1CvAClvFfyA5R-\
+PhYUmn5OOQtYMH4h6I0nSsKchNAySU
+    .. _perfetto: https://ui.perfetto.dev/
+    """
+
+    def __init__(self, engine, path=None, trace_storage=True):
+        super(ChromeTraceListener, self).__init__(engine)
+        self._path = path
+        self._trace_storage = trace_storage
+        self._events = []
+        # Re-entrant since spans are added while the span (and state start)
+        # dictionaries below are being updated (under this same lock).
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+        self._epoch = timeutils.now()
+        # Atom name -> (made up) thread id of its track.
+        self._atom_tids = {}
+        self._atom_tid_counter = itertools.count(_ATOM_TID_START)
+        # Atom name -> (span name, started at) of its current span.
+        self._atom_spans = {}
+        # Atom name -> span name to start once its submission finishes.
+        self._pending_spans = {}
+        # (Machine or flow) state -> when it was entered.
+        self._state_starts = {}
+        # Storage method name -> (previous instance attribute or none if
+        # there was not one, wrapper that replaced it).
+        self._wrapped = {}
+
+    @property
+    def events(self):
+        """The (trace format) events recorded so far."""
+        with self._lock:
+            return list(self._events)
+
+    def _micros(self, timestamp):
+        return (timestamp - self._epoch) * 1000000.0
+
+    def _add_span(self, name, category, started, ended, tid=None, args=None):
+        if tid is None:
+            tid = threading.current_thread().ident
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': self._micros(started),
+            'dur': max(0.0, self._micros(ended) - self._micros(started)),
+            'pid': self._pid,
+            'tid': tid,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+
+    def _add_instant(self, name, category, timestamp, tid=None, args=None):
+        if tid is None:
+            tid = threading.current_thread().ident
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'i',
+            's': 't',
+            'ts': self._micros(timestamp),
+            'pid': self._pid,
+            'tid': tid,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+
+    def _atom_tid(self, atom_name):
+        with self._lock:
+            try:
+                return self._atom_tids[atom_name]
+            except KeyError:
+                tid = next(self._atom_tid_counter)
+                self._atom_tids[atom_name] = tid
+                self._events.append({
+                    'name': 'thread_name',
+                    'ph': 'M',
+                    'pid': self._pid,
+                    'tid': tid,
+                    'args': {'name': atom_name},
+                })
+                return tid
+
+    def _end_atom_span(self, atom_name, timestamp):
+        try:
+            span_name, started = self._atom_spans.pop(atom_name)
+        except KeyError:
+            return
+        self._add_span(span_name, 'atom', started, timestamp,
+                       tid=self._atom_tid(atom_name))
+
+    def _begin_atom_span(self, atom_name, span_name, timestamp):
+        self._end_atom_span(atom_name, timestamp)
+        self._atom_spans[atom_name] = (span_name, timestamp)
+
+    def _on_machine_state(self, event_type, details):
+        state = details['state']
+        with self._lock:
+            if details['entered']:
+                self._state_starts[('machine', state)] = details['timestamp']
+            else:
+                started = self._state_starts.pop(('machine', state), None)
+                if started is not None:
+                    self._add_span(state, 'engine', started,
+                                   details['timestamp'])
+
+    def _on_atom_stage(self, event_type, details):
+        atom_name = details['atom_name']
+        stage = details['stage']
+        timestamp = details['timestamp']
+        with self._lock:
+            if stage in _STAGE_SPANS:
+                self._begin_atom_span(atom_name, _STAGE_SPANS[stage],
+                                      timestamp)
+            elif stage == bu.STAGE_SCHEDULED:
+                self._end_atom_span(atom_name, timestamp)
+                span_name = self._pending_spans.pop(atom_name, None)
+                if span_name is not None:
+                    self._begin_atom_span(atom_name, span_name, timestamp)
+            else:
+                self._add_instant(stage, 'atom', timestamp,
+                                  tid=self._atom_tid(atom_name))
+
+    def _on_atom_state(self, atom_name, state, details):
+        now = timeutils.now()
+        with self._lock:
+            self._add_instant(state, 'atom', now,
+                              tid=self._atom_tid(atom_name))
+            if state in _STARTING_STATES:
+                # The submission (if one is going on) keeps going, the atom
+                # is only considered to be executing (or reverting) once that
+                # has finished.
+                span = self._atom_spans.get(atom_name)
+                submitting = _STAGE_SPANS[bu.STAGE_SUBMITTING]
+                if span is None or span[0] != submitting:
+                    self._begin_atom_span(atom_name,
+                                          _STARTING_STATES[state], now)
+                else:
+                    self._pending_spans[atom_name] = _STARTING_STATES[state]
+            elif state in _FINISHED_STATES:
+                self._pending_spans.pop(atom_name, None)
+                self._end_atom_span(atom_name, now)
+
+    def _task_receiver(self, state, details):
+        self._on_atom_state(details['task_name'], state, details)
+
+    def _retry_receiver(self, state, details):
+        self._on_atom_state(details['retry_name'], state, details)
+
+    def _flow_receiver(self, state, details):
+        now = timeutils.now()
+        key = ('flow', details['flow_name'])
+        with self._lock:
+            started = self._state_starts.pop(key, None)
+            if started is not None:
+                prior_state, started_at = started
+                self._add_span(prior_state, 'flow', started_at, now,
+                               args={'flow_uuid': details['flow_uuid']})
+            if state not in _FINISHED_STATES and state != states.SUSPENDED:
+                self._state_starts[key] = (state, now)
+
+    def _wrap_storage(self):
+        storage = self._engine.storage
+        for name in TRACED_STORAGE_METHODS:
+            method = getattr(storage, name, None)
+            if method is None or name in self._wrapped:
+                continue
+
+            def traced(method, name, *args, **kwargs):
+                if name not in self._wrapped:
+                    # No longer tracing (but something wrapped this wrapper
+                    # so it could not be removed).
+                    return method(*args, **kwargs)
+                started = timeutils.now()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    self._add_span(name, 'storage', started, timeutils.now())
+
+            wrapper = functools.partial(traced, method, name)
+            self._wrapped[name] = (vars(storage).get(name), wrapper)
+            setattr(storage, name, wrapper)
+
+    def _unwrap_storage(self):
+        storage = self._engine.storage
+        while self._wrapped:
+            name, (previous, wrapper) = self._wrapped.popitem()
+            if vars(storage).get(name) is not wrapper:
+                # Something else wrapped it since, leave that in place (the
+                # wrapper now just calls what it wrapped).
+                continue
+            if previous is not None:
+                setattr(storage, name, previous)
+            else:
+                # Removing the instance attribute makes the (original) class
+                # method visible again.
+                delattr(storage, name)
+
+    def register(self):
+        super(ChromeTraceListener, self).register()
+        trace_notifier = getattr(self._engine, 'trace_notifier', None)
+        if trace_notifier is not None and 'trace' not in self._registered:
+            trace_notifier.register(bu.TRACE_MACHINE_STATE,
+                                    self._on_machine_state)
+            trace_notifier.register(bu.TRACE_ATOM_STAGE,
+                                    self._on_atom_stage)
+            self._registered['trace'] = trace_notifier
+        if self._trace_storage:
+            self._wrap_storage()
+
+    def deregister(self):
+        trace_notifier = self._registered.pop('trace', None)
+        if trace_notifier is not None:
+            trace_notifier.deregister(bu.TRACE_MACHINE_STATE,
+                                      self._on_machine_state)
+            trace_notifier.deregister(bu.TRACE_ATOM_STAGE,
+                                      self._on_atom_stage)
+        self._unwrap_storage()
+        super(ChromeTraceListener, self).deregister()
+        if self._path:
+            self.dump(self._path)
+
+    def dump(self, path):
+        """Saves the recorded events (in the trace event format) to a file."""
+        trace = {
+            'traceEvents': self.events,
+            'displayTimeUnit': 'ms',
+        }
+        blob = json.dumps(trace, default=six.text_type)
+        if isinstance(blob, six.binary_type):
+            blob = blob.decode('utf-8')
+        with io.open(path, 'w', encoding='utf-8') as fh:
+            fh.write(blob)
+        LOG.debug("Saved %s trace events to '%s'", len(trace['traceEvents']),
+                  path)
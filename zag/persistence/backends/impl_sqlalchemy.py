@@ -17,6 +17,7 @@
 
 from __future__ import absolute_import
 
+import collections
 import contextlib
 import copy
 import functools
@@ -98,6 +99,14 @@ POSTGRES_GONE_WAY_AWAY_ERRORS = (
 # These connection urls mean sqlite is being used as an in-memory DB.
 SQLITE_IN_MEMORY = ('sqlite://', 'sqlite:///', 'sqlite:///:memory:')
 
+# How many logbooks are fetched (and populated) at once when iterating over
+# all of them.
+PAGE_SIZE = 500
+
+# How many parent uuids are put in a single ``IN`` clause when fetching the
+# children (flow or atom details) of many parents at once.
+IN_CHUNK_SIZE = 500
+
 # Transacation isolation levels that will be automatically applied, we prefer
 # strong read committed isolation levels to avoid merging and using dirty
 # data...
@@ -220,14 +229,40 @@ class _Alchemist(object):
         for row in conn.execute(q):
             yield self.convert_flow_detail(row)
 
+    @staticmethod
+    def _children_query_iter(conn, table, parent_uuids):
+        # Some databases limit how many parameters a single statement may have,
+        # so ask for the children of at most a chunk of parents at a time
+        # (instead of issuing a query per parent).
+        parent_uuids = list(parent_uuids)
+        for i in six.moves.range(0, len(parent_uuids), IN_CHUNK_SIZE):
+            chunk = parent_uuids[i:i + IN_CHUNK_SIZE]
+            q = (sql.select([table]).
+                 where(table.c.parent_uuid.in_(chunk)))
+            for row in conn.execute(q):
+                yield row
+
+    def populate_books(self, conn, books):
+        books_by_uuid = dict((book.uuid, book) for book in books)
+        fds = []
+        for row in self._children_query_iter(conn, self._tables.flowdetails,
+                                             books_by_uuid):
+            fd = self.convert_flow_detail(row)
+            books_by_uuid[row['parent_uuid']].add(fd)
+            fds.append(fd)
+        self.populate_flow_details(conn, fds)
+
+    def populate_flow_details(self, conn, fds):
+        fds_by_uuid = dict((fd.uuid, fd) for fd in fds)
+        for row in self._children_query_iter(conn, self._tables.atomdetails,
+                                             fds_by_uuid):
+            fds_by_uuid[row['parent_uuid']].add(self.convert_atom_detail(row))
+
     def populate_book(self, conn, book):
-        for fd in self.flow_query_iter(conn, book.uuid):
-            book.add(fd)
-            self.populate_flow_detail(conn, fd)
+        self.populate_books(conn, [book])
 
     def populate_flow_detail(self, conn, fd):
-        for ad in self.atom_query_iter(conn, fd.uuid):
-            fd.add(ad)
+        self.populate_flow_details(conn, [fd])
 
 
 class SQLAlchemyBackend(base.Backend):
@@ -447,6 +482,46 @@ class Connection(base.Connection):
                                  "Failed updating atom details"
                                  " with uuid '%s'" % atom_detail.uuid)
 
+    def update_atom_details_many(self, atom_details):
+        atom_details = list(atom_details)
+        try:
+            atomdetails = self._tables.atomdetails
+            # These rows must already exist, so instead of selecting (and
+            # merging with) each one first they are directly updated; those
+            # that share the same changed columns are updated together using a
+            # single (executemany) statement.
+            grouped = collections.OrderedDict()
+            for ad in atom_details:
+                changes = ad.changes()
+                values = ad.to_dict()
+                if changes is None:
+                    values.pop('name')
+                else:
+                    values = dict((name, values[name]) for name in changes)
+                if values:
+                    values['_uuid'] = values.pop('uuid', ad.uuid)
+                    grouped.setdefault(frozenset(values), []).append(values)
+            if grouped:
+                q = (sql.update(atomdetails).
+                     where(atomdetails.c.uuid == sql.bindparam('_uuid')))
+                with self._engine.begin() as conn:
+                    for many_values in six.itervalues(grouped):
+                        r = conn.execute(q, many_values)
+                        if len(many_values) == 1:
+                            sane_rowcount = r.supports_sane_rowcount()
+                        else:
+                            sane_rowcount = r.supports_sane_multi_rowcount()
+                        if sane_rowcount and r.rowcount != len(many_values):
+                            raise exc.NotFound(
+                                "No atom details found with one (or more)"
+                                " of uuids %s" % sorted(
+                                    values['_uuid'] for values in many_values))
+            return atom_details
+        except sa_exc.SQLAlchemyError:
+            exc.raise_with_cause(exc.StorageFailure,
+                                 "Failed updating %s atom details"
+                                 % len(atom_details))
+
     def _insert_flow_details(self, conn, fd, parent_uuid):
         value = fd.to_dict()
         value['parent_uuid'] = parent_uuid
@@ -461,10 +536,17 @@ class Connection(base.Connection):
         conn.execute(sql.insert(self._tables.atomdetails, value))
 
     def _update_atom_details(self, conn, ad, e_ad):
+        # Only the columns of what changed (if that is known) are updated
+        # (so that, for example, a state change does not rewrite results).
+        changes = ad.changes()
         e_ad.merge(ad)
-        conn.execute(sql.update(self._tables.atomdetails)
-                     .where(self._tables.atomdetails.c.uuid == e_ad.uuid)
-                     .values(e_ad.to_dict()))
+        values = e_ad.to_dict()
+        if changes is not None:
+            values = dict((name, values[name]) for name in changes)
+        if values:
+            conn.execute(sql.update(self._tables.atomdetails)
+                         .where(self._tables.atomdetails.c.uuid == e_ad.uuid)
+                         .values(values))
 
     def _update_flow_details(self, conn, fd, e_fd):
         e_fd.merge(fd)
@@ -561,30 +643,49 @@ class Connection(base.Connection):
             exc.raise_with_cause(exc.StorageFailure,
                                  "Failed getting logbook '%s'" % book_uuid)
 
+    def _fetch_logbooks_page(self, after_uuid=None, lazy=False):
+        logbooks = self._tables.logbooks
+        q = (sql.select([logbooks]).
+             order_by(logbooks.c.uuid).limit(PAGE_SIZE))
+        if after_uuid is not None:
+            q = q.where(logbooks.c.uuid > after_uuid)
+        with contextlib.closing(self._engine.connect()) as conn:
+            # Stream the rows (using a server-side cursor where the driver
+            # supports one) instead of having the driver buffer the whole
+            # result up front.
+            r = conn.execution_options(stream_results=True).execute(q)
+            books = [self._converter.convert_book(row) for row in r]
+            if books and not lazy:
+                self._converter.populate_books(conn, books)
+        return books
+
     def get_logbooks(self, lazy=False):
-        gathered = []
-        try:
-            with contextlib.closing(self._engine.connect()) as conn:
-                q = sql.select([self._tables.logbooks])
-                for row in conn.execute(q):
-                    book = self._converter.convert_book(row)
-                    if not lazy:
-                        self._converter.populate_book(conn, book)
-                    gathered.append(book)
-        except sa_exc.DBAPIError:
-            exc.raise_with_cause(exc.StorageFailure,
-                                 "Failed getting logbooks")
-        for book in gathered:
-            yield book
+        # Logbooks are fetched (and populated) a page at a time (ordered by
+        # their uuid, each page starting after the last uuid of the prior one)
+        # so that all of them never have to be in memory at once; no connection
+        # is held while the caller works on the yielded logbooks.
+        after_uuid = None
+        while True:
+            try:
+                books = self._fetch_logbooks_page(after_uuid=after_uuid,
+                                                  lazy=lazy)
+            except sa_exc.DBAPIError:
+                exc.raise_with_cause(exc.StorageFailure,
+                                     "Failed getting logbooks")
+            for book in books:
+                yield book
+            if len(books) < PAGE_SIZE:
+                break
+            after_uuid = books[-1].uuid
 
     def get_flows_for_book(self, book_uuid, lazy=False):
         gathered = []
         try:
             with contextlib.closing(self._engine.connect()) as conn:
                 for fd in self._converter.flow_query_iter(conn, book_uuid):
-                    if not lazy:
-                        self._converter.populate_flow_detail(conn, fd)
                     gathered.append(fd)
+                if not lazy:
+                    self._converter.populate_flow_details(conn, gathered)
         except sa_exc.DBAPIError:
             exc.raise_with_cause(exc.StorageFailure,
                                  "Failed getting flow details in"
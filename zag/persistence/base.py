@@ -80,6 +80,20 @@ class Connection(object):
         of it.
         """
 
+    def update_atom_details_many(self, atom_details):
+        """Updates the given atom details and returns the updated versions.
+
+        The updated versions are returned in the same order as the given
+        atom details; by default each atom detail is updated one after the
+        other (backends that can save many atom details at once, for example
+        in a single transaction, should override this to do so).
+
+        The details that are to be updated must already have been created by
+        saving a flow details with the given atom details inside of it.
+        """
+        return [self.update_atom_details(atom_detail)
+                for atom_detail in atom_details]
+
     @abc.abstractmethod
     def update_flow_details(self, flow_detail):
         """Updates a given flow details and returns the updated version.
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import abc
+import contextlib
+import errno
+import hashlib
+import io
+import mmap
+import os
+import threading
+
+from oslo_utils import uuidutils
+import six
+from six.moves import cPickle as pickle
+
+from zag import exceptions as exc
+
+#: Key (in the stored dictionary) that marks a value as a blob reference.
+REFERENCE_KEY = '__zag_blob__'
+
+
+def is_reference(value):
+    """Returns if the value is a reference to a blob (in some blob store)."""
+    return isinstance(value, dict) and REFERENCE_KEY in value
+
+
+def make_reference(digest, size):
+    """Makes the (json serializable) reference to a stored blob."""
+    return {REFERENCE_KEY: digest, 'size': size}
+
+
+def dump(value):
+    """Turns a value into the bytes that are stored in a blob store."""
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def load(store, reference):
+    """Loads the value that a reference (returned from ``dump``) points to."""
+    with store.open(reference[REFERENCE_KEY]) as data:
+        if six.PY2 and not isinstance(data, six.binary_type):
+            data = data[:]
+        return pickle.loads(data)
+
+
+@six.add_metaclass(abc.ABCMeta)
+class BlobStore(object):
+    """Stores (and retrieves) blobs by the digest of their contents.
+
+    Since blobs are addressed by their contents storing the same blob many
+    times only stores it once.
+    """
+
+    @staticmethod
+    def digest(data):
+        """Returns the digest (address) the given data will be stored at."""
+        return hashlib.sha256(data).hexdigest()
+
+    @abc.abstractmethod
+    def put(self, data):
+        """Stores the data (if not already stored) and returns its digest."""
+
+    @abc.abstractmethod
+    def open(self, digest):
+        """Context manager that provides the (buffer-like) data of a blob.
+
+        Raises :py:class:`~zag.exceptions.NotFound` if there is no blob
+        with that digest.
+        """
+
+
+class MemoryBlobStore(BlobStore):
+    """Keeps blobs in memory (useful for testing)."""
+
+    def __init__(self):
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def put(self, data):
+        digest = self.digest(data)
+        with self._lock:
+            self._blobs.setdefault(digest, data)
+        return digest
+
+    @contextlib.contextmanager
+    def open(self, digest):
+        try:
+            data = self._blobs[digest]
+        except KeyError:
+            raise exc.NotFound("No blob found with digest '%s'" % digest)
+        yield data
+
+
+class DirBlobStore(BlobStore):
+    """Keeps blobs as files in a directory (and memory maps them to read).
+
+    Files are written to a temporary file and then renamed into place so that
+    readers (in this or other processes) never see partially written blobs.
+    """
+
+    def __init__(self, path):
+        if not path:
+            raise ValueError("Empty path is disallowed")
+        self._path = os.path.abspath(path)
+
+    def _blob_path(self, digest):
+        return os.path.join(self._path, digest[0:2], digest)
+
+    def put(self, data):
+        digest = self.digest(data)
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            tmp_path = "%s.%s" % (path, uuidutils.generate_uuid())
+            with io.open(tmp_path, 'wb') as fp:
+                fp.write(data)
+            os.rename(tmp_path, path)
+        return digest
+
+    @contextlib.contextmanager
+    def open(self, digest):
+        try:
+            fp = io.open(self._blob_path(digest), 'rb')
+        except (IOError, OSError) as e:
+            if e.errno == errno.ENOENT:
+                raise exc.NotFound("No blob found with digest '%s'" % digest)
+            raise
+        with fp:
+            try:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError):
+                # Empty files (or files that can not be mapped) are just
+                # read instead.
+                yield fp.read()
+            else:
+                try:
+                    yield data
+                finally:
+                    data.close()
@@ -99,6 +99,43 @@ def _fix_meta(data):
     return meta
 
 
+class _Tracked(object):
+    # Names of the attributes (which are also keys in what ``to_dict``
+    # returns) whose changes are tracked.
+    _tracked_attrs = ()
+
+    # Values of those attributes when this object was last saved (or none
+    # if that is not known).
+    _saved_values = None
+
+    def mark_saved(self):
+        """Marks the current attribute values of this object as saved.
+
+        Afterwards :meth:`.changes` returns the (tracked) attributes that
+        have been assigned a different object since then; this means that
+        once marked any containers (for example the ``meta`` dictionary)
+        must be replaced (and **not** altered in-place) for their changes to
+        be noticed.
+        """
+        self._saved_values = tuple(getattr(self, attr_name)
+                                   for attr_name in self._tracked_attrs)
+
+    def changes(self):
+        """Returns the names of the attributes changed since last saved.
+
+        If when this object was last saved is not known (it never has been
+        marked as saved) this returns ``None`` (which means that it should be
+        saved in its entirety).
+        """
+        saved_values = self._saved_values
+        if saved_values is None:
+            return None
+        return frozenset(attr_name
+                         for attr_name, saved_value in
+                         six.moves.zip(self._tracked_attrs, saved_values)
+                         if getattr(self, attr_name) is not saved_value)
+
+
 class LogBook(object):
     """A collection of flow details and associated metadata.
 
@@ -478,7 +515,7 @@ class FlowDetail(object):
 
 
 @six.add_metaclass(abc.ABCMeta)
-class AtomDetail(object):
+class AtomDetail(_Tracked):
     """A collection of atom specific runtime information and metadata.
 
     This is a base **abstract** class that contains attributes that are used
@@ -519,6 +556,9 @@ class AtomDetail(object):
                           failure this will be set to none).
     """
 
+    _tracked_attrs = ('state', 'intention', 'results', 'failure',
+                      'revert_results', 'revert_failure', 'meta', 'version')
+
     def __init__(self, name, uuid):
         self._uuid = uuid
         self._name = name
@@ -693,6 +733,23 @@ class AtomDetail(object):
     def copy(self):
         """Copies this atom detail."""
 
+    def copy_with(self, **changes):
+        """Makes a copy-on-write copy of this atom detail (with changes).
+
+        Unlike :meth:`.copy` none of the attributes of this atom detail
+        (not even its ``meta`` dictionary) are copied; the new atom detail
+        shares all of them with this one (except the ones the given changes
+        replace), so it must **only** be used when those shared attributes
+        will be replaced (and never mutated in-place).
+
+        :returns: a new atom detail
+        :rtype: :py:class:`.AtomDetail`
+        """
+        clone = copy.copy(self)
+        for (attr_name, value) in six.iteritems(changes):
+            setattr(clone, attr_name, value)
+        return clone
+
     def pformat(self, indent=0, linesep=os.linesep):
         """Pretty formats this atom detail into a string."""
         cls_name = self.__class__.__name__
@@ -986,8 +1043,8 @@ class RetryDetail(AtomDetail):
             new_results = []
             for (data, failures) in results:
                 new_failures = {}
-                for (key, data) in six.iteritems(failures):
-                    new_failures[key] = ft.Failure.from_dict(data)
+                for (key, failure) in six.iteritems(failures):
+                    new_failures[key] = ft.Failure.from_dict(failure)
                 new_results.append((data, new_failures))
             return new_results
 
@@ -140,15 +140,37 @@ class PathBasedConnection(base.Connection):
             raise exc.StorageFailure("Invalid storage class %s" % type(obj))
         return self._join_path(path, obj.uuid)
 
+    @staticmethod
+    def _merge_changes(atom_detail, item_data, changes):
+        # Replaces only the changed keys of what was saved (leaving the rest
+        # as it was), without altering what was saved in-place.
+        updated = atom_detail.to_dict()
+        item_data = dict(item_data)
+        item_data['atom'] = saved = dict(item_data['atom'])
+        for name in changes:
+            saved[name] = updated[name]
+        return item_data
+
     def _update_object(self, obj, transaction, ignore_missing=False):
         path = self._get_obj_path(obj)
         try:
             item_data = self._get_item(path)
-            existing_obj = self._deserialize(type(obj), item_data)
-            obj = existing_obj.merge(obj)
         except exc.NotFound:
             if not ignore_missing:
                 raise
+        else:
+            changes = None
+            if isinstance(obj, models.AtomDetail):
+                changes = obj.changes()
+            existing_obj = self._deserialize(type(obj), item_data)
+            if changes is not None:
+                if changes:
+                    self._set_item(path,
+                                   self._merge_changes(obj, item_data,
+                                                       changes),
+                                   transaction)
+                return existing_obj.merge(obj)
+            obj = existing_obj.merge(obj)
         self._set_item(path, self._serialize(obj), transaction)
         return obj
 
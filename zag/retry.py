@@ -155,11 +155,12 @@ class Retry(atom.Atom):
     """
 
     def __init__(self, name=None, provides=None, requires=None,
-                 auto_extract=True, rebind=None):
+                 auto_extract=True, rebind=None, resources=None):
         super(Retry, self).__init__(name=name, provides=provides,
                                     requires=requires, rebind=rebind,
                                     auto_extract=auto_extract,
-                                    ignore_list=[EXECUTE_REVERT_HISTORY])
+                                    ignore_list=[EXECUTE_REVERT_HISTORY],
+                                    resources=resources)
 
     @property
     def name(self):
@@ -263,9 +264,11 @@ class Times(Retry):
     """
 
     def __init__(self, attempts=1, name=None, provides=None, requires=None,
-                 auto_extract=True, rebind=None, revert_all=False):
+                 auto_extract=True, rebind=None, revert_all=False,
+                 resources=None):
         super(Times, self).__init__(name, provides, requires,
-                                    auto_extract, rebind)
+                                    auto_extract, rebind,
+                                    resources=resources)
         self._attempts = attempts
 
         if revert_all:
@@ -286,9 +289,11 @@ class ForEachBase(Retry):
     """Base class for retries that iterate over a given collection."""
 
     def __init__(self, name=None, provides=None, requires=None,
-                 auto_extract=True, rebind=None, revert_all=False):
+                 auto_extract=True, rebind=None, revert_all=False,
+                 resources=None):
         super(ForEachBase, self).__init__(name, provides, requires,
-                                          auto_extract, rebind)
+                                          auto_extract, rebind,
+                                          resources=resources)
 
         if revert_all:
             self._revert_action = REVERT_ALL
@@ -337,9 +342,11 @@ class ForEach(ForEachBase):
     """
 
     def __init__(self, values, name=None, provides=None, requires=None,
-                 auto_extract=True, rebind=None, revert_all=False):
+                 auto_extract=True, rebind=None, revert_all=False,
+                 resources=None):
         super(ForEach, self).__init__(name, provides, requires,
-                                      auto_extract, rebind, revert_all)
+                                      auto_extract, rebind, revert_all,
+                                      resources=resources)
         self._values = values
 
     def on_failure(self, history, *args, **kwargs):
@@ -369,10 +376,12 @@ class ParameterizedForEach(ForEachBase):
     """
 
     def __init__(self, name=None, provides=None, requires=None,
-                 auto_extract=True, rebind=None, revert_all=False):
+                 auto_extract=True, rebind=None, revert_all=False,
+                 resources=None):
         super(ParameterizedForEach, self).__init__(name, provides, requires,
                                                    auto_extract, rebind,
-                                                   revert_all)
+                                                   revert_all,
+                                                   resources=resources)
 
     def on_failure(self, values, history, *args, **kwargs):
         return self._on_failure(values, history)
@@ -25,6 +25,7 @@ import six
 from zag import exceptions
 from zag import logging
 from zag.persistence.backends import impl_memory
+from zag.persistence import blobs
 from zag.persistence import models
 from zag import retry
 from zag import states
@@ -84,6 +85,37 @@ META_INJECTED = 'injected'
 META_PROGRESS = 'progress'
 META_PROGRESS_DETAILS = 'progress_details'
 
+# Atom detail metadata key used to save what profiling the atom collected.
+META_PROFILE = 'profile'
+
+#: Atom detail changes are saved to the backend as soon as they happen.
+FLUSH_IMMEDIATELY = 'immediately'
+
+#: Atom detail changes are buffered (in-memory) and saved to the backend
+#: once per engine cycle (and whenever the flow state changes).
+FLUSH_PER_CYCLE = 'per_cycle'
+
+#: Atom detail changes are buffered (in-memory) and saved to the backend
+#: only when the flow state changes (or when explicitly flushed).
+FLUSH_ON_FLOW_STATE = 'on_flow_state'
+
+# All the flush policies storage knows about (and accepts).
+FLUSH_POLICIES = (FLUSH_IMMEDIATELY, FLUSH_PER_CYCLE, FLUSH_ON_FLOW_STATE)
+
+#: Size (in bytes) task results must reach before a blob store (if any)
+#: is used to store them.
+DEFAULT_BLOB_THRESHOLD = 1024 * 1024
+
+#: Size (in bytes) task results must reach before they are worth releasing
+#: (moving into the blob store) once nothing needs them anymore.
+DEFAULT_RELEASE_THRESHOLD = 64 * 1024
+
+# Types of results that are never big enough to be saved in a blob store.
+_SMALL_TYPES = (float, complex)
+
+# Upper bound on how many bytes serializing adds to a string (or bytes).
+_SERIALIZED_OVERHEAD = 32
+
 
 class _ProviderLocator(object):
     """Helper to start to better decouple the finding logic from storage.
@@ -120,11 +152,36 @@ class _ProviderLocator(object):
             _item_from_single(provider, results, looking_for)
         return results
 
-    def _find(self, looking_for, scope_walker=None,
-              short_circuit=True, find_potentials=False):
+    def plan(self, looking_for, scope_walker=None):
+        """Returns the providers to search (and the order to search them in).
+
+        The returned plan is a tuple of the default providers and a list of
+        the atom providers grouped by the scope level (closest first) they
+        are visible at (levels with no providers are left out).
+        """
         if scope_walker is None:
             scope_walker = []
         default_providers, atom_providers = self.providers_fetcher(looking_for)
+        atom_provider_levels = []
+        if atom_providers:
+            atom_providers_by_name = dict((p.name, p) for p in atom_providers)
+            for accessible_atom_names in iter(scope_walker):
+                # *Always* retain the scope ordering (if any matches
+                # happen); instead of retaining the possible provider match
+                # order (which isn't that important and may be different from
+                # the scope requested ordering).
+                maybe_atom_providers = [atom_providers_by_name[atom_name]
+                                        for atom_name in accessible_atom_names
+                                        if atom_name in atom_providers_by_name]
+                if maybe_atom_providers:
+                    atom_provider_levels.append(maybe_atom_providers)
+        return (default_providers, atom_provider_levels)
+
+    def _find(self, looking_for, scope_walker=None,
+              short_circuit=True, find_potentials=False, plan=None):
+        if plan is None:
+            plan = self.plan(looking_for, scope_walker=scope_walker)
+        default_providers, atom_provider_levels = plan
         searched_providers = set()
         providers_and_results = []
         if default_providers:
@@ -145,17 +202,7 @@ class _ProviderLocator(object):
                     providers_and_results.append((p, provider_results))
             if short_circuit:
                 return (searched_providers, providers_and_results)
-        if not atom_providers:
-            return (searched_providers, providers_and_results)
-        atom_providers_by_name = dict((p.name, p) for p in atom_providers)
-        for accessible_atom_names in iter(scope_walker):
-            # *Always* retain the scope ordering (if any matches
-            # happen); instead of retaining the possible provider match
-            # order (which isn't that important and may be different from
-            # the scope requested ordering).
-            maybe_atom_providers = [atom_providers_by_name[atom_name]
-                                    for atom_name in accessible_atom_names
-                                    if atom_name in atom_providers_by_name]
+        for maybe_atom_providers in atom_provider_levels:
             tmp_providers_and_results = []
             if find_potentials:
                 for p in maybe_atom_providers:
@@ -192,18 +239,19 @@ class _ProviderLocator(object):
                 providers_and_results.extend(tmp_providers_and_results)
         return (searched_providers, providers_and_results)
 
-    def find_potentials(self, looking_for, scope_walker=None):
+    def find_potentials(self, looking_for, scope_walker=None, plan=None):
         """Returns the accessible **potential** providers."""
         _searched_providers, providers_and_results = self._find(
             looking_for, scope_walker=scope_walker,
-            short_circuit=False, find_potentials=True)
+            short_circuit=False, find_potentials=True, plan=plan)
         return set(p for (p, _provider_results) in providers_and_results)
 
-    def find(self, looking_for, scope_walker=None, short_circuit=True):
+    def find(self, looking_for, scope_walker=None, short_circuit=True,
+             plan=None):
         """Returns the accessible providers."""
         return self._find(looking_for, scope_walker=scope_walker,
                           short_circuit=short_circuit,
-                          find_potentials=False)
+                          find_potentials=False, plan=plan)
 
 
 class _Provider(object):
@@ -280,6 +328,18 @@ class Storage(object):
     NOTE(harlowja): if no backend is provided then a in-memory backend will
     be automatically used and the provided flow detail object will be placed
     into it for the duration of this objects existence.
+
+    When a flush policy other than :py:data:`.FLUSH_IMMEDIATELY` is provided
+    atom detail changes will be buffered in-memory and only saved to the
+    backend when :py:meth:`.flush` is called or when the flow detail itself is
+    saved (which happens on every flow state change, so changes are always
+    saved before an engine stops running).
+
+    When a blob store is provided, task results that are bigger (once
+    serialized) than the blob threshold are saved in that blob store and atom
+    details only contain a small reference to them (which is resolved when the
+    result is fetched); this keeps large results from being copied and saved
+    again every time their atom detail is.
     """
 
     injector_name = '_Zag_INJECTOR'
@@ -290,7 +350,14 @@ class Storage(object):
     with it must be avoided) that are *global* to the flow being executed.
     """
 
-    def __init__(self, flow_detail, backend=None, scope_fetcher=None):
+    def __init__(self, flow_detail, backend=None, scope_fetcher=None,
+                 flush_policy=FLUSH_IMMEDIATELY, blob_store=None,
+                 blob_threshold=DEFAULT_BLOB_THRESHOLD):
+        if flush_policy not in FLUSH_POLICIES:
+            raise ValueError("Unknown flush policy '%s', expected one of %s"
+                             % (flush_policy, list(FLUSH_POLICIES)))
+        self._blob_store = blob_store
+        self._blob_threshold = blob_threshold
         self._result_mappings = {}
         self._reverse_mapping = {}
         if backend is None:
@@ -312,6 +379,16 @@ class Storage(object):
         if scope_fetcher is None:
             scope_fetcher = lambda atom_name: None
         self._scope_fetcher = scope_fetcher
+        self._atom_watchers = []
+        # Atom name + looked for name => (providers version, plan) of the
+        # providers to search for that name (see: _fetch_plan); the version
+        # changes whenever new providers appear (which makes old plans stale).
+        self._fetch_plans = {}
+        self._providers_version = 0
+        self._flush_policy = flush_policy
+        # Uuids of atom details that have been altered (in-memory) but not
+        # yet saved to the backend (only used when not flushing immediately).
+        self._unflushed = set()
 
         # NOTE(imelnikov): failure serialization looses information,
         # so we cache failures here, in atom name -> failure mapping.
@@ -449,13 +526,56 @@ class Storage(object):
         # This never changes (so no read locking needed).
         return self._backend
 
+    @property
+    def blob_store(self):
+        """The blob store (if any) large task results are saved in."""
+        # This never changes (so no read locking needed).
+        return self._blob_store
+
+    @property
+    def flush_policy(self):
+        """The policy used to decide when atom changes are saved."""
+        # This never changes (so no read locking needed).
+        return self._flush_policy
+
     def _save_flow_detail(self, conn, original_flow_detail, flow_detail):
         # NOTE(harlowja): we need to update our contained flow detail if
         # the result of the update actually added more (aka another process
         # added item to the flow detail).
         original_flow_detail.update(conn.update_flow_details(flow_detail))
+        # The flow detail contains (and therefore just saved) all of the
+        # atom details, so nothing is left that needs to be flushed.
+        self._unflushed.clear()
+        for ad in original_flow_detail:
+            ad.mark_saved()
         return original_flow_detail
 
+    def _flush_atom_details(self, conn):
+        source = self._flowdetail
+        ads = []
+        for ad_uuid in self._unflushed:
+            ad = source.find(ad_uuid)
+            if ad is not None:
+                ads.append(ad)
+        # Only forget about the changes once they were saved (if saving them
+        # fails they must still be saved by the next flush).
+        for (ad, e_ad) in zip(ads, conn.update_atom_details_many(ads)):
+            ad.update(e_ad)
+            ad.mark_saved()
+        self._unflushed.clear()
+
+    @fasteners.write_locked
+    def flush(self):
+        """Saves any buffered atom changes to the backend.
+
+        When the flush policy is not :py:data:`.FLUSH_IMMEDIATELY` atom changes
+        are only applied in-memory; this saves all of those changes at once
+        (using the backends ``update_atom_details_many``) and does nothing if
+        there are no buffered changes.
+        """
+        if self._unflushed:
+            self._with_connection(self._flush_atom_details)
+
     def _fetch_flowdetail(self, clone=False):
         source = self._flowdetail
         if clone:
@@ -482,15 +602,40 @@ class Storage(object):
             else:
                 return (ad, ad)
 
-    def _save_atom_detail(self, conn, original_atom_detail, atom_detail):
+    def _save_atom_detail(self, original_atom_detail, atom_detail):
         # NOTE(harlowja): we need to update our contained atom detail if
         # the result of the update actually added more (aka another process
         # is also modifying the task detail), since python is by reference
         # and the contained atom detail will reflect the old state if we don't
         # do this update.
-        original_atom_detail.update(conn.update_atom_details(atom_detail))
+        old_state = original_atom_detail.state
+        old_intention = original_atom_detail.intention
+        if self._flush_policy == FLUSH_IMMEDIATELY:
+            original_atom_detail.update(self._with_connection(
+                lambda conn: conn.update_atom_details(atom_detail)))
+            original_atom_detail.mark_saved()
+        else:
+            # Only apply it locally, the next flush will save it...
+            original_atom_detail.update(atom_detail)
+            self._unflushed.add(original_atom_detail.uuid)
+        if self._atom_watchers:
+            state = original_atom_detail.state
+            intention = original_atom_detail.intention
+            if state != old_state or intention != old_intention:
+                for watcher in self._atom_watchers:
+                    watcher(original_atom_detail.name, state, intention)
         return original_atom_detail
 
+    def add_atom_watcher(self, watcher):
+        """Adds a callback that is called when an atoms state changes.
+
+        The callback will be called with the atoms name, its new state and
+        its new intention whenever either of those two change (it will be
+        called while the storage write lock is held, so it should **not**
+        block or take long to do whatever it is doing).
+        """
+        self._atom_watchers.append(watcher)
+
     @fasteners.read_locked
     def get_atom_uuid(self, atom_name):
         """Gets an atoms uuid given a atoms name."""
@@ -500,10 +645,9 @@ class Storage(object):
     @fasteners.write_locked
     def set_atom_state(self, atom_name, state):
         """Sets an atoms state."""
-        source, clone = self._atomdetail_by_name(atom_name, clone=True)
+        source, _clone = self._atomdetail_by_name(atom_name)
         if source.state != state:
-            clone.state = state
-            self._with_connection(self._save_atom_detail, source, clone)
+            self._save_atom_detail(source, source.copy_with(state=state))
 
     @fasteners.read_locked
     def get_atom_state(self, atom_name):
@@ -514,10 +658,10 @@ class Storage(object):
     @fasteners.write_locked
     def set_atom_intention(self, atom_name, intention):
         """Sets the intention of an atom given an atoms name."""
-        source, clone = self._atomdetail_by_name(atom_name, clone=True)
+        source, _clone = self._atomdetail_by_name(atom_name)
         if source.intention != intention:
-            clone.intention = intention
-            self._with_connection(self._save_atom_detail, source, clone)
+            self._save_atom_detail(source,
+                                   source.copy_with(intention=intention))
 
     @fasteners.read_locked
     def get_atom_intention(self, atom_name):
@@ -537,12 +681,20 @@ class Storage(object):
     @fasteners.write_locked
     def _update_atom_metadata(self, atom_name, update_with,
                               expected_type=None):
-        source, clone = self._atomdetail_by_name(atom_name,
-                                                 expected_type=expected_type,
-                                                 clone=True)
+        source, _clone = self._atomdetail_by_name(atom_name,
+                                                  expected_type=expected_type)
         if update_with:
-            clone.meta.update(update_with)
-            self._with_connection(self._save_atom_detail, source, clone)
+            # Atom metadata is copied on write (the atom detail gets a new
+            # dictionary instead of the existing one being altered).
+            meta = dict(source.meta)
+            meta.update(update_with)
+            self._save_atom_detail(source, source.copy_with(meta=meta))
+
+    @fasteners.read_locked
+    def get_atom_metadata(self, atom_name):
+        """Gets (a copy of) a atoms associated metadata."""
+        source, _clone = self._atomdetail_by_name(atom_name)
+        return dict(source.meta)
 
     def update_atom_metadata(self, atom_name, update_with):
         """Updates a atoms associated metadata.
@@ -554,6 +706,25 @@ class Storage(object):
         """
         self._update_atom_metadata(atom_name, update_with)
 
+    def set_atom_profile(self, atom_name, profile):
+        """Saves what profiling a atom (the last time it ran) collected.
+
+        Profiles (text made by the engines profiling module) that are as big
+        as the blob threshold are saved in the blob store (if there is one)
+        with only a reference to them saved in the atoms metadata.
+        """
+        if self._blob_store is not None:
+            data = blobs.dump(profile)
+            if len(data) >= self._blob_threshold:
+                digest = self._blob_store.put(data)
+                profile = blobs.make_reference(digest, len(data))
+        self._update_atom_metadata(atom_name, {META_PROFILE: profile})
+
+    def get_atom_profile(self, atom_name):
+        """Gets what profiling a atom collected (or none if never profiled)."""
+        profile = self.get_atom_metadata(atom_name).get(META_PROFILE)
+        return self._maybe_load(atom_name, profile)
+
     def set_task_progress(self, task_name, progress, details=None):
         """Set a tasks progress.
 
@@ -625,12 +796,72 @@ class Storage(object):
                             "with index %r (name '%s')", atom_name, index,
                             name)
 
+    def _maybe_offload(self, atom_detail, state, result):
+        # Large (successful) task results go into the blob store and only
+        # a reference to them is kept in the atom detail.
+        if (self._blob_store is None or state != states.SUCCESS or
+                atom_detail.intention != states.EXECUTE or
+                not isinstance(atom_detail, models.TaskDetail) or
+                not self._could_be_offloaded(result, self._blob_threshold)):
+            return result
+        try:
+            data = blobs.dump(result)
+        except Exception:
+            LOG.warning("Unable to serialize the result of atom '%s' (it"
+                        " will be saved as is)", atom_detail.name,
+                        exc_info=True)
+            return result
+        if len(data) < self._blob_threshold:
+            return result
+        digest = self._blob_store.put(data)
+        return blobs.make_reference(digest, len(data))
+
+    @staticmethod
+    def _could_be_offloaded(result, threshold):
+        # Avoids serializing results (just to find out how big they are)
+        # that can not possibly reach the threshold.
+        if result is None or isinstance(result, _SMALL_TYPES):
+            return False
+        if isinstance(result, six.integer_types):
+            return (result.bit_length() // 8 + _SERIALIZED_OVERHEAD >=
+                    threshold)
+        if isinstance(result, six.binary_type):
+            return len(result) + _SERIALIZED_OVERHEAD >= threshold
+        if isinstance(result, six.text_type):
+            # Each character is (at most) four bytes once encoded.
+            return len(result) * 4 + _SERIALIZED_OVERHEAD >= threshold
+        return True
+
+    def _maybe_load(self, atom_name, result, loaded=None):
+        # When given a dictionary (of digest -> value) each blob is only
+        # loaded once (for as long as that dictionary is passed in).
+        if not blobs.is_reference(result):
+            return result
+        if self._blob_store is None:
+            raise exceptions.StorageFailure(
+                "Result of atom '%s' was saved in a blob store, but no blob"
+                " store was provided to load it from" % atom_name)
+        if loaded is None:
+            return blobs.load(self._blob_store, result)
+        digest = result[blobs.REFERENCE_KEY]
+        try:
+            return loaded[digest]
+        except KeyError:
+            value = loaded[digest] = blobs.load(self._blob_store, result)
+            return value
+
     @fasteners.write_locked
     def save(self, atom_name, result, state=states.SUCCESS):
         """Put result for atom with provided name to storage."""
-        source, clone = self._atomdetail_by_name(atom_name, clone=True)
-        if clone.put(state, result):
-            self._with_connection(self._save_atom_detail, source, clone)
+        source, _clone = self._atomdetail_by_name(atom_name)
+        if isinstance(source, models.RetryDetail):
+            # Retry details add results to their (in-place altered) history
+            # so they still need a full copy.
+            clone = source.copy()
+        else:
+            clone = source.copy_with()
+        if clone.put(state, self._maybe_offload(clone, state, result)):
+            self._save_atom_detail(source, clone)
         # We need to somehow place more of this responsibility on the atom
         # detail class itself, vs doing it here; since it ties those two
         # together (which is bad)...
@@ -644,6 +875,39 @@ class Storage(object):
         if state == states.SUCCESS and clone.intention == states.EXECUTE:
             self._check_all_results_provided(clone.name, result)
 
+    @fasteners.write_locked
+    def release_result(self, atom_name, threshold=DEFAULT_RELEASE_THRESHOLD):
+        """Moves a (successful) task result out of memory into the blob store.
+
+        The atom detail is left with only a reference to the result (which
+        is resolved when the result is fetched). Results that are smaller
+        (once serialized) than the given threshold are not worth the trip
+        to (and back from) the blob store, so they are kept as they are.
+        Returns if the result was moved (which requires a blob store, a big
+        enough result and a result that has not already been moved).
+        """
+        source, _clone = self._atomdetail_by_name(atom_name)
+        result = source.results
+        if (self._blob_store is None or source.state != states.SUCCESS or
+                source.intention != states.EXECUTE or
+                not isinstance(source, models.TaskDetail) or
+                blobs.is_reference(result) or
+                not self._could_be_offloaded(result, threshold)):
+            return False
+        try:
+            data = blobs.dump(result)
+        except Exception:
+            LOG.warning("Unable to serialize the result of atom '%s' (it"
+                        " will be kept in memory)", atom_name, exc_info=True)
+            return False
+        if len(data) < threshold:
+            return False
+        digest = self._blob_store.put(data)
+        clone = source.copy_with()
+        clone.results = blobs.make_reference(digest, len(data))
+        self._save_atom_detail(source, clone)
+        return True
+
     @fasteners.write_locked
     def save_retry_failure(self, retry_name, failed_atom_name, failure):
         """Save subflow failure to retry controller history."""
@@ -659,7 +923,7 @@ class Storage(object):
         else:
             if failed_atom_name not in failures:
                 failures[failed_atom_name] = failure
-                self._with_connection(self._save_atom_detail, source, clone)
+                self._save_atom_detail(source, clone)
 
     @fasteners.write_locked
     def cleanup_retry_history(self, retry_name, state):
@@ -668,12 +932,12 @@ class Storage(object):
             retry_name, expected_type=models.RetryDetail, clone=True)
         clone.state = state
         clone.results = []
-        self._with_connection(self._save_atom_detail, source, clone)
+        self._save_atom_detail(source, clone)
 
     @fasteners.read_locked
     def _get(self, atom_name,
              results_attr_name, fail_attr_name,
-             allowed_states, fail_cache_key):
+             allowed_states, fail_cache_key, loaded=None):
         source, _clone = self._atomdetail_by_name(atom_name)
         failure = getattr(source, fail_attr_name)
         if failure is not None:
@@ -697,7 +961,9 @@ class Storage(object):
                                                      source.state,
                                                      allowed_states),
                     state=source.state)
-            return getattr(source, results_attr_name)
+            return self._maybe_load(atom_name,
+                                    getattr(source, results_attr_name),
+                                    loaded=loaded)
 
     def get_execute_result(self, atom_name):
         """Gets the ``execute`` results for an atom from storage."""
@@ -770,11 +1036,12 @@ class Storage(object):
         """Reset atom with given name (if the atom is not in a given state)."""
         if atom_name == self.injector_name:
             return
-        source, clone = self._atomdetail_by_name(atom_name, clone=True)
+        source, _clone = self._atomdetail_by_name(atom_name)
         if source.state == state:
             return
+        clone = source.copy_with()
         clone.reset(state)
-        self._with_connection(self._save_atom_detail, source, clone)
+        self._save_atom_detail(source, clone)
         self._failures[clone.name].clear()
 
     def inject_atom_args(self, atom_name, pairs, transient=True):
@@ -819,13 +1086,12 @@ class Storage(object):
             self._injected_args[atom_name].update(pairs)
 
         def save_persistent():
-            source, clone = self._atomdetail_by_name(atom_name, clone=True)
-            injected = source.meta.get(META_INJECTED)
-            if not injected:
-                injected = {}
+            source, _clone = self._atomdetail_by_name(atom_name)
+            injected = dict(source.meta.get(META_INJECTED) or {})
             injected.update(pairs)
-            clone.meta[META_INJECTED] = injected
-            self._with_connection(self._save_atom_detail, source, clone)
+            meta = dict(source.meta)
+            meta[META_INJECTED] = injected
+            self._save_atom_detail(source, source.copy_with(meta=meta))
 
         with self._lock.write_lock():
             if transient:
@@ -884,9 +1150,12 @@ class Storage(object):
                 clone.results = dict(pairs)
                 clone.state = states.SUCCESS
             else:
-                clone.results.update(pairs)
-            result = self._with_connection(self._save_atom_detail,
-                                           source, clone)
+                # Replaced (not altered in-place) so that the change is
+                # noticed (and saved).
+                results = dict(clone.results)
+                results.update(pairs)
+                clone.results = results
+            result = self._save_atom_detail(source, clone)
             return (self.injector_name, six.iterkeys(result.results))
 
         def save_transient():
@@ -914,6 +1183,23 @@ class Storage(object):
                 atom_providers.append(p)
         return default_providers, atom_providers
 
+    def _fetch_plan(self, locator, atom_name, looking_for, scope_walker):
+        """Returns the (cached) providers search plan for an atoms argument.
+
+        The scope an atom can see never changes after compilation, so the
+        visible providers (and their search order) only need to be worked out
+        once per atom and name (and again only if new providers appear).
+        """
+        key = (atom_name, looking_for)
+        try:
+            version, plan = self._fetch_plans[key]
+        except KeyError:
+            version, plan = (None, None)
+        if version != self._providers_version:
+            plan = locator.plan(looking_for, scope_walker=scope_walker)
+            self._fetch_plans[key] = (self._providers_version, plan)
+        return plan
+
     def _set_result_mapping(self, provider_name, mapping):
         """Sets the result mapping for a given producer.
 
@@ -931,6 +1217,7 @@ class Storage(object):
                 provider = _Provider(provider_name, index)
                 if provider not in entries:
                     entries.append(provider)
+                    self._providers_version += 1
 
     @fasteners.read_locked
     def fetch(self, name, many_handler=None):
@@ -942,6 +1229,9 @@ class Storage(object):
             return values[0]
         if many_handler is None:
             many_handler = _many_handler
+        return self._fetch(name, many_handler)
+
+    def _fetch(self, name, many_handler, loaded=None):
         try:
             maybe_providers = self._reverse_mapping[name]
         except KeyError:
@@ -953,7 +1243,8 @@ class Storage(object):
                               providers=maybe_providers),
             lambda atom_name:
                 self._get(atom_name, 'last_results', 'failure',
-                          _EXECUTE_STATES_WITH_RESULTS, states.EXECUTE))
+                          _EXECUTE_STATES_WITH_RESULTS, states.EXECUTE,
+                          loaded=loaded))
         values = []
         searched_providers, providers = locator.find(
             name, short_circuit=False,
@@ -985,6 +1276,9 @@ class Storage(object):
         source, _clone = self._atomdetail_by_name(atom_name)
         if scope_walker is None:
             scope_walker = self._scope_fetcher(atom_name)
+            use_plans = scope_walker is not None
+        else:
+            use_plans = False
         if optional_args is None:
             optional_args = []
         injected_sources = [
@@ -1011,8 +1305,14 @@ class Storage(object):
                     continue
                 if name in source:
                     maybe_providers += 1
+            if use_plans:
+                plan = self._fetch_plan(locator, atom_name,
+                                        name, scope_walker)
+            else:
+                plan = None
             maybe_providers += len(
-                locator.find_potentials(name, scope_walker=scope_walker))
+                locator.find_potentials(name, scope_walker=scope_walker,
+                                        plan=plan))
             if maybe_providers:
                 LOG.trace("Atom '%s' will have %s potential providers"
                           " of %r <= %r", atom_name, maybe_providers,
@@ -1030,9 +1330,13 @@ class Storage(object):
         if many_handler is None:
             many_handler = _many_handler
         results = {}
+        # Results (of many names) that are in the blob store are only
+        # loaded from it once.
+        loaded = {}
         for name in six.iterkeys(self._reverse_mapping):
             try:
-                results[name] = self.fetch(name, many_handler=many_handler)
+                results[name] = self._fetch(name, many_handler,
+                                            loaded=loaded)
             except exceptions.NotFound:
                 pass
         return results
@@ -1052,6 +1356,7 @@ class Storage(object):
             raise KeyError(name)
         if optional_args is None:
             optional_args = []
+        use_plans = False
         if atom_name:
             source, _clone = self._atomdetail_by_name(atom_name)
             injected_sources = [
@@ -1060,13 +1365,20 @@ class Storage(object):
             ]
             if scope_walker is None:
                 scope_walker = self._scope_fetcher(atom_name)
+                use_plans = scope_walker is not None
         else:
             injected_sources = []
         if not args_mapping:
             return {}
+        # Results (bound to many arguments) that are in the blob store are
+        # only loaded from it once.
+        loaded = {}
         get_results = lambda atom_name: \
             self._get(atom_name, 'last_results', 'failure',
-                      _EXECUTE_STATES_WITH_RESULTS, states.EXECUTE)
+                      _EXECUTE_STATES_WITH_RESULTS, states.EXECUTE,
+                      loaded=loaded)
+        locator = _ProviderLocator(self._transients,
+                                   self._fetch_providers, get_results)
         mapped_args = {}
         for (bound_name, name) in six.iteritems(args_mapping):
             if LOG.isEnabledFor(logging.TRACE):
@@ -1089,9 +1401,7 @@ class Storage(object):
                                   " atom-specific persistent"
                                   " values)", bound_name, name, value)
             except KeyError:
-                try:
-                    maybe_providers = self._reverse_mapping[name]
-                except KeyError:
+                if name not in self._reverse_mapping:
                     if bound_name in optional_args:
                         LOG.trace("Argument %r is optional, skipping",
                                   bound_name)
@@ -1099,12 +1409,13 @@ class Storage(object):
                     raise exceptions.NotFound("Name %r is not mapped as a"
                                               " produced output by any"
                                               " providers" % name)
-                locator = _ProviderLocator(
-                    self._transients,
-                    functools.partial(self._fetch_providers,
-                                      providers=maybe_providers), get_results)
+                if use_plans:
+                    plan = self._fetch_plan(locator, atom_name,
+                                            name, scope_walker)
+                else:
+                    plan = None
                 searched_providers, providers = locator.find(
-                    name, scope_walker=scope_walker)
+                    name, scope_walker=scope_walker, plan=plan)
                 if not providers:
                     raise exceptions.NotFound(
                         "Mapped argument %r <= %r was not produced"
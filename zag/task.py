@@ -42,6 +42,10 @@ REVERT_FLOW_FAILURES = 'flow_failures'
 # Common events
 EVENT_UPDATE_PROGRESS = 'update_progress'
 
+# Emitted (by the executor running the task) with what the profiler
+# collected when the engine asked for the task to be profiled.
+EVENT_PROFILED = 'profiled'
+
 
 @six.add_metaclass(abc.ABCMeta)
 class Task(atom.Atom):
@@ -57,17 +61,29 @@ class Task(atom.Atom):
     # are not in this set/tuple will not be able to be bound); this should be
     # updated and/or extended in subclasses as needed to enable or disable new
     # or existing internal events...
-    TASK_EVENTS = (EVENT_UPDATE_PROGRESS,)
+    TASK_EVENTS = (EVENT_UPDATE_PROGRESS, EVENT_PROFILED)
+
+    cacheable = False
+    """If the result of executing instances of this class only depends on
+    the arguments they are given (and executing them has no side-effects
+    that matter) then engines that have been given a result cache will
+    reuse results previously cached (for tasks of the same class and
+    version given the same arguments) instead of executing them again.
+    """
 
     def __init__(self, name=None, provides=None, requires=None,
                  auto_extract=True, rebind=None, inject=None,
-                 ignore_list=None, revert_rebind=None, revert_requires=None):
+                 ignore_list=None, revert_rebind=None, revert_requires=None,
+                 resources=None, timeout=None, cacheable=None):
         if name is None:
             name = reflection.get_class_name(self)
+        if cacheable is not None:
+            self.cacheable = bool(cacheable)
         super(Task, self).__init__(name, provides=provides, requires=requires,
                                    auto_extract=auto_extract, rebind=rebind,
                                    inject=inject, revert_rebind=revert_rebind,
-                                   revert_requires=revert_requires)
+                                   revert_requires=revert_requires,
+                                   resources=resources, timeout=timeout)
         self._notifier = notifier.RestrictedNotifier(self.TASK_EVENTS)
 
     @property
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+# Coroutine tasks used by the asyncio engine tests; this module uses python 3
+# only syntax, so it must only be imported when running on python 3.
+
+import asyncio
+import threading
+
+from zag import task
+
+
+class SleepyTask(task.Task):
+    async def execute(self, delay=0.01):
+        await asyncio.sleep(delay)
+        return threading.current_thread().ident
+
+
+class FailingSleepyTask(task.Task):
+    async def execute(self):
+        await asyncio.sleep(0)
+        raise RuntimeError('Woot!')
+
+    async def revert(self, *args, **kwargs):
+        await asyncio.sleep(0)
+        self.reverted = True
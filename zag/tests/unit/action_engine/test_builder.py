@@ -16,6 +16,8 @@
 
 from automaton import exceptions as excp
 from automaton import runners
+import futurist
+from futurist import waiters
 import six
 
 from zag.engines.action_engine import builder
@@ -26,6 +28,7 @@ from zag.patterns import linear_flow as lf
 from zag import states as st
 from zag import storage
 from zag import test
+from zag.test import mock
 from zag.tests import utils as test_utils
 from zag.types import notifier
 from zag.utils import persistence_utils as pu
@@ -33,7 +36,7 @@ from zag.utils import persistence_utils as pu
 
 class BuildersTest(test.TestCase):
 
-    def _make_runtime(self, flow, initial_state=None):
+    def _make_runtime(self, flow, initial_state=None, options=None):
         compilation = compiler.PatternCompiler(flow).compile()
         flow_detail = pu.create_flow_detail(flow)
         store = storage.Storage(flow_detail)
@@ -50,12 +53,13 @@ class BuildersTest(test.TestCase):
         self.addCleanup(task_executor.stop)
         r = runtime.Runtime(compilation, store,
                             atom_notifier, task_executor,
-                            retry_executor)
+                            retry_executor, options=options)
         r.compile()
         return r
 
-    def _make_machine(self, flow, initial_state=None):
-        runtime = self._make_runtime(flow, initial_state=initial_state)
+    def _make_machine(self, flow, initial_state=None, options=None):
+        runtime = self._make_runtime(flow, initial_state=initial_state,
+                                     options=options)
         machine, memory = runtime.builder.build({})
         machine_runner = runners.FiniteRunner(machine)
         return (runtime, machine, memory, machine_runner)
@@ -309,3 +313,74 @@ class BuildersTest(test.TestCase):
         self.assertEqual(0, len(memory.next_up))
         self.assertEqual(0, len(memory.not_done))
         self.assertEqual(0, len(memory.failures))
+
+    def _run_waiting_with(self, strategy):
+        flow = lf.Flow("root")
+        flow.add(*test_utils.make_many(
+            2, task_cls=test_utils.TaskNoRequiresNoReturns))
+        options = {}
+        if strategy is not None:
+            options['waiting_strategy'] = strategy
+        with mock.patch.object(waiters, 'wait_for_any',
+                               side_effect=waiters.wait_for_any) as m:
+            runtime, machine, memory, machine_runner = self._make_machine(
+                flow, initial_state=st.RUNNING, options=options)
+            transitions = list(machine_runner.run_iter(builder.START))
+        self.assertEqual((builder.GAME_OVER, st.SUCCESS), transitions[-1])
+        return m.call_count
+
+    def test_waits_with_futurist_by_default(self):
+        self.assertEqual(2, self._run_waiting_with(None))
+        self.assertEqual(2, self._run_waiting_with(builder.WAITING_FUTURIST))
+
+    def test_waits_with_completion_queue(self):
+        self.assertEqual(0, self._run_waiting_with(builder.WAITING_QUEUE))
+
+    def test_unknown_waiting_strategy(self):
+        runtime = self._make_runtime(lf.Flow("root"),
+                                     options={'waiting_strategy': 'bad'})
+        self.assertRaises(ValueError, getattr, runtime, 'builder')
+
+
+class CompletionQueueTest(test.TestCase):
+
+    def test_wait_returns_finished(self):
+        q = builder.CompletionQueue()
+        f1 = futurist.Future()
+        f2 = futurist.Future()
+        q.watch(f1)
+        q.watch(f2)
+        f2.set_result(2)
+        done, not_done = q.wait(set([f1, f2]), timeout=0)
+        self.assertEqual(set([f2]), done)
+        self.assertEqual(set([f1]), not_done)
+        f1.set_result(1)
+        done, not_done = q.wait(not_done, timeout=0)
+        self.assertEqual(set([f1]), done)
+        self.assertEqual(set(), not_done)
+
+    def test_wait_timeout(self):
+        q = builder.CompletionQueue()
+        f = futurist.Future()
+        q.watch(f)
+        done, not_done = q.wait(set([f]), timeout=0.01)
+        self.assertEqual(set(), done)
+        self.assertEqual(set([f]), not_done)
+
+    def test_already_finished(self):
+        q = builder.CompletionQueue()
+        f = futurist.Future()
+        f.set_result(1)
+        q.watch(f)
+        done, not_done = q.wait(set([f]), timeout=0)
+        self.assertEqual(set([f]), done)
+        self.assertEqual(set(), not_done)
+
+    def test_wakes_up_from_other_thread(self):
+        q = builder.CompletionQueue()
+        with futurist.ThreadPoolExecutor(1) as e:
+            f = e.submit(lambda: 1)
+            q.watch(f)
+            done, not_done = q.wait(set([f]), timeout=10)
+        self.assertEqual(set([f]), done)
+        self.assertEqual(set(), not_done)
@@ -625,3 +625,73 @@ class PatternCompileTest(test.TestCase):
         self.assertIs(c1, g.node['b']['retry'])
         self.assertIs(c1, g.node['c']['retry'])
         self.assertIsNone(g.node['c1'].get('retry'))
+
+
+class CompilationCacheTest(test.TestCase):
+
+    @staticmethod
+    def _make_flow(decider_result=True):
+        c1 = retry.AlwaysRevert("c1")
+        a, b, c, d = test_utils.make_many(4)
+        inner_flo = gf.Flow("test2").add(b, c)
+        inner_flo.link(b, c, decider=lambda history: decider_result)
+        flo = lf.Flow("test", c1).add(a, inner_flo, d)
+        return flo, dict((atom.name, atom) for atom in (c1, a, b, c, d,
+                                                        inner_flo))
+
+    def test_same_structure_is_rebound(self):
+        cache = compiler.CompilationCache()
+        flo, _atoms = self._make_flow()
+        compilation = cache.compile(flo)
+        flo2, atoms2 = self._make_flow(decider_result=False)
+        compilation2 = cache.compile(flo2)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+        g = _replicate_graph_with_names(compilation)
+        g2 = _replicate_graph_with_names(compilation2)
+        self.assertItemsEqual(g.nodes(), g2.nodes())
+        self.assertItemsEqual(g.edges(), g2.edges())
+
+        # Everything must now refer to the second flow (and its atoms).
+        graph2 = compilation2.execution_graph
+        for node in graph2.nodes_iter():
+            if isinstance(node, compiler.Terminator):
+                self.assertIn(node.flow, (flo2, atoms2['test2']))
+            elif node is not flo2:
+                self.assertIs(atoms2[node.name], node)
+        self.assertIs(flo2.retry, graph2.node[atoms2['a']]['retry'])
+        decider = graph2.adj[atoms2['b']][atoms2['c']]['decider']
+        self.assertFalse(decider([]))
+        self.assertIs(flo2, compilation2.hierarchy.item)
+        self.assertIsNotNone(compilation2.hierarchy.find(atoms2['c']))
+
+    def test_different_structure_not_reused(self):
+        cache = compiler.CompilationCache()
+        cache.compile(self._make_flow()[0])
+        flo = lf.Flow("test").add(*test_utils.make_many(4))
+        compilation = cache.compile(flo)
+        self.assertEqual(0, cache.hits)
+        self.assertEqual(2, len(cache))
+        self.assertEqual(6, len(compilation.execution_graph))
+
+    def test_least_recently_used_discarded(self):
+        cache = compiler.CompilationCache(max_size=1)
+        cache.compile(lf.Flow("test"))
+        cache.compile(lf.Flow("test2"))
+        self.assertEqual(1, len(cache))
+        cache.compile(lf.Flow("test2"))
+        self.assertEqual(1, cache.hits)
+
+    def test_engines_share_cache(self):
+        cache = compiler.CompilationCache()
+        for _i in range(0, 2):
+            flo = lf.Flow("test").add(
+                test_utils.ProvidesRequiresTask('a', provides=['x'],
+                                                requires=[]),
+                test_utils.ProvidesRequiresTask('b', provides=['y'],
+                                                requires=['x']))
+            e = engines.load(flo, compilation_cache=cache)
+            e.run()
+            self.assertEqual({'x': 0, 'y': 0}, e.storage.fetch_all())
+        self.assertEqual(1, cache.hits)
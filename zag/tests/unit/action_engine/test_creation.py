@@ -67,7 +67,7 @@ class ParallelCreationTest(test.TestCase):
         with futurist.GreenThreadPoolExecutor(1) as e:
             eng = self._create_engine(executor=e)
             self.assertIsInstance(eng._task_executor,
-                                  executor.ParallelThreadTaskExecutor)
+                                  executor.ParallelGreenThreadTaskExecutor)
 
     def test_sync_executor_creation(self):
         with futurist.SynchronousExecutor() as e:
@@ -75,6 +75,14 @@ class ParallelCreationTest(test.TestCase):
             self.assertIsInstance(eng._task_executor,
                                   executor.ParallelThreadTaskExecutor)
 
+    def test_shared_executor_creation(self):
+        eng = self._create_engine(executor='processes',
+                                  shared_executor='pool',
+                                  shared_executor_grace_period='0.5')
+        self.assertIsInstance(eng._task_executor,
+                              executor.SharedTaskExecutor)
+        self.assertEqual('pool', eng._task_executor.name)
+
     def test_invalid_creation(self):
         self.assertRaises(ValueError, self._create_engine, executor='crap')
         self.assertRaises(TypeError, self._create_engine, executor=2)
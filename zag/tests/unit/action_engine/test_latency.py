@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import futurist
+
+from zag import engines
+from zag.engines.action_engine import latency
+from zag.patterns import linear_flow as lf
+from zag import test
+from zag.tests import utils as test_utils
+
+
+class HistogramTest(test.TestCase):
+
+    def test_empty(self):
+        h = latency.Histogram()
+        self.assertEqual(0, h.count)
+        self.assertIsNone(h.mean)
+        self.assertIsNone(h.percentile(50))
+        self.assertEqual([], h.buckets())
+
+    def test_record(self):
+        h = latency.Histogram(bounds=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            h.record(value)
+        self.assertEqual(4, h.count)
+        self.assertAlmostEqual(6.05, h.total)
+        self.assertEqual(0.05, h.minimum)
+        self.assertEqual(5.0, h.maximum)
+        self.assertEqual([(0.1, 1), (1.0, 2), (float('inf'), 1)],
+                         h.buckets())
+        self.assertEqual(1.0, h.percentile(50))
+        self.assertEqual(5.0, h.percentile(100))
+        summary = h.to_dict()
+        self.assertEqual(4, summary['count'])
+        self.assertEqual(1.0, summary['p50'])
+
+    def test_percentile_capped_by_maximum(self):
+        h = latency.Histogram(bounds=(1.0,))
+        h.record(0.25)
+        self.assertEqual(0.25, h.percentile(99))
+
+
+class LatencyEngineTest(test.TestCase):
+
+    def _make_flow(self):
+        return lf.Flow('flow').add(
+            test_utils.TaskNoRequiresNoReturns('a'),
+            test_utils.TaskNoRequiresNoReturns('b'),
+            test_utils.TaskNoRequiresNoReturns('c'))
+
+    def _check_latencies(self, engine, count):
+        latencies = engine.statistics['latencies']
+        for name, _start, _end in latency.LATENCIES:
+            self.assertEqual(count, latencies[name].count)
+            self.assertLessEqual(0.0, latencies[name].minimum)
+
+    def test_serial(self):
+        engine = engines.load(self._make_flow(), engine='serial')
+        engine.run()
+        self._check_latencies(engine, 3)
+
+    def test_parallel(self):
+        with futurist.ThreadPoolExecutor(2) as executor:
+            engine = engines.load(self._make_flow(), engine='parallel',
+                                  executor=executor)
+            engine.run()
+        self._check_latencies(engine, 3)
+
+    def test_saved_timings(self):
+        engine = engines.load(self._make_flow(), engine='serial',
+                              atom_timings=True)
+        engine.run()
+        for name in ('a', 'b', 'c'):
+            meta = engine.storage.get_atom_metadata(name)
+            timings = meta[latency.META_TIMINGS]
+            self.assertEqual(set([latency.READY, latency.SCHEDULED,
+                                  latency.STARTED, latency.FINISHED,
+                                  latency.PERSISTED]), set(timings))
+            self.assertLessEqual(timings[latency.READY],
+                                 timings[latency.STARTED])
+            self.assertLessEqual(timings[latency.STARTED],
+                                 timings[latency.FINISHED])
+
+    def test_not_gathered(self):
+        engine = engines.load(self._make_flow(), engine='serial',
+                              gather_statistics=False, atom_timings=True)
+        engine.run()
+        self.assertNotIn('latencies', engine.statistics)
+        meta = engine.storage.get_atom_metadata('a')
+        self.assertNotIn(latency.META_TIMINGS, meta)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from zag import engines
+from zag.patterns import linear_flow as lf
+from zag.persistence import blobs
+from zag import retry
+from zag import states
+from zag import task
+from zag import test
+from zag.tests import utils as test_utils
+
+
+class Produce(task.Task):
+    def execute(self):
+        return list(range(0, 100))
+
+    def revert(self, result, **kwargs):
+        self.reverted_with = result
+
+
+class Transform(task.Task):
+    def execute(self, value):
+        return [v * 2 for v in value]
+
+
+class Consume(task.Task):
+    def execute(self, value):
+        return sum(value)
+
+
+class ResultReleaseTest(test.TestCase):
+
+    def _make_flow(self):
+        return lf.Flow('flow').add(
+            Produce('a', provides='x'),
+            Transform('b', provides='y', rebind={'value': 'x'}),
+            Consume('c', provides='z', rebind={'value': 'y'}))
+
+    def _is_released(self, engine, atom_name):
+        atom_uuid = engine.storage.get_atom_uuid(atom_name)
+        atom_detail = engine.storage._flowdetail.find(atom_uuid)
+        return blobs.is_reference(atom_detail.results)
+
+    def test_released(self):
+        engine = engines.load(self._make_flow(), engine='serial',
+                              release_results=True, release_threshold=1,
+                              blob_store=blobs.MemoryBlobStore())
+        released_before_c = []
+
+        def on_running(state, details):
+            if details['task_name'] == 'c':
+                released_before_c.append(self._is_released(engine, 'a'))
+                released_before_c.append(self._is_released(engine, 'b'))
+
+        engine.atom_notifier.register(states.RUNNING, on_running)
+        engine.run()
+        # Once 'b' finished nothing needs 'a' anymore (but 'c' needs 'b').
+        self.assertEqual([True, False], released_before_c)
+        for name in ('a', 'b', 'c'):
+            self.assertTrue(self._is_released(engine, name))
+        self.assertEqual(3, engine.statistics['released_results'])
+        self.assertEqual(list(range(0, 100)), engine.storage.fetch('x'))
+        self.assertEqual(9900, engine.storage.fetch('z'))
+
+    def test_released_result_used_by_revert(self):
+        producer = Produce('a', provides='x')
+        flow = lf.Flow('flow').add(
+            producer,
+            Transform('b', provides='y', rebind={'value': 'x'}),
+            test_utils.FailingTask('fail'))
+        engine = engines.load(flow, engine='serial', release_results=True,
+                              release_threshold=1,
+                              blob_store=blobs.MemoryBlobStore())
+        self.assertRaises(RuntimeError, engine.run)
+        self.assertEqual(list(range(0, 100)), producer.reverted_with)
+
+    def test_not_released_under_retry(self):
+        flow = lf.Flow('flow', retry=retry.Times(2)).add(self._make_flow())
+        engine = engines.load(flow, engine='serial', release_results=True,
+                              release_threshold=1,
+                              blob_store=blobs.MemoryBlobStore())
+        engine.run()
+        for name in ('a', 'b', 'c'):
+            self.assertFalse(self._is_released(engine, name))
+        self.assertEqual(0, engine.statistics['released_results'])
+
+    def test_small_results_not_released(self):
+        blob_store = blobs.MemoryBlobStore()
+        engine = engines.load(self._make_flow(), engine='serial',
+                              release_results=True, blob_store=blob_store)
+        engine.run()
+        for name in ('a', 'b', 'c'):
+            self.assertFalse(self._is_released(engine, name))
+        self.assertEqual(0, len(blob_store))
+        self.assertEqual(0, engine.statistics['released_results'])
+
+    def test_not_released_by_default(self):
+        engine = engines.load(self._make_flow(), engine='serial',
+                              blob_store=blobs.MemoryBlobStore())
+        engine.run()
+        self.assertFalse(self._is_released(engine, 'a'))
+        self.assertNotIn('released_results', engine.statistics)
+
+    def test_requires_blob_store(self):
+        engine = engines.load(self._make_flow(), engine='serial',
+                              release_results=True)
+        self.assertRaises(ValueError, engine.compile)
@@ -14,11 +14,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import asyncore
 import errno
+import pickle
 import socket
 import threading
 
+import futurist
+
 from zag.engines.action_engine import process_executor as pu
 from zag import task
 from zag import test
@@ -46,17 +48,106 @@ class ProcessExecutorHelpersTest(test.TestCase):
         in_data = b"".join(pu._encode_message(b"secret", ['hi'], b'me'))
         self.assertRaises(pu.BadHmacValueError, r.feed, in_data)
 
+    def test_parse_modules(self):
+        self.assertEqual(['a', 'b.c'], pu._parse_modules("a, b.c,"))
+        self.assertEqual(['a'], pu._parse_modules(['a', ' ']))
+
+    def test_task_cache(self):
+        self.addCleanup(pu._task_cache.clear)
+        specs = []
+        for name in ('a', 'b', 'c'):
+            blob = pickle.dumps(test_utils.DummyTask(name))
+            specs.append(pu._TaskSpec('zag.tests.utils.DummyTask', name,
+                                      '1.0', name, blob))
+        a = pu._fetch_task(specs[0], 2)
+        self.assertEqual('a', a.name)
+        # Each run gets its own copy (even when it is cached).
+        a_again = pu._fetch_task(specs[0]._replace(blob=None), 2)
+        self.assertEqual('a', a_again.name)
+        self.assertIsNot(a, a_again)
+        pu._fetch_task(specs[1], 2)
+        pu._fetch_task(specs[0], 2)
+        # The least recently used one ('b') is the one evicted.
+        pu._fetch_task(specs[2], 2)
+        self.assertEqual(['a', 'c'], list(pu._task_cache))
+        self.assertRaises(pu._SpecMissing, pu._fetch_task,
+                          specs[1]._replace(blob=None), 2)
+
+    def test_missing_spec_resent(self):
+        self.addCleanup(pu._task_cache.clear)
+        blob = pickle.dumps(test_utils.DummyTask('a'))
+        spec = pu._TaskSpec('zag.tests.utils.DummyTask', 'a', '1.0',
+                            'a-digest', blob)
+        sent = []
+
+        def submit(spec):
+            sent.append(spec.blob)
+            fut = futurist.Future()
+            try:
+                fut.set_result(pu._run_cached_task(
+                    2, spec, None, lambda task: task.name))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+
+        self.assertEqual('a', pu._SpecFuture(submit, spec).result())
+        self.assertEqual([None, blob], sent)
+        # Now that it is cached the blob does not have to be sent.
+        del sent[:]
+        self.assertEqual('a', pu._SpecFuture(submit, spec).result())
+        self.assertEqual([None], sent)
+
+    def test_altered_task_respecified(self):
+        executor = pu.ParallelProcessTaskExecutor(task_cache_size=2)
+        t = test_utils.DummyTask('a')
+        spec, is_new = executor._fetch_spec(t)
+        self.assertTrue(is_new)
+        self.assertEqual((spec, False), executor._fetch_spec(t))
+        t.requires = frozenset(['x'])
+        altered_spec, is_new = executor._fetch_spec(t)
+        self.assertTrue(is_new)
+        self.assertEqual(spec.version, altered_spec.version)
+        self.assertNotEqual(spec.digest, altered_spec.digest)
+        self.assertEqual(frozenset(['x']),
+                         pickle.loads(altered_spec.blob).requires)
+
     @mock.patch("socket.socket")
     def test_no_connect_channel(self, mock_socket_factory):
         mock_sock = mock.MagicMock()
         mock_socket_factory.return_value = mock_sock
         mock_sock.connect.side_effect = socket.error(errno.ECONNREFUSED,
                                                      'broken')
-        c = pu.Channel(2222, b"me", b"secret")
-        self.assertRaises(socket.error, c.send, "hi")
+        c = pu.Channel((socket.AF_INET, ('127.0.0.1', 2222)),
+                       b"me", b"secret")
+        c.sync()
         self.assertTrue(c.dead)
         self.assertTrue(mock_sock.close.called)
 
+    def _start_dispatcher(self, identity):
+        d = pu.Dispatcher(b'secret', identity)
+        d.setup()
+        s = threading.Thread(target=d.run, args=(0.01,))
+        s.start()
+        self.addCleanup(s.join)
+        self.addCleanup(d.close)
+        return d
+
+    def _fetch_channel(self, d):
+        self.addCleanup(pu._channels.pop, (d.address, b'secret'), None)
+        c = pu._fetch_channel(d.address, b'secret')
+        self.addCleanup(c.close)
+        return c
+
+    def test_stale_channels_closed(self):
+        d = self._start_dispatcher(b'server-josh')
+        c = self._fetch_channel(d)
+        # The dispatcher restarting means a new address is used.
+        d2 = self._start_dispatcher(b'server-josh')
+        c2 = self._fetch_channel(d2)
+        self.assertIsNot(c, c2)
+        self.assertTrue(c._closed)
+        self.assertEqual([(d2.address, b'secret')], list(pu._channels))
+
     def test_send_and_dispatch(self):
         details_capture = []
 
@@ -65,16 +156,9 @@ class ProcessExecutorHelpersTest(test.TestCase):
             task.EVENT_UPDATE_PROGRESS,
             lambda _event_type, details: details_capture.append(details))
 
-        d = pu.Dispatcher({}, b'secret', b'server-josh')
-        d.setup()
-        d.targets[b'child-josh'] = t
-
-        s = threading.Thread(target=asyncore.loop, kwargs={'map': d.map})
-        s.start()
-        self.addCleanup(s.join)
-
-        c = pu.Channel(d.port, b'child-josh', b'secret')
-        self.addCleanup(c.close)
+        d = self._start_dispatcher(b'server-josh')
+        d.targets['child-josh'] = t
+        c = self._fetch_channel(d)
 
         send_what = [
             {'progress': 0.1},
@@ -87,13 +171,62 @@ class ProcessExecutorHelpersTest(test.TestCase):
             {'progress': 0.8},
             {'progress': 0.9},
         ]
-        e_s = pu.EventSender(c)
+        e_s = pu.EventSender(d.address, b'secret', 'child-josh')
         for details in send_what:
             e_s(task.EVENT_UPDATE_PROGRESS, details)
 
-        # This forces the thread to shutdown (since the asyncore loop
-        # will exit when no more sockets exist to process...)
-        d.close()
+        # Once synced all sent events must have been dispatched.
+        c.sync()
+        self.assertFalse(c.dead)
 
         self.assertEqual(len(send_what), len(details_capture))
         self.assertEqual(send_what, details_capture)
+
+    def test_events_proxied_from_child(self):
+        progress_capture = []
+
+        def on_progress(event_type, details):
+            progress_capture.append(details['progress'])
+
+        executor = pu.ParallelProcessTaskExecutor(max_workers=1)
+        executor.start()
+        self.addCleanup(executor.stop)
+        t = test_utils.ProgressingTask('a')
+        fut = executor.execute_task(t, 'a-uuid', {},
+                                    progress_callback=on_progress)
+        outcome, result = fut.result()
+        self.assertEqual(5, result)
+        # The events were sent (and authenticated) over a real channel.
+        self.assertEqual([0.0, 1.0], progress_capture)
+
+    def test_many_targets_share_channel(self):
+        captures = {}
+
+        d = self._start_dispatcher(b'server-josh')
+        senders = []
+        for i in range(0, 3):
+            t = test_utils.DummyTask("rcver-%s" % i)
+            capture = captures.setdefault(t.name, [])
+            t.notifier.register(
+                task.EVENT_UPDATE_PROGRESS,
+                lambda _event_type, details, capture=capture:
+                    capture.append(details['progress']))
+            d.targets['child-%s' % i] = t
+            senders.append(pu.EventSender(d.address, b'secret',
+                                          'child-%s' % i))
+        c = self._fetch_channel(d)
+
+        # Enough events so that some are sent in full batches.
+        events_per_target = pu.Channel.BATCH_SIZE
+        for progress in range(0, events_per_target):
+            for e_s in senders:
+                e_s(task.EVENT_UPDATE_PROGRESS,
+                    {'progress': float(progress)})
+        c.sync()
+
+        # All of them went over the one (and only) connection made.
+        self.assertIs(c, pu._fetch_channel(d.address, b'secret'))
+        self.assertFalse(c.dead)
+        expected = [float(p) for p in range(0, events_per_target)]
+        for i in range(0, 3):
+            self.assertEqual(expected, captures["rcver-%s" % i])
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import futurist
+import six
+
+from zag import engines
+from zag.engines.action_engine import profiling
+from zag.patterns import linear_flow as lf
+from zag.persistence import blobs
+from zag import task
+from zag import test
+from zag.tests import utils as test_utils
+
+
+def _busy_work():
+    return sum(i * i for i in six.moves.range(0, 1000))
+
+
+class BusyTask(task.Task):
+    def execute(self):
+        return _busy_work()
+
+
+def _profile_of(func):
+    profile = profiling.new_profile()
+    profile.enable()
+    try:
+        func()
+    finally:
+        profile.disable()
+    return profiling.dumps(profile)
+
+
+def _function_names(stats):
+    return set(func_name for (_path, _line, func_name) in stats.stats)
+
+
+class ProfilingTest(test.TestCase):
+
+    def test_dumps_loads(self):
+        data = _profile_of(_busy_work)
+        self.assertIsInstance(data, six.text_type)
+        stats = profiling.loads(data)
+        self.assertIn('_busy_work', _function_names(stats))
+
+    def test_merge(self):
+        self.assertIsNone(profiling.merge([]))
+        merged = profiling.merge([_profile_of(_busy_work),
+                                  _profile_of(_busy_work)])
+        for (_path, _line, func_name), stat in six.iteritems(merged.stats):
+            if func_name == '_busy_work':
+                # The number of calls (from both profiles).
+                self.assertEqual(2, stat[1])
+                break
+        else:
+            self.fail("Merged profile is missing '_busy_work'")
+
+    def test_selector(self):
+        a = test_utils.NoopTask('busy-a')
+        b = test_utils.NoopTask('other')
+        selector = profiling.Selector('busy-*')
+        self.assertTrue(selector.wants(a))
+        self.assertFalse(selector.wants(b))
+        self.assertFalse(profiling.Selector(['busy-*'], rate=0.0).wants(a))
+        self.assertRaises(ValueError, profiling.Selector, ['busy-*'],
+                          rate=2.0)
+
+
+class ProfilingEngineTest(test.TestCase):
+
+    def _make_flow(self):
+        return lf.Flow('flow').add(BusyTask('busy-1'), BusyTask('busy-2'),
+                                   BusyTask('quiet'))
+
+    def _check_profiles(self, engine):
+        for name in ('busy-1', 'busy-2'):
+            stats = profiling.loads(engine.storage.get_atom_profile(name))
+            self.assertIn('execute', _function_names(stats))
+        self.assertIsNone(engine.storage.get_atom_profile('quiet'))
+
+    def test_serial(self):
+        engine = engines.load(self._make_flow(), engine='serial',
+                              profile_atoms=['busy-*'])
+        engine.run()
+        self._check_profiles(engine)
+
+    def test_threads(self):
+        with futurist.ThreadPoolExecutor(2) as executor:
+            engine = engines.load(self._make_flow(), engine='parallel',
+                                  executor=executor, profile_atoms='busy-*')
+            engine.run()
+        self._check_profiles(engine)
+
+    def test_processes(self):
+        engine = engines.load(self._make_flow(), engine='parallel',
+                              executor='processes', max_workers=1,
+                              profile_atoms=['busy-*'])
+        engine.run()
+        self._check_profiles(engine)
+
+    def test_not_sampled(self):
+        engine = engines.load(self._make_flow(), engine='serial',
+                              profile_atoms=['busy-*'], profile_rate=0.0)
+        engine.run()
+        self.assertIsNone(engine.storage.get_atom_profile('busy-1'))
+
+    def test_saved_in_blob_store(self):
+        store = blobs.MemoryBlobStore()
+        engine = engines.load(self._make_flow(), engine='serial',
+                              profile_atoms=['busy-1'], blob_store=store,
+                              blob_threshold=1)
+        engine.run()
+        meta = engine.storage.get_atom_metadata('busy-1')
+        self.assertTrue(blobs.is_reference(meta['profile']))
+        stats = profiling.loads(engine.storage.get_atom_profile('busy-1'))
+        self.assertIn('execute', _function_names(stats))
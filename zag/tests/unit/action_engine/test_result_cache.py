@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import time
+
+from zag.engines.action_engine import result_cache as rc
+from zag.persistence.backends import impl_memory
+from zag import test
+from zag.test import mock
+from zag.tests import utils as test_utils
+
+
+class MakeKeyTest(test.TestCase):
+
+    def test_same_arguments_same_key(self):
+        t = test_utils.DummyTask(name='a')
+        t2 = test_utils.DummyTask(name='b')
+        self.assertEqual(rc.make_key(t, {'x': 1, 'y': [1, 2]}),
+                         rc.make_key(t2, {'y': [1, 2], 'x': 1}))
+        self.assertNotEqual(rc.make_key(t, {'x': 1}),
+                            rc.make_key(t, {'x': 2}))
+
+    def test_version_changes_key(self):
+        t = test_utils.DummyTask(name='a')
+        t2 = test_utils.DummyTask(name='a')
+        t2.version = (2, 0)
+        self.assertNotEqual(rc.make_key(t, {}), rc.make_key(t2, {}))
+
+    def test_unserializable_arguments(self):
+        t = test_utils.DummyTask(name='a')
+        self.assertIsNone(rc.make_key(t, {'x': object()}))
+
+
+class MemoryCacheTest(test.TestCase):
+
+    def test_least_recently_used_evicted(self):
+        cache = rc.MemoryCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.put('c', 3)
+        self.assertRaises(KeyError, cache.get, 'b')
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        stats = cache.statistics()
+        self.assertEqual(3, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['evictions'])
+        self.assertEqual(2, stats['size'])
+
+    def test_expired(self):
+        cache = rc.MemoryCache(ttl=0.01)
+        cache.put('a', 1)
+        time.sleep(0.05)
+        self.assertRaises(KeyError, cache.get, 'a')
+        self.assertEqual(1, cache.statistics()['expirations'])
+
+    def test_results_copied(self):
+        cache = rc.MemoryCache()
+        result = {'result': [1, 2]}
+        cache.put('a', result)
+        result['result'].append(3)
+        cache.get('a')['result'].append(4)
+        self.assertEqual({'result': [1, 2]}, cache.get('a'))
+
+    def test_bad_size(self):
+        self.assertRaises(ValueError, rc.MemoryCache, max_size=0)
+
+
+class BackendCacheTest(test.TestCase):
+
+    def setUp(self):
+        super(BackendCacheTest, self).setUp()
+        self.backend = impl_memory.MemoryBackend(conf={})
+
+    def test_put_get(self):
+        cache = rc.BackendCache(self.backend)
+        self.assertRaises(KeyError, cache.get, 'a')
+        cache.put('a', {'result': [1, 2]})
+        cache.put('b', 2)
+        # Results are shared through the backend.
+        cache = rc.BackendCache(self.backend)
+        self.assertEqual({'result': [1, 2]}, cache.get('a'))
+        self.assertEqual(2, cache.get('b'))
+        with contextlib.closing(self.backend.get_connection()) as conn:
+            books = list(conn.get_logbooks())
+        self.assertEqual(1, len(books))
+
+    def test_put_existing_saves_only_atom(self):
+        cache = rc.BackendCache(self.backend)
+        cache.put('a', 1)
+        conn_cls = type(self.backend.get_connection())
+        with mock.patch.object(conn_cls, 'update_flow_details') as m:
+            cache.put('a', 2)
+        self.assertFalse(m.called)
+        self.assertEqual(2, cache.get('a'))
+
+    def test_expired(self):
+        cache = rc.BackendCache(self.backend, ttl=0.01)
+        cache.put('a', 1)
+        time.sleep(0.05)
+        self.assertRaises(KeyError, cache.get, 'a')
+
+
+class TieredCacheTest(test.TestCase):
+
+    def test_later_tier_fills_earlier(self):
+        first = rc.MemoryCache()
+        second = rc.MemoryCache()
+        cache = rc.TieredCache(first, second)
+        second.put('a', 1)
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(1, first.get('a'))
+        self.assertRaises(KeyError, cache.get, 'b')
+        stats = cache.statistics()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from zag.engines.action_engine import compiler
+from zag.engines.action_engine import executor
+from zag.engines.action_engine import runtime
+from zag.engines.action_engine import scheduler as sched
+from zag.patterns import linear_flow as lf
+from zag import retry
+from zag import states as st
+from zag import storage
+from zag import test
+from zag.tests import utils as test_utils
+from zag.types import notifier
+from zag.utils import persistence_utils as pu
+
+
+class DurationHistoryTest(test.TestCase):
+
+    def test_moving_average(self):
+        h = sched.DurationHistory(alpha=0.5)
+        t = test_utils.DummyTask(name='a')
+        self.assertIsNone(h.estimate(t))
+        h.record(t, 2.0)
+        self.assertEqual(2.0, h.estimate(t))
+        h.record(t, 4.0)
+        self.assertEqual(3.0, h.estimate(t))
+        self.assertEqual(1, len(h))
+
+    def test_versions_kept_apart(self):
+        h = sched.DurationHistory()
+        t = test_utils.DummyTask(name='a')
+        t2 = test_utils.DummyTask(name='a')
+        t2.version = (2, 0)
+        h.record(t, 2.0)
+        self.assertIsNone(h.estimate(t2))
+
+    def test_bad_alpha(self):
+        self.assertRaises(ValueError, sched.DurationHistory, alpha=0)
+        self.assertRaises(ValueError, sched.DurationHistory, alpha=1.5)
+
+
+class CriticalPathPrioritizerTest(test.TestCase):
+
+    def _make_runtime(self, flow, history):
+        compilation = compiler.PatternCompiler(flow).compile()
+        flow_detail = pu.create_flow_detail(flow)
+        store = storage.Storage(flow_detail)
+        nodes_iter = compilation.execution_graph.nodes_iter(data=True)
+        for node, node_attrs in nodes_iter:
+            if node_attrs['kind'] in ('task', 'retry'):
+                store.ensure_atom(node)
+        return runtime.Runtime(compilation, store,
+                               notifier.Notifier(),
+                               executor.SerialTaskExecutor(),
+                               executor.SerialRetryExecutor(),
+                               options={'scheduling_policy': 'critical_path',
+                                        'duration_history': history})
+
+    def test_recompile_records_once(self):
+        recorded = []
+
+        class RecordingHistory(sched.DurationHistory):
+            def record(self, atom, duration):
+                recorded.append(atom.name)
+                super(RecordingHistory, self).record(atom, duration)
+
+        a = test_utils.DummyTask(name='a')
+        r = self._make_runtime(lf.Flow('root').add(a), RecordingHistory())
+        r.compile()
+        r.compile()
+        r.storage.set_atom_state(a.name, st.RUNNING)
+        r.storage.set_atom_state(a.name, st.SUCCESS)
+        self.assertEqual([a.name], recorded)
+
+
+class ResourceLimiterTest(test.TestCase):
+
+    def test_acquire_release(self):
+        limiter = sched.ResourceLimiter({'db': 2})
+        t1 = test_utils.DummyTask(name='t1')
+        t1.resources = {'db': 1}
+        t2 = test_utils.DummyTask(name='t2')
+        t2.resources = {'db': 2}
+        t3 = test_utils.DummyTask(name='t3')
+        self.assertTrue(limiter.acquire(t1))
+        self.assertFalse(limiter.acquire(t2))
+        self.assertTrue(limiter.acquire(t3))
+        limiter.release(t1)
+        self.assertTrue(limiter.acquire(t2))
+        stats = limiter.statistics()['db']
+        self.assertEqual(2, stats['in_use'])
+        self.assertEqual(2, stats['peak'])
+        self.assertEqual(1, stats['deferred'])
+
+    def test_unlimited_tags_ignored(self):
+        limiter = sched.ResourceLimiter({'db': 1})
+        t = test_utils.DummyTask(name='t')
+        t.resources = {'api': 100}
+        self.assertTrue(limiter.acquire(t))
+        self.assertTrue(limiter.acquire(t))
+        self.assertEqual(['db'], list(limiter.statistics()))
+
+    def test_retry_resources(self):
+        limiter = sched.ResourceLimiter({'db': 1})
+        r = retry.Times(2, name='r', resources={'db': 1})
+        t = test_utils.DummyTask(name='t')
+        t.resources = {'db': 1}
+        self.assertTrue(limiter.acquire(r))
+        self.assertFalse(limiter.acquire(t))
+        limiter.release(r)
+        self.assertTrue(limiter.acquire(t))
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from zag.engines.action_engine import compiler
+from zag.engines.action_engine import executor
+from zag.engines.action_engine import runtime
+from zag.engines.action_engine import selector as se
+from zag.patterns import graph_flow as gf
+from zag.patterns import linear_flow as lf
+from zag.patterns import unordered_flow as uf
+from zag import states as st
+from zag import storage
+from zag import test
+from zag.test import mock
+from zag.tests import utils as test_utils
+from zag.types import notifier
+from zag.utils import persistence_utils as pu
+
+
+class SelectorTest(test.TestCase):
+
+    def _make_runtime(self, flow):
+        compilation = compiler.PatternCompiler(flow).compile()
+        flow_detail = pu.create_flow_detail(flow)
+        store = storage.Storage(flow_detail)
+        nodes_iter = compilation.execution_graph.nodes_iter(data=True)
+        for node, node_attrs in nodes_iter:
+            if node_attrs['kind'] in ('task', 'retry'):
+                store.ensure_atom(node)
+        r = runtime.Runtime(compilation, store,
+                            notifier.Notifier(),
+                            executor.SerialTaskExecutor(),
+                            executor.SerialRetryExecutor())
+        r.compile()
+        r.selector.refresh()
+        return r
+
+    def _names(self, atoms_it):
+        return sorted(atom.name for atom, _decider in atoms_it)
+
+    def test_linear_unblocks_one_at_a_time(self):
+        flow = lf.Flow("root")
+        a, b, c = test_utils.make_many(3)
+        flow.add(a, b, c)
+        r = self._make_runtime(flow)
+        selector = r.selector
+        self.assertEqual(['a'], self._names(selector.iter_next_atoms()))
+
+        r.storage.set_atom_state(a.name, st.RUNNING)
+        r.storage.set_atom_state(a.name, st.SUCCESS)
+        self.assertEqual(['b'], self._names(selector.iter_next_atoms(a)))
+        # Nothing else was unblocked (so nothing else is found).
+        self.assertEqual([], self._names(selector.iter_next_atoms(a)))
+
+    def test_diamond_waits_for_all_predecessors(self):
+        a, b, c, d = test_utils.make_many(4)
+        flow = gf.Flow("root")
+        flow.add(a, b, c, d)
+        flow.link(a, b)
+        flow.link(a, c)
+        flow.link(b, d)
+        flow.link(c, d)
+        r = self._make_runtime(flow)
+        selector = r.selector
+
+        for atom in (a, b):
+            r.storage.set_atom_state(atom.name, st.RUNNING)
+            r.storage.set_atom_state(atom.name, st.SUCCESS)
+        self.assertEqual(['c'], self._names(selector.iter_next_atoms(b)))
+
+        r.storage.set_atom_state(c.name, st.RUNNING)
+        r.storage.set_atom_state(c.name, st.SUCCESS)
+        self.assertEqual(['d'], self._names(selector.iter_next_atoms(c)))
+
+    def test_nested_flows_unblock_through_flow_nodes(self):
+        inner = uf.Flow("inner")
+        inner.add(*test_utils.make_many(3, offset=2))
+        flow = lf.Flow("root")
+        first, last = test_utils.make_many(2)
+        flow.add(first, inner, last)
+        r = self._make_runtime(flow)
+        selector = r.selector
+
+        r.storage.set_atom_state(first.name, st.RUNNING)
+        r.storage.set_atom_state(first.name, st.SUCCESS)
+        self.assertEqual(['c', 'd', 'e'],
+                         self._names(selector.iter_next_atoms(first)))
+        inner_atoms = list(inner)
+        for atom in inner_atoms[0:2]:
+            r.storage.set_atom_state(atom.name, st.RUNNING)
+            r.storage.set_atom_state(atom.name, st.SUCCESS)
+            self.assertEqual([], self._names(selector.iter_next_atoms(atom)))
+        r.storage.set_atom_state(inner_atoms[-1].name, st.RUNNING)
+        r.storage.set_atom_state(inner_atoms[-1].name, st.SUCCESS)
+        self.assertEqual([last.name], self._names(
+            selector.iter_next_atoms(inner_atoms[-1])))
+
+    def test_revert_waits_for_successors(self):
+        flow = lf.Flow("root")
+        a, b = test_utils.make_many(2)
+        flow.add(a, b)
+        r = self._make_runtime(flow)
+        selector = r.selector
+        for atom in (a, b):
+            r.storage.set_atom_state(atom.name, st.RUNNING)
+            r.storage.set_atom_state(atom.name, st.SUCCESS)
+            r.storage.set_atom_intention(atom.name, st.REVERT)
+        self.assertEqual([b.name], self._names(selector.iter_next_atoms()))
+
+        r.storage.set_atom_state(b.name, st.REVERTING)
+        r.storage.set_atom_state(b.name, st.REVERTED)
+        self.assertEqual([a.name],
+                         self._names(selector.iter_next_atoms(b)))
+
+    def test_ignored_atoms_do_not_block(self):
+        flow = lf.Flow("root")
+        a, b = test_utils.make_many(2)
+        flow.add(a, b)
+        r = self._make_runtime(flow)
+        r.storage.set_atom_state(a.name, st.IGNORE)
+        r.storage.set_atom_intention(a.name, st.IGNORE)
+        self.assertEqual([b.name], self._names(r.selector.iter_next_atoms()))
+
+    def test_recompile_watches_once(self):
+        flow = lf.Flow("root")
+        a, b = test_utils.make_many(2)
+        flow.add(a, b)
+        r = self._make_runtime(flow)
+        r.storage.set_atom_state(a.name, st.RUNNING)
+        r.compile()
+        r.compile()
+        r.selector.refresh()
+        changed = se._ReadinessIndex.changed
+        with mock.patch.object(se._ReadinessIndex, 'changed',
+                               autospec=True,
+                               side_effect=changed) as mock_changed:
+            r.storage.set_atom_state(a.name, st.SUCCESS)
+        # Both indexes (the execute one and the revert one) saw the change
+        # once, no matter how many times the runtime was compiled.
+        self.assertEqual([mock.call(mock.ANY, a)] * 2,
+                         mock_changed.call_args_list)
+        indexes = set(id(c[0][0]) for c in mock_changed.call_args_list)
+        self.assertEqual(2, len(indexes))
+        self.assertEqual([b.name],
+                         self._names(r.selector.iter_next_atoms(a)))
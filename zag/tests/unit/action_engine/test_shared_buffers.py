@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import pickle
+import subprocess
+import sys
+import textwrap
+
+import testtools
+
+from zag.engines.action_engine import shared_buffers as sb
+from zag import test
+
+
+@testtools.skipIf(not sb.SUPPORTED, 'shared buffers are not supported')
+class SharedBuffersTest(test.TestCase):
+
+    def test_small_values_untouched(self):
+        values, buffers = sb.share_all({'a': b'x' * 10, 'b': 1}, 1024)
+        self.assertEqual({'a': b'x' * 10, 'b': 1}, values)
+        self.assertEqual([], buffers)
+
+    def test_shared_without_copying_payload(self):
+        data = {'a': b'x' * 10000, 'b': bytearray(b'y' * 10000), 'c': 1}
+        values, buffers = sb.share_all(data, 1024)
+        self.assertEqual(2, len(buffers))
+        blob = pickle.dumps(values)
+        self.assertLess(len(blob), 1024)
+        self.assertEqual(data, pickle.loads(blob))
+        sb.release_attached()
+        for buf in buffers:
+            buf.release()
+
+    def test_memoryview(self):
+        view = memoryview(b'z' * 10000)
+        shared = sb.share(view, 1024)
+        try:
+            self.assertEqual(view.tobytes(),
+                             pickle.loads(pickle.dumps(shared)).tobytes())
+        finally:
+            sb.release_attached()
+            shared.release()
+
+    def test_owned_removed_once_loaded(self):
+        values, _buffers = sb.share_all([b'x' * 10000], 1024, owned=True)
+        blob = pickle.dumps(values)
+        self.assertEqual([b'x' * 10000], pickle.loads(blob))
+        # The receiver removed the segment, so it can not be loaded again.
+        self.assertRaises(Exception, pickle.loads, blob)
+
+    def test_unreceived_removed(self):
+        prefix = sb.make_prefix()
+        values, buffers = sb.share_all([b'x' * 10000, b'y' * 10000], 1024,
+                                       owned=True, prefix=prefix)
+        self.assertEqual(2, len(buffers))
+        # Only the first one is received (and removed by the receiver).
+        self.assertEqual(b'x' * 10000, pickle.loads(pickle.dumps(values[0])))
+        self.assertEqual(1, sb.remove_all(prefix))
+        self.assertRaises(Exception, pickle.loads, pickle.dumps(values[1]))
+        self.assertEqual(0, sb.remove_all(prefix))
+
+    @testtools.skipIf(sb.shared_memory is None,
+                      'the shared memory module is not available')
+    def test_no_resource_tracker_warnings(self):
+        # The resource tracker(s) only complain when they shut down (after
+        # the processes that made or attached to segments have exited), so
+        # this has to be checked in a process of its own.
+        script = textwrap.dedent("""
+            import zag.engines
+            from zag.patterns import linear_flow as lf
+            from zag import task
+
+            class MakeTask(task.Task):
+                def execute(self):
+                    return b'x' * 10000
+
+            class UseTask(task.Task):
+                def execute(self, data):
+                    return len(data)
+
+            flow = lf.Flow('flow').add(MakeTask('make', provides='data'),
+                                       UseTask('use', provides='size'))
+            engine = zag.engines.load(flow, engine='parallel',
+                                      executor='processes',
+                                      shared_memory_threshold=1024)
+            engine.run()
+            print(engine.storage.fetch('size'))
+        """)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        proc = subprocess.Popen([sys.executable, '-c', script], env=env,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        stderr = stderr.decode()
+        self.assertEqual(0, proc.returncode, stderr)
+        self.assertEqual('10000', stdout.decode().strip())
+        self.assertNotIn('resource_tracker', stderr)
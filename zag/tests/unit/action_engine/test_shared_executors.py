@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+import time
+
+import zag.engines
+from zag.engines.action_engine import executor
+from zag.patterns import linear_flow as lf
+from zag import task
+from zag import test
+
+
+class ThreadIdentTask(task.Task):
+    def execute(self):
+        return threading.current_thread().ident
+
+
+class SharedExecutorsTest(test.TestCase):
+    def setUp(self):
+        super(SharedExecutorsTest, self).setUp()
+        self.registry = executor.SharedExecutors()
+        self.addCleanup(self.registry.shutdown)
+
+    def _make(self, name='pool', grace_period=0):
+        return executor.SharedTaskExecutor(
+            name, executor.ParallelThreadTaskExecutor, {'max_workers': 1},
+            grace_period=grace_period, registry=self.registry)
+
+    def test_shared_while_acquired(self):
+        a = self._make()
+        b = self._make()
+        a.start()
+        b.start()
+        self.assertIs(a._executor, b._executor)
+        a.stop()
+        self.assertIn('pool', self.registry)
+        b.stop()
+        self.assertNotIn('pool', self.registry)
+
+    def test_stopped_after_grace_period(self):
+        a = self._make(grace_period=0.1)
+        a.start()
+        shared = a._executor
+        a.stop()
+        self.assertIn('pool', self.registry)
+        # Reacquiring during the grace period reuses (and keeps) it.
+        a.start()
+        self.assertIs(shared, a._executor)
+        a.stop()
+        while 'pool' in self.registry:
+            time.sleep(0.01)
+        a.start()
+        self.assertIsNot(shared, a._executor)
+        a.stop()
+
+    def test_type_mismatch(self):
+        a = self._make()
+        a.start()
+        self.addCleanup(a.stop)
+        b = executor.SharedTaskExecutor(
+            'pool', executor.SerialTaskExecutor, {}, registry=self.registry)
+        self.assertRaises(TypeError, b.start)
+
+    def test_invalid_grace_period(self):
+        self.assertRaises(ValueError, self._make, grace_period=-1)
+
+    def test_engines_share_pool(self):
+        self.addCleanup(executor.shared_executors.shutdown)
+        idents = set()
+        for i in range(0, 3):
+            flow = lf.Flow('flow-%s' % i).add(
+                ThreadIdentTask('task-%s' % i, provides='ident'))
+            engine = zag.engines.load(flow, engine='parallel',
+                                      executor='threads', max_workers=1,
+                                      shared_executor='shared-test-pool')
+            engine.run()
+            idents.add(engine.storage.fetch('ident'))
+            self.assertIn('shared-test-pool', executor.shared_executors)
+        # The same (single) worker thread ran all of them.
+        self.assertEqual(1, len(idents))
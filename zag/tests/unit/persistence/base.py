@@ -215,6 +215,92 @@ class PersistenceTestMixin(object):
         self.assertEqual(43, td2.meta.get('test'))
         self.assertIsInstance(td2, models.TaskDetail)
 
+    def test_task_detail_update_changes_only(self):
+        lb_id = uuidutils.generate_uuid()
+        lb_name = 'lb-%s' % (lb_id)
+        lb = models.LogBook(name=lb_name, uuid=lb_id)
+        fd = models.FlowDetail('test', uuid=uuidutils.generate_uuid())
+        lb.add(fd)
+        td = models.TaskDetail("detail-1", uuid=uuidutils.generate_uuid())
+        td.results = 'result-1'
+        fd.add(td)
+
+        with contextlib.closing(self._get_connection()) as conn:
+            conn.save_logbook(lb)
+            conn.update_flow_details(fd)
+            conn.update_atom_details(td)
+        td.mark_saved()
+        self.assertEqual(frozenset(), td.changes())
+
+        # Something else (which does not track changes) saves another result
+        # that a change to only the state must not overwrite.
+        other_td = models.TaskDetail("detail-1", uuid=td.uuid)
+        other_td.results = 'result-2'
+        td = td.copy_with(state=states.RUNNING)
+        self.assertEqual(frozenset(['state']), td.changes())
+        with contextlib.closing(self._get_connection()) as conn:
+            conn.update_atom_details(other_td)
+            conn.update_atom_details(td)
+
+        with contextlib.closing(self._get_connection()) as conn:
+            td2 = conn.get_atom_details(td.uuid)
+        self.assertEqual(states.RUNNING, td2.state)
+        self.assertEqual('result-2', td2.results)
+
+    def test_atom_details_update_many(self):
+        lb_id = uuidutils.generate_uuid()
+        lb_name = 'lb-%s' % (lb_id)
+        lb = models.LogBook(name=lb_name, uuid=lb_id)
+        fd = models.FlowDetail('test', uuid=uuidutils.generate_uuid())
+        lb.add(fd)
+        td = models.TaskDetail("detail-1", uuid=uuidutils.generate_uuid())
+        td.results = 'result-1'
+        fd.add(td)
+        td2 = models.TaskDetail("detail-2", uuid=uuidutils.generate_uuid())
+        fd.add(td2)
+        rd = models.RetryDetail("detail-3", uuid=uuidutils.generate_uuid())
+        fd.add(rd)
+        with contextlib.closing(self._get_connection()) as conn:
+            conn.save_logbook(lb)
+        td.mark_saved()
+
+        td = td.copy_with(state=states.RUNNING)
+        td2.state = states.SUCCESS
+        td2.results = 'result-2'
+        rd.put(states.SUCCESS, 'retry-1')
+        with contextlib.closing(self._get_connection()) as conn:
+            saved = conn.update_atom_details_many([td, td2, rd])
+        self.assertEqual([td.uuid, td2.uuid, rd.uuid],
+                         [ad.uuid for ad in saved])
+
+        with contextlib.closing(self._get_connection()) as conn:
+            fd2 = conn.get_flow_details(fd.uuid)
+        td_saved = fd2.find(td.uuid)
+        self.assertEqual(states.RUNNING, td_saved.state)
+        self.assertEqual('result-1', td_saved.results)
+        td2_saved = fd2.find(td2.uuid)
+        self.assertEqual(states.SUCCESS, td2_saved.state)
+        self.assertEqual('result-2', td2_saved.results)
+        rd_saved = fd2.find(rd.uuid)
+        self.assertEqual(states.SUCCESS, rd_saved.state)
+        self.assertEqual('retry-1', rd_saved.results[0][0])
+
+    def test_atom_details_update_many_not_existing(self):
+        lb_id = uuidutils.generate_uuid()
+        lb_name = 'lb-%s' % (lb_id)
+        lb = models.LogBook(name=lb_name, uuid=lb_id)
+        fd = models.FlowDetail('test', uuid=uuidutils.generate_uuid())
+        lb.add(fd)
+        td = models.TaskDetail("detail-1", uuid=uuidutils.generate_uuid())
+        fd.add(td)
+        with contextlib.closing(self._get_connection()) as conn:
+            conn.save_logbook(lb)
+
+        td2 = models.TaskDetail("detail-2", uuid=uuidutils.generate_uuid())
+        with contextlib.closing(self._get_connection()) as conn:
+            self.assertRaises(exc.NotFound,
+                              conn.update_atom_details_many, [td, td2])
+
     def test_task_detail_with_failure(self):
         lb_id = uuidutils.generate_uuid()
         lb_name = 'lb-%s' % (lb_id)
@@ -376,6 +462,7 @@ class PersistenceTestMixin(object):
         fd2 = lb2.find(fd.uuid)
         rd2 = fd2.find(rd.uuid)
         self.assertIsInstance(rd2, models.RetryDetail)
+        self.assertEqual(42, rd2.results[0][0])
         fail2 = rd2.results[0][1].get('some-task')
         self.assertIsInstance(fail2, failure.Failure)
         self.assertTrue(fail.matches(fail2))
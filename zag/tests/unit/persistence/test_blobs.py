@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+
+from zag import exceptions as exc
+from zag.persistence import blobs
+from zag import test
+
+
+class BlobStoreTestMixin(object):
+
+    def test_put_load(self):
+        value = {'a': [1, 2, 3], 'b': b'\x00' * 1024}
+        data = blobs.dump(value)
+        digest = self.store.put(data)
+        self.assertEqual(digest, self.store.put(data))
+        reference = blobs.make_reference(digest, len(data))
+        self.assertTrue(blobs.is_reference(reference))
+        self.assertEqual(value, blobs.load(self.store, reference))
+
+    def test_missing(self):
+        reference = blobs.make_reference('0' * 64, 1)
+        self.assertRaises(exc.NotFound, blobs.load, self.store, reference)
+
+    def test_not_reference(self):
+        self.assertFalse(blobs.is_reference({'a': 1}))
+        self.assertFalse(blobs.is_reference('a'))
+
+
+class MemoryBlobStoreTest(BlobStoreTestMixin, test.TestCase):
+
+    def setUp(self):
+        super(MemoryBlobStoreTest, self).setUp()
+        self.store = blobs.MemoryBlobStore()
+
+
+class DirBlobStoreTest(BlobStoreTestMixin, test.TestCase):
+
+    def setUp(self):
+        super(DirBlobStoreTest, self).setUp()
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.store = blobs.DirBlobStore(self.path)
+
+    def test_stored_as_file(self):
+        digest = self.store.put(b'abc')
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.path, digest[0:2], digest)))
+
+    def test_empty_blob(self):
+        digest = self.store.put(b'')
+        with self.store.open(digest) as data:
+            self.assertEqual(b'', data[:])
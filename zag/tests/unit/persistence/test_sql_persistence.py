@@ -20,6 +20,7 @@ import os
 import random
 import tempfile
 
+from oslo_utils import uuidutils
 import six
 import testtools
 
@@ -27,7 +28,9 @@ import sqlalchemy as sa
 
 from zag.persistence import backends
 from zag.persistence.backends import impl_sqlalchemy
+from zag.persistence import models
 from zag import test
+from zag.test import mock
 from zag.tests.unit.persistence import base
 
 
@@ -122,6 +125,69 @@ class SqlitePersistenceTest(test.TestCase, base.PersistenceTestMixin):
             os.unlink(self.db_location)
             self.db_location = None
 
+    def _save_books(self, book_count, flow_count, atom_count):
+        books = []
+        with contextlib.closing(self._get_connection()) as conn:
+            for i in range(0, book_count):
+                book = models.LogBook('book-%s' % i)
+                for j in range(0, flow_count):
+                    fd = models.FlowDetail('flow-%s' % j,
+                                           uuid=uuidutils.generate_uuid())
+                    for k in range(0, atom_count):
+                        fd.add(models.TaskDetail(
+                            'atom-%s' % k, uuid=uuidutils.generate_uuid()))
+                    book.add(fd)
+                conn.save_logbook(book)
+                books.append(book)
+        return books
+
+    def _count_selects(self, backend):
+        selects = []
+
+        def on_execute(conn, cursor, statement, parameters, *args):
+            if statement.lstrip().upper().startswith('SELECT'):
+                selects.append(statement)
+
+        sa.event.listen(backend.engine, 'before_cursor_execute', on_execute)
+        self.addCleanup(sa.event.remove, backend.engine,
+                        'before_cursor_execute', on_execute)
+        return selects
+
+    def test_get_logbook_batched(self):
+        book = self._save_books(1, 5, 3)[0]
+        backend = impl_sqlalchemy.SQLAlchemyBackend({
+            'connection': self.db_uri,
+        })
+        with contextlib.closing(backend.get_connection()) as conn:
+            selects = self._count_selects(backend)
+            book2 = conn.get_logbook(book.uuid)
+        # One for the logbook, one for its flows and one for their atoms.
+        self.assertEqual(3, len(selects))
+        self.assertEqual(5, len(book2))
+        for fd in book2:
+            self.assertEqual(3, len(fd))
+
+    def test_get_logbooks_paged(self):
+        books = self._save_books(5, 2, 2)
+        backend = impl_sqlalchemy.SQLAlchemyBackend({
+            'connection': self.db_uri,
+        })
+        with contextlib.closing(backend.get_connection()) as conn:
+            selects = self._count_selects(backend)
+            with mock.patch.object(impl_sqlalchemy, 'PAGE_SIZE', 2):
+                with mock.patch.object(impl_sqlalchemy, 'IN_CHUNK_SIZE', 3):
+                    books2 = list(conn.get_logbooks())
+        # Three pages (of 2, 2 and 1 logbooks); each takes one query for
+        # the logbooks, one for their flows and one or two (chunked) for the
+        # atoms of those flows.
+        self.assertEqual(11, len(selects))
+        self.assertEqual(sorted(book.uuid for book in books),
+                         [book.uuid for book in books2])
+        for book in books2:
+            self.assertEqual(2, len(book))
+            for fd in book:
+                self.assertEqual(2, len(fd))
+
 
 @six.add_metaclass(abc.ABCMeta)
 class BackendPersistenceTestMixin(base.PersistenceTestMixin):
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+import six
+import testtools
+
+import zag.engines
+from zag import exceptions as exc
+from zag.patterns import linear_flow as lf
+from zag.patterns import unordered_flow as uf
+from zag import states
+from zag import task
+from zag import test
+from zag.tests.unit import test_engines
+from zag.tests import utils
+
+# The asyncio engine (and the coroutine tasks it is tested with) use syntax
+# that only python 3 understands, so only import them there.
+ASYNCIO_AVAILABLE = six.PY3
+if ASYNCIO_AVAILABLE:
+    import asyncio
+
+    from zag.engines.action_engine import async_engine
+    from zag.tests import async_utils
+
+
+class ThreadTask(task.Task):
+    def execute(self):
+        return threading.current_thread().ident
+
+
+@testtools.skipIf(not ASYNCIO_AVAILABLE, 'asyncio is not available')
+class AsyncEngineTest(test_engines.EngineTaskTest,
+                      test_engines.EngineMultipleResultsTest,
+                      test_engines.EngineLinearFlowTest,
+                      test_engines.EngineParallelFlowTest,
+                      test_engines.EngineLinearAndUnorderedExceptionsTest,
+                      test_engines.EngineOptionalRequirementsTest,
+                      test_engines.EngineGraphFlowTest,
+                      test_engines.EngineMissingDepsTest,
+                      test_engines.EngineResetTests,
+                      test_engines.EngineGraphConditionalFlowTest,
+                      test_engines.EngineCheckingTaskTest,
+                      test_engines.EngineDeciderDepthTest,
+                      test_engines.EngineTaskNotificationsTest,
+                      test.TestCase):
+    def _make_engine(self, flow,
+                     flow_detail=None, store=None, **kwargs):
+        return zag.engines.load(
+            flow,
+            flow_detail=flow_detail,
+            engine='asyncio',
+            backend=self.backend,
+            store=store,
+            **kwargs
+        )
+
+    def _run_async(self, engine):
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(engine.run_async())
+        finally:
+            loop.close()
+
+    def test_correct_load(self):
+        engine = self._make_engine(utils.TaskNoRequiresNoReturns)
+        self.assertIsInstance(engine, async_engine.AsyncActionEngine)
+
+    def test_run_async(self):
+        flow = lf.Flow('flow').add(
+            async_utils.SleepyTask('s1', provides='a'),
+            ThreadTask('t1', provides='b'))
+        engine = self._make_engine(flow)
+        self._run_async(engine)
+        self.assertEqual(states.SUCCESS, engine.storage.get_flow_state())
+        self.assertEqual(threading.current_thread().ident,
+                         engine.storage.fetch('a'))
+        self.assertNotEqual(threading.current_thread().ident,
+                            engine.storage.fetch('b'))
+
+    def test_many_coroutines_at_once(self):
+        flow = uf.Flow('flow')
+        for i in range(0, 500):
+            flow.add(async_utils.SleepyTask('s%s' % i, provides='s%s' % i,
+                                            inject={'delay': 0.2}))
+        engine = self._make_engine(flow)
+        self._run_async(engine)
+        self.assertEqual(states.SUCCESS, engine.storage.get_flow_state())
+        # All of these ran concurrently on the thread running the loop (if
+        # they had been ran one after another this would take ~100 seconds).
+        idents = set(engine.storage.fetch('s%s' % i) for i in range(0, 500))
+        self.assertEqual(set([threading.current_thread().ident]), idents)
+
+    def test_coroutine_failure_reverted(self):
+        t = async_utils.FailingSleepyTask('fail')
+        engine = self._make_engine(lf.Flow('flow').add(t))
+        self.assertRaisesRegex(RuntimeError, '^Woot',
+                               self._run_async, engine)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+        self.assertTrue(t.reverted)
+
+    def test_coroutine_timeout(self):
+        flow = uf.Flow('flow').add(
+            async_utils.SleepyTask('stuck', timeout=0.1,
+                                   inject={'delay': 30}),
+            async_utils.SleepyTask('s1', provides='a'))
+        engine = self._make_engine(flow)
+        self.assertRaises(exc.AtomTimeout, self._run_async, engine)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+
+    def test_blocking_run(self):
+        flow = lf.Flow('flow').add(
+            async_utils.SleepyTask('s1', provides='a'),
+            ThreadTask('t1', provides='b'))
+        engine = self._make_engine(flow)
+        engine.run()
+        self.assertEqual(states.SUCCESS, engine.storage.get_flow_state())
+        self.assertNotEqual(engine.storage.fetch('a'),
+                            engine.storage.fetch('b'))
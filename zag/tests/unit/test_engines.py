@@ -17,21 +17,30 @@
 import collections
 import contextlib
 import functools
+import signal
 import threading
+import time
 
 import futurist
+from oslo_utils import timeutils
 import six
 import testtools
 
 import zag.engines
 from zag.engines.action_engine import engine as eng
+from zag.engines.action_engine import profiling
+from zag.engines.action_engine import result_cache
+from zag.engines.action_engine import shared_buffers
+from zag.engines.action_engine import scheduler as sched
 from zag.engines.worker_based import engine as w_eng
 from zag.engines.worker_based import worker as wkr
 from zag import exceptions as exc
 from zag.patterns import graph_flow as gf
 from zag.patterns import linear_flow as lf
 from zag.patterns import unordered_flow as uf
+from zag.persistence import blobs
 from zag.persistence import models
+from zag import retry
 from zag import states
 from zag import task
 from zag import test
@@ -124,6 +133,34 @@ class EngineTaskTest(object):
         self.assertEqual(now_expected, values)
         self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
 
+    def test_buffered_atom_changes_saved(self):
+        flow = lf.Flow('flow-1')
+        flow.add(utils.ProgressingTask(name='task1'),
+                 utils.ProgressingTask(name='task2'))
+        for flush_policy in ('per_cycle', 'on_flow_state'):
+            engine = self._make_engine(flow, flush_policy=flush_policy)
+            engine.run()
+            with contextlib.closing(self.backend.get_connection()) as conn:
+                fd = conn.get_flow_details(engine.storage.flow_uuid)
+            self.assertEqual(states.SUCCESS, fd.state)
+            self.assertEqual([states.SUCCESS, states.SUCCESS],
+                             [ad.state for ad in fd])
+            self.assertEqual([5, 5], [ad.results for ad in fd])
+
+    def test_cached_result_reused(self):
+        cache = result_cache.MemoryCache()
+        results = []
+        for x in (1, 1, 2):
+            flow = utils.UniqueResultTask('u', provides='u', inject={'x': x})
+            engine = self._make_engine(flow, result_cache=cache)
+            engine.run()
+            results.append(engine.storage.fetch('u'))
+        self.assertEqual(results[0], results[1])
+        self.assertNotEqual(results[0], results[2])
+        stats = engine.statistics['result_cache']
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(2, stats['misses'])
+
     def test_invalid_flow_raises(self):
 
         def compile_bad(value):
@@ -1426,6 +1463,25 @@ class SerialEngineTest(EngineTaskTest,
         engine = zag.engines.load(utils.TaskNoRequiresNoReturns)
         self.assertIsInstance(engine, eng.SerialActionEngine)
 
+    def test_large_results_offloaded(self):
+
+        class BigResultTask(task.Task):
+            def execute(self):
+                return 'x' * 4096
+
+        class UsingTask(task.Task):
+            def execute(self, big):
+                return len(big)
+
+        flow = lf.Flow('flow').add(BigResultTask('big', provides='big'),
+                                   UsingTask('using', provides='size'))
+        blob_store = blobs.MemoryBlobStore()
+        engine = self._make_engine(flow, blob_store=blob_store,
+                                   blob_threshold=1024)
+        engine.run()
+        self.assertEqual(4096, engine.storage.fetch('size'))
+        self.assertEqual(1, len(blob_store))
+
 
 class ParallelEngineWithThreadsTest(EngineTaskTest,
                                     EngineMultipleResultsTest,
@@ -1473,6 +1529,248 @@ class ParallelEngineWithThreadsTest(EngineTaskTest,
         finally:
             executor.shutdown(wait=True)
 
+    def test_resource_limits(self):
+        lock = threading.Lock()
+        active = collections.Counter()
+        peaks = collections.Counter()
+
+        class UsingTask(task.Task):
+            def execute(self):
+                for tag in self.resources or ['none']:
+                    with lock:
+                        active[tag] += 1
+                        peaks[tag] = max(peaks[tag], active[tag])
+                time.sleep(0.05)
+                for tag in self.resources or ['none']:
+                    with lock:
+                        active[tag] -= 1
+
+        flow = uf.Flow('flow')
+        for i in range(0, 6):
+            flow.add(UsingTask('db-%s' % i, resources={'db': 1}))
+        for i in range(0, 4):
+            flow.add(UsingTask('other-%s' % i))
+        with futurist.ThreadPoolExecutor(10) as executor:
+            engine = self._make_engine(flow, executor=executor,
+                                       resource_limits={'db': 2})
+            engine.run()
+        self.assertEqual(states.SUCCESS, engine.storage.get_flow_state())
+        self.assertEqual(2, peaks['db'])
+        db_stats = engine.statistics['resources']['db']
+        self.assertEqual(2, db_stats['limit'])
+        self.assertEqual(2, db_stats['peak'])
+        self.assertEqual(0, db_stats['in_use'])
+        self.assertGreater(0, db_stats['deferred'])
+        self.assertGreater(0.0, db_stats['utilization'])
+
+    def _make_critical_path_flow(self, order):
+
+        class OrderedTask(task.Task):
+            def execute(self):
+                order.append(self.name)
+
+        flow = uf.Flow('flow')
+        flow.add(lf.Flow('chain').add(OrderedTask('b1'), OrderedTask('b2'),
+                                      OrderedTask('b3')))
+        flow.add(OrderedTask('a'))
+        return flow
+
+    def test_critical_path_scheduling(self):
+        order = []
+        flow = self._make_critical_path_flow(order)
+        with futurist.ThreadPoolExecutor(1) as executor:
+            engine = self._make_engine(flow, executor=executor,
+                                       scheduling_policy='critical_path')
+            engine.run()
+        self.assertEqual('b1', order[0])
+
+    def test_critical_path_scheduling_uses_history(self):
+        order = []
+        flow = self._make_critical_path_flow(order)
+        history = sched.DurationHistory()
+        with futurist.ThreadPoolExecutor(1) as executor:
+            engine = self._make_engine(flow, executor=executor,
+                                       scheduling_policy='critical_path',
+                                       duration_history=history)
+            engine.compile()
+            atoms = dict((node.name, node)
+                         for node in engine.compilation.execution_graph)
+            history.record(atoms['a'], 100.0)
+            for name in ('b1', 'b2', 'b3'):
+                history.record(atoms[name], 1.0)
+            engine.run()
+        self.assertEqual('a', order[0])
+        # The durations observed while running should have been recorded.
+        self.assertLess(history.estimate(atoms['b1']), 1.0)
+
+    def test_unknown_scheduling_policy(self):
+        engine = self._make_engine(utils.TaskNoRequiresNoReturns('a'),
+                                   scheduling_policy='bad')
+        self.assertRaises(ValueError, engine.compile)
+
+    def _make_cancelling_flow(self, raise_when_cancelled=False):
+
+        class WaitingTask(task.Task):
+            def execute(self):
+                if self.cancellation.wait(30) and raise_when_cancelled:
+                    raise RuntimeError('Cancelled!')
+                return self.cancelled
+
+        class FailingTask(task.Task):
+            def execute(self):
+                time.sleep(0.1)
+                raise RuntimeError('Woot!')
+
+        waiting = WaitingTask('waiting')
+        flow = uf.Flow('flow').add(waiting, FailingTask('fail'))
+        return (flow, waiting)
+
+    def test_cancel_on_failure(self):
+        flow, waiting = self._make_cancelling_flow()
+        engine = self._make_engine(flow, cancel_on_failure=True)
+        watch = timeutils.StopWatch().start()
+        self.assertFailuresRegexp(RuntimeError, '^Woot', engine.run)
+        self.assertLess(watch.elapsed(), 30)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+        self.assertEqual(states.REVERTED,
+                         engine.storage.get_atom_state('waiting'))
+        # Reverting resets the token (so it is not left requested).
+        self.assertFalse(waiting.cancelled)
+
+    def test_cancel_on_failure_cancelled_raises(self):
+        flow, _waiting = self._make_cancelling_flow(
+            raise_when_cancelled=True)
+        engine = self._make_engine(flow, cancel_on_failure=True)
+        self.assertFailuresRegexp(RuntimeError, '^Woot', engine.run)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+        self.assertEqual(states.REVERTED,
+                         engine.storage.get_atom_state('waiting'))
+
+    def test_atom_timeout(self):
+
+        class StuckTask(task.Task):
+            def execute(self):
+                # Pretend to be stuck (until told to give up).
+                self.cancellation.wait(30)
+
+        flow = uf.Flow('flow').add(StuckTask('stuck', timeout=0.2),
+                                   utils.TaskNoRequiresNoReturns('other'))
+        engine = self._make_engine(flow)
+        watch = timeutils.StopWatch().start()
+        self.assertFailuresRegexp(exc.AtomTimeout, '^Atom', engine.run)
+        self.assertLess(watch.elapsed(), 30)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+        self.assertEqual(states.REVERTED,
+                         engine.storage.get_atom_state('stuck'))
+        self.assertEqual(1, engine.statistics['timed_out'])
+
+    def test_atom_timeout_frees_resources(self):
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+
+        class HungTask(task.Task):
+            def execute(self):
+                # Hung (and not listening to cancellation requests).
+                gate.wait(30)
+
+        flow = uf.Flow('flow').add(
+            HungTask('hung', timeout=0.2, resources={'db': 1}))
+        with futurist.ThreadPoolExecutor(2) as executor:
+            engine = self._make_engine(flow, executor=executor,
+                                       resource_limits={'db': 1})
+            watch = timeutils.StopWatch().start()
+            self.assertFailuresRegexp(exc.AtomTimeout, '^Atom', engine.run)
+            # Freed even though the hung execution is still going on (so
+            # reverting did not have to wait for that execution to return).
+            self.assertLess(watch.elapsed(), 30)
+            db_stats = engine.statistics['resources']['db']
+            self.assertEqual(0, db_stats['in_use'])
+            gate.set()
+        # And not freed (again) once that execution does finish.
+        db_stats = engine._runtime.scheduler.resource_statistics()['db']
+        self.assertEqual(0, db_stats['in_use'])
+
+    def test_atom_timeout_retried_keeps_stale_run_cancelled(self):
+        gate = threading.Event()
+        self.addCleanup(gate.set)
+        stale_cancelled = []
+
+        class SlowFirstTask(task.Task):
+            runs = 0
+
+            def execute(self):
+                SlowFirstTask.runs += 1
+                if SlowFirstTask.runs == 1:
+                    token = self.cancellation
+                    gate.wait(30)
+                    stale_cancelled.append(token.requested)
+
+        slow = SlowFirstTask('slow', timeout=0.2)
+        flow = lf.Flow('flow', retry=retry.Times(2)).add(slow)
+        with futurist.ThreadPoolExecutor(2) as executor:
+            engine = self._make_engine(flow, executor=executor)
+            engine.run()
+            self.assertEqual(states.SUCCESS,
+                             engine.storage.get_flow_state())
+            self.assertFalse(slow.cancelled)
+            gate.set()
+        self.assertEqual([True], stale_cancelled)
+
+    def _run_timing_out_under_retry(self, cancel_on_failure):
+        calls = []
+
+        class RecordingTask(task.Task):
+            def execute(self):
+                calls.append(('execute', self.name))
+                if self.name == 'slow':
+                    # Cooperative (stops as soon as it is told to).
+                    self.cancellation.wait(30)
+
+            def revert(self, *args, **kwargs):
+                calls.append(('revert', self.name))
+
+        flow = lf.Flow('flow', retry=retry.Times(2)).add(
+            RecordingTask('quick'), RecordingTask('slow', timeout=0.1))
+        engine = self._make_engine(flow,
+                                   cancel_on_failure=cancel_on_failure)
+        self.assertFailuresRegexp(exc.AtomTimeout, '^Atom', engine.run)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+        self.assertEqual(2, engine.statistics['timed_out'])
+        return calls
+
+    def test_atom_timeout_retried(self):
+        expected = [
+            ('execute', 'quick'), ('execute', 'slow'),
+            ('revert', 'slow'), ('revert', 'quick'),
+        ] * 2
+        self.assertEqual(expected, self._run_timing_out_under_retry(False))
+
+    def test_atom_timeout_retried_when_cancelling_on_failure(self):
+        # Timing out is a failure of its own (not one caused by some other
+        # atoms failure) so it must still be reverted and retried.
+        expected = [
+            ('execute', 'quick'), ('execute', 'slow'),
+            ('revert', 'slow'), ('revert', 'quick'),
+        ] * 2
+        self.assertEqual(expected, self._run_timing_out_under_retry(True))
+
+    def test_atom_finishing_in_time(self):
+        flow = utils.SleepTask('sleepy', timeout=10,
+                               inject={'duration': 0.01})
+        engine = self._make_engine(flow)
+        engine.run()
+        self.assertEqual(states.SUCCESS, engine.storage.get_flow_state())
+        self.assertEqual(0, engine.statistics['timed_out'])
+
+    def test_resource_over_limit_runs_alone(self):
+        flow = uf.Flow('flow')
+        flow.add(utils.TaskNoRequiresNoReturns('big', resources={'db': 5}))
+        flow.add(utils.TaskNoRequiresNoReturns('small', resources={'db': 1}))
+        engine = self._make_engine(flow, resource_limits={'db': 2})
+        engine.run()
+        self.assertEqual(states.SUCCESS, engine.storage.get_flow_state())
+        self.assertEqual(5, engine.statistics['resources']['db']['peak'])
+
 
 @testtools.skipIf(not eu.EVENTLET_AVAILABLE, 'eventlet is not available')
 class ParallelEngineWithEventletTest(EngineTaskTest,
@@ -1583,6 +1881,78 @@ class ParallelEngineWithProcessTest(EngineTaskTest,
         self.assertEqual(1, len(captured['hi']))
         self.assertEqual(0, len(captured[task.EVENT_UPDATE_PROGRESS]))
 
+    @testtools.skipIf(not shared_buffers.SUPPORTED,
+                      'shared buffers are not supported')
+    def test_big_arguments_and_results_shared(self):
+        data = b'x' * 10000
+        flow = lf.Flow('flow').add(
+            utils.EchoTask('first', rebind=['data'], provides='first'),
+            utils.EchoTask('second', rebind=['first'], provides='second'))
+        engine = self._make_engine(flow, store={'data': data},
+                                   shared_memory_threshold=1024)
+        engine.run()
+        self.assertEqual(data, engine.storage.fetch('second'))
+
+    @testtools.skipIf(not shared_buffers.SUPPORTED,
+                      'shared buffers are not supported')
+    def test_big_arguments_read_from_shared_memory(self):
+        data = b'x' * 10000
+        flow = lf.Flow('flow').add(
+            utils.SharedArgumentTask('big', inject={'value': data},
+                                     provides='big'),
+            utils.SharedArgumentTask('small', inject={'value': b'x'},
+                                     provides='small'))
+        engine = self._make_engine(flow, shared_memory_threshold=1024)
+        engine.run()
+        # Only the argument over the threshold went via shared memory.
+        self.assertEqual((data, True), engine.storage.fetch('big'))
+        self.assertEqual((b'x', False), engine.storage.fetch('small'))
+
+    def test_preloaded_and_cached_tasks(self):
+        captured = collections.defaultdict(list)
+
+        def notify_me(event_type, details):
+            captured[event_type].append(details)
+
+        a = utils.MultiProgressingTask('a')
+        a.notifier.register(a.notifier.ANY, notify_me)
+        progress_chunks = list(x / 10.0 for x in range(1, 10))
+        engine = self._make_engine(a, store={'progress_chunks':
+                                             progress_chunks},
+                                   preload_modules=['zag.tests.utils'],
+                                   task_cache_size=4)
+        engine.run()
+        engine.reset()
+        engine.run()
+        # Events of both runs are still proxied (even though the children
+        # reuse the same copy of the task).
+        progress = [details['progress']
+                    for details in captured[task.EVENT_UPDATE_PROGRESS]]
+        self.assertEqual(2, progress.count(1.0))
+        self.assertEqual(2, progress.count(0.5))
+        self.assertEqual(states.SUCCESS, engine.storage.get_flow_state())
+
+    def test_cached_tasks_run_fresh_copies(self):
+        # More attempts than there are children (so some child runs it more
+        # than once), but every attempt must start from a fresh copy.
+        flow = lf.Flow('flow', retry.Times(5)).add(
+            utils.EventuallySucceedingTask('a', succeed_on=3))
+        engine = self._make_engine(flow, task_cache_size=4)
+        self.assertFailuresRegexp(RuntimeError, '^Woot with 1$', engine.run)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+
+    @testtools.skipIf(not hasattr(signal, 'setitimer'),
+                      'interval timers are not available')
+    def test_atom_timeout_interrupts_child(self):
+        flow = utils.SleepTask('stuck', timeout=0.5, inject={'duration': 30})
+        engine = self._make_engine(flow)
+        watch = timeutils.StopWatch().start()
+        self.assertFailuresRegexp(exc.AtomTimeout, '.', engine.run)
+        # Stopping the engine waits for the pool to finish what it is doing,
+        # so this would take ~30 seconds if the child was not interrupted.
+        self.assertLess(watch.elapsed(), 30)
+        self.assertEqual(states.REVERTED, engine.storage.get_flow_state())
+
 
 class WorkerBasedEngineTest(EngineTaskTest,
                             EngineMultipleResultsTest,
@@ -1654,3 +2024,13 @@ class WorkerBasedEngineTest(EngineTaskTest,
     def test_correct_load(self):
         engine = self._make_engine(utils.TaskNoRequiresNoReturns)
         self.assertIsInstance(engine, w_eng.WorkerBasedActionEngine)
+
+    def test_profiled_on_worker(self):
+        flow = lf.Flow('flow').add(utils.ProgressingTask('task1'),
+                                   utils.ProgressingTask('task2'))
+        engine = self._make_engine(flow, profile_atoms=['task1'])
+        engine.run()
+        stats = profiling.loads(engine.storage.get_atom_profile('task1'))
+        names = set(func_name for (_path, _line, func_name) in stats.stats)
+        self.assertIn('execute', names)
+        self.assertIsNone(engine.storage.get_atom_profile('task2'))
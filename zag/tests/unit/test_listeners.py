@@ -15,7 +15,9 @@
 #    under the License.
 
 import contextlib
+import json
 import logging
+import os
 import threading
 import time
 
@@ -30,13 +32,16 @@ from zag import json as zag_json
 from zag.listeners import claims
 from zag.listeners import logging as logging_listeners
 from zag.listeners import timing
+from zag.listeners import tracing
 from zag.patterns import linear_flow as lf
+from zag.patterns import unordered_flow as uf
 from zag.persistence.backends import impl_memory
 from zag import states
 from zag import task
 from zag import test
 from zag.test import mock
 from zag.tests import utils as test_utils
+from zag.types import notifier as nt
 from zag.utils import misc
 from zag.utils import persistence_utils
 
@@ -285,6 +290,77 @@ class TestEventTimeListener(test.TestCase, EngineMakerMixin):
         self.assertGreaterEqual(0.1, fd_duration)
 
 
+class TestChromeTraceListener(test.TestCase, EngineMakerMixin):
+    def _run_traced(self, flow, **kwargs):
+        path = os.path.join(self.makeTmpDir(), 'trace.json')
+        engine = zag.engines.load(flow, **kwargs)
+        with tracing.ChromeTraceListener(engine, path=path):
+            engine.run()
+        with open(path) as fh:
+            return (engine, json.load(fh)['traceEvents'])
+
+    def test_trace(self):
+        flow = lf.Flow('root').add(
+            uf.Flow('pair').add(SleepyTask("a", sleep_for=0.01),
+                                SleepyTask("b", sleep_for=0.01)),
+            SleepyTask("c", sleep_for=0.01))
+        engine, events = self._run_traced(flow, engine='parallel',
+                                          max_workers=2)
+        names = set((ev.get('cat'), ev['name']) for ev in events)
+        for state in (states.RESUMING, states.SCHEDULING, states.WAITING,
+                      states.ANALYZING):
+            self.assertIn(('engine', state), names)
+        for atom_span in ('queued', 'submit', 'execute'):
+            self.assertIn(('atom', atom_span), names)
+        self.assertIn(('flow', states.RUNNING), names)
+        self.assertIn(('storage', 'set_atom_state'), names)
+        tracks = sorted(ev['args']['name'] for ev in events
+                        if ev['ph'] == 'M')
+        self.assertEqual(['a', 'b', 'c'], tracks)
+        for ev in events:
+            if ev['ph'] == 'X':
+                self.assertGreaterEqual(0, ev['dur'])
+        # The storage unit is back to normal (not traced).
+        self.assertNotIn('set_atom_state', vars(engine.storage))
+        self.assertEqual(0, len(engine.trace_notifier))
+
+    def test_storage_unwrapped_in_any_order(self):
+        flow = lf.Flow('root').add(test_utils.ProgressingTask("a"))
+        engine = self._make_engine(flow)
+        first = tracing.ChromeTraceListener(engine)
+        second = tracing.ChromeTraceListener(engine)
+        first.register()
+        second.register()
+        first.deregister()
+        # The wrapper of the second listener is left alone (and still
+        # records storage calls).
+        self.assertIn('set_atom_state', vars(engine.storage))
+        engine.run()
+        self.assertIn('set_atom_state',
+                      [ev['name'] for ev in second.events
+                       if ev.get('cat') == 'storage'])
+        self.assertNotIn('storage',
+                         [ev.get('cat') for ev in first.events])
+        second.deregister()
+        recorded = len(second.events)
+        engine.storage.get_atom_state('a')
+        self.assertEqual(recorded, len(second.events))
+        self.assertNotIn('storage',
+                         [ev.get('cat') for ev in first.events])
+
+    def test_trace_failure(self):
+        flow = lf.Flow('root').add(test_utils.ProgressingTask("a"),
+                                   test_utils.FailingTask("b"))
+        engine = self._make_engine(flow)
+        listener = tracing.ChromeTraceListener(engine)
+        with listener:
+            self.assertRaises(RuntimeError, engine.run)
+        names = set(ev['name'] for ev in listener.events
+                    if ev.get('cat') == 'atom')
+        self.assertIn('revert', names)
+        self.assertIn(states.REVERTED, names)
+
+
 class TestCapturingListeners(test.TestCase, EngineMakerMixin):
     def test_basic_do_not_capture(self):
         flow = lf.Flow("test")
@@ -296,6 +372,24 @@ class TestCapturingListeners(test.TestCase, EngineMakerMixin):
                     'test.f SUCCESS']
         self.assertEqual(expected, capturer.values)
 
+    def test_dispatched_capture(self):
+        flow = lf.Flow("test")
+        flow.add(test_utils.ProgressingTask("task1"),
+                 test_utils.ProgressingTask("task2"))
+        dispatcher = nt.Dispatcher()
+        self.addCleanup(dispatcher.close)
+        e = zag.engines.load(flow, event_dispatcher=dispatcher)
+        with test_utils.CaptureListener(e) as capturer:
+            e.run()
+        # All of them are received (in order) by the time the run ends.
+        expected = ['test.f RUNNING',
+                    'task1.t RUNNING',
+                    'task1.t SUCCESS(5)',
+                    'task2.t RUNNING',
+                    'task2.t SUCCESS(5)',
+                    'test.f SUCCESS']
+        self.assertEqual(expected, capturer.values)
+
 
 class TestLoggingListeners(test.TestCase, EngineMakerMixin):
     def _make_logger(self, level=logging.DEBUG):
@@ -16,6 +16,8 @@
 
 import collections
 import functools
+import threading
+import time
 
 from zag import states
 from zag import test
@@ -210,3 +212,105 @@ class NotifierTest(test.TestCase):
         self.assertEqual(2, len(call_counts[states.SUCCESS]))
         notifier.notify(states.SUCCESS, {'color': 'green'})
         self.assertEqual(2, len(call_counts[states.SUCCESS]))
+
+
+class DispatcherTest(test.TestCase):
+    def _make(self, **kwargs):
+        dispatcher = nt.Dispatcher(**kwargs)
+        self.addCleanup(dispatcher.close)
+        return dispatcher
+
+    def _blocked_notifier(self, dispatcher):
+        # Returns a notifier (and the event that unblocks it) whose first
+        # listener call blocks (so that calls after it stay pending).
+        unblock = threading.Event()
+        calls = []
+
+        def call_me(state, details):
+            if details.get('block'):
+                unblock.wait()
+            calls.append((state, details.get('task_uuid'),
+                          details.get('progress')))
+
+        notifier = nt.Notifier(dispatcher=dispatcher)
+        notifier.register(nt.Notifier.ANY, call_me)
+        notifier.notify(states.PENDING, {'block': True})
+        while len(dispatcher):
+            # Wait for the blocking call to be taken off the queue.
+            time.sleep(0.001)
+        return notifier, unblock, calls
+
+    def test_called_in_order_from_other_thread(self):
+        threads = []
+        calls = []
+
+        def call_me(state, details):
+            threads.append(threading.current_thread())
+            calls.append(details['i'])
+
+        dispatcher = self._make()
+        notifier = nt.Notifier(dispatcher=dispatcher)
+        notifier.register(nt.Notifier.ANY, call_me)
+        for i in range(0, 100):
+            notifier.notify(states.RUNNING, {'i': i})
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual(list(range(0, 100)), calls)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_failing_listener(self):
+        calls = []
+
+        def broken(state, details):
+            raise RuntimeError("broken")
+
+        dispatcher = self._make()
+        notifier = nt.Notifier(dispatcher=dispatcher)
+        notifier.register(states.RUNNING, broken)
+        notifier.register(states.RUNNING,
+                          lambda state, details: calls.append(state))
+        notifier.notify(states.RUNNING, {})
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual([states.RUNNING], calls)
+
+    def test_drop_oldest(self):
+        dispatcher = self._make(max_size=2, overflow=nt.DROP_OLDEST)
+        notifier, unblock, calls = self._blocked_notifier(dispatcher)
+        for progress in (0.1, 0.2, 0.3):
+            notifier.notify(states.RUNNING, {'progress': progress})
+        unblock.set()
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual(1, dispatcher.dropped)
+        self.assertEqual([0.2, 0.3], [c[2] for c in calls[1:]])
+
+    def test_coalesce(self):
+        dispatcher = self._make(max_size=2, overflow=nt.COALESCE)
+        notifier, unblock, calls = self._blocked_notifier(dispatcher)
+        notifier.notify(states.RUNNING, {'task_uuid': 'a', 'progress': 0.1})
+        notifier.notify(states.RUNNING, {'task_uuid': 'b', 'progress': 0.1})
+        # Replaces the pending one (of the same task).
+        notifier.notify(states.RUNNING, {'task_uuid': 'a', 'progress': 0.5})
+        notifier.notify(states.RUNNING, {'task_uuid': 'b', 'progress': 0.9})
+        unblock.set()
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual(2, dispatcher.coalesced)
+        self.assertEqual([(states.RUNNING, 'a', 0.5),
+                          (states.RUNNING, 'b', 0.9)], calls[1:])
+
+    def test_block(self):
+        dispatcher = self._make(max_size=1)
+        notifier, unblock, calls = self._blocked_notifier(dispatcher)
+        notifier.notify(states.RUNNING, {'progress': 0.1})
+        t = threading.Thread(target=notifier.notify,
+                             args=(states.RUNNING, {'progress': 0.2}))
+        t.start()
+        self.assertFalse(dispatcher.flush(timeout=0.05))
+        # Still waiting for room in the queue.
+        self.assertTrue(t.is_alive())
+        unblock.set()
+        t.join()
+        self.assertTrue(dispatcher.flush())
+        self.assertEqual([0.1, 0.2], [c[2] for c in calls[1:]])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, nt.Dispatcher, max_size=0)
+        self.assertRaises(ValueError, nt.Dispatcher, overflow='crap')
@@ -21,10 +21,12 @@ from oslo_utils import uuidutils
 
 from zag import exceptions
 from zag.persistence import backends
+from zag.persistence import blobs
 from zag.persistence import models
 from zag import states
 from zag import storage
 from zag import test
+from zag.test import mock
 from zag.tests import utils as test_utils
 from zag.types import failure
 from zag.utils import persistence_utils as p_utils
@@ -211,6 +213,18 @@ class StorageTestMixin(object):
         s.update_atom_metadata('my task', None)
         self.assertEqual(0.5, s.get_task_progress('my task'))
 
+    def test_task_metadata_copied_on_write(self):
+        s = self._get_storage()
+        s.ensure_atom(test_utils.NoopTask('my task'))
+        s.update_atom_metadata('my task', {'a': 1})
+        ad = s._flowdetail.find(s.get_atom_uuid('my task'))
+        old_meta = ad.meta
+        s.update_atom_metadata('my task', {'b': 2})
+        s.set_atom_state('my task', states.RUNNING)
+        self.assertEqual({'a': 1}, old_meta)
+        self.assertEqual({'a': 1, 'b': 2}, s.get_atom_metadata('my task'))
+        self.assertEqual(states.RUNNING, s.get_atom_state('my task'))
+
     def test_default_task_progress(self):
         s = self._get_storage()
         s.ensure_atom(test_utils.NoopTask('my task'))
@@ -346,6 +360,30 @@ class StorageTestMixin(object):
         self.assertEqual({'viking': 'eggs'},
                          s.fetch_mapped_args({'viking': 'spam'}))
 
+    def test_fetch_mapped_args_reuses_plan(self):
+        walked = []
+
+        def scope_walker():
+            walked.append(True)
+            yield ['a']
+
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            scope_fetcher=lambda atom_name: scope_walker())
+        s.ensure_atom(test_utils.NoopTask('a', provides='x'))
+        s.ensure_atom(test_utils.NoopTask('b'))
+        s.save('a', 1)
+        for _i in range(0, 2):
+            self.assertEqual({'y': 1},
+                             s.fetch_mapped_args({'y': 'x'}, atom_name='b'))
+        self.assertEqual(1, len(walked))
+
+        # New providers must make the prior plan stale (flow injected
+        # values take precedence over atom produced ones).
+        s.inject({'x': 2})
+        self.assertEqual({'y': 2},
+                         s.fetch_mapped_args({'y': 'x'}, atom_name='b'))
+
     def test_fetch_not_found_args(self):
         s = self._get_storage()
         s.inject({'foo': 'bar', 'spam': 'eggs'})
@@ -586,6 +624,148 @@ class StorageTestMixin(object):
         s.save('my task', a_failure, state=states.REVERT_FAILURE)
         self.assertEqual(a_failure, s.get_revert_result('my task'))
 
+    def _get_saved_atom_state(self, s, atom_name):
+        with contextlib.closing(self.backend.get_connection()) as conn:
+            ad = conn.get_atom_details(s.get_atom_uuid(atom_name))
+            return ad.state
+
+    def test_invalid_flush_policy(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        self.assertRaises(ValueError, storage.Storage,
+                          flow_detail=flow_detail, backend=self.backend,
+                          flush_policy='sometimes')
+
+    def test_buffered_atom_changes_saved_on_flush(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            flush_policy=storage.FLUSH_PER_CYCLE)
+        s.ensure_atom(test_utils.NoopTask('my task'))
+        s.set_atom_state('my task', states.RUNNING)
+        s.save('my task', 5)
+        s.set_task_progress('my task', 1.0)
+        self.assertEqual(states.SUCCESS, s.get_atom_state('my task'))
+        self.assertEqual(5, s.get_execute_result('my task'))
+        self.assertEqual(states.PENDING,
+                         self._get_saved_atom_state(s, 'my task'))
+        s.flush()
+        self.assertEqual(states.SUCCESS,
+                         self._get_saved_atom_state(s, 'my task'))
+        with contextlib.closing(self.backend.get_connection()) as conn:
+            ad = conn.get_atom_details(s.get_atom_uuid('my task'))
+            self.assertEqual(5, ad.results)
+            self.assertEqual(1.0, ad.meta[storage.META_PROGRESS])
+
+    def test_buffered_atom_changes_kept_on_failed_flush(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            flush_policy=storage.FLUSH_PER_CYCLE)
+        s.ensure_atom(test_utils.NoopTask('my task'))
+        s.set_atom_state('my task', states.RUNNING)
+        with contextlib.closing(self.backend.get_connection()) as conn:
+            conn_cls = type(conn)
+        with mock.patch.object(conn_cls, 'update_atom_details_many',
+                               side_effect=exceptions.StorageFailure('boom')):
+            self.assertRaises(exceptions.StorageFailure, s.flush)
+        self.assertEqual(states.PENDING,
+                         self._get_saved_atom_state(s, 'my task'))
+        s.flush()
+        self.assertEqual(states.RUNNING,
+                         self._get_saved_atom_state(s, 'my task'))
+
+    def test_large_result_offloaded(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        blob_store = blobs.MemoryBlobStore()
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            blob_store=blob_store, blob_threshold=1024)
+        s.ensure_atom(test_utils.NoopTask('big', provides='big'))
+        s.ensure_atom(test_utils.NoopTask('small', provides='small'))
+        big = {'data': 'x' * 4096}
+        s.save('big', big)
+        s.save('small', 'x')
+        self.assertEqual(1, len(blob_store))
+        self.assertEqual(big, s.get_execute_result('big'))
+        self.assertEqual(big, s.fetch('big'))
+        self.assertEqual({'big': big, 'small': 'x'}, s.fetch_all())
+        with contextlib.closing(self.backend.get_connection()) as conn:
+            ad = conn.get_atom_details(s.get_atom_uuid('big'))
+            self.assertTrue(blobs.is_reference(ad.results))
+            ad = conn.get_atom_details(s.get_atom_uuid('small'))
+            self.assertEqual('x', ad.results)
+
+    def test_offloaded_result_loaded_once_per_fetch(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            blob_store=blobs.MemoryBlobStore(),
+                            blob_threshold=1024)
+        s.ensure_atom(test_utils.NoopTask('big', provides=['x', 'y']))
+        big = ['x' * 4096, 'y' * 4096]
+        s.save('big', big)
+        with mock.patch.object(blobs, 'load', wraps=blobs.load) as load:
+            args = s.fetch_mapped_args({'a': 'x', 'b': 'y', 'c': 'x'},
+                                       scope_walker=[['big']])
+            self.assertEqual({'a': big[0], 'b': big[1], 'c': big[0]}, args)
+            self.assertEqual(1, load.call_count)
+            self.assertEqual({'x': big[0], 'y': big[1]}, s.fetch_all())
+            self.assertEqual(2, load.call_count)
+
+    def test_offloaded_result_without_blob_store(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            blob_store=blobs.MemoryBlobStore(),
+                            blob_threshold=1024)
+        s.ensure_atom(test_utils.NoopTask('big', provides='big'))
+        s.save('big', 'x' * 4096)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend)
+        self.assertRaisesRegex(exceptions.StorageFailure,
+                               "^Result of atom 'big'",
+                               s.get_execute_result, 'big')
+
+    def test_small_result_not_serialized(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            blob_store=blobs.MemoryBlobStore(),
+                            blob_threshold=1024)
+        s.ensure_atom(test_utils.NoopTask('small', provides='small'))
+        with mock.patch.object(blobs, 'dump') as dump:
+            s.save('small', 10)
+            s.save('small', 'x')
+        self.assertFalse(dump.called)
+        self.assertEqual('x', s.get_execute_result('small'))
+
+    def test_release_result(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        blob_store = blobs.MemoryBlobStore()
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            blob_store=blob_store)
+        s.ensure_atom(test_utils.NoopTask('big', provides='big'))
+        s.ensure_atom(test_utils.NoopTask('small', provides='small'))
+        big = {'data': 'x' * 4096}
+        s.save('big', big)
+        s.save('small', 10)
+        with mock.patch.object(blobs, 'dump', wraps=blobs.dump) as dump:
+            self.assertFalse(s.release_result('small', threshold=1024))
+            self.assertFalse(dump.called)
+        self.assertFalse(s.release_result('big', threshold=8192))
+        self.assertEqual(0, len(blob_store))
+        self.assertTrue(s.release_result('big', threshold=1024))
+        self.assertFalse(s.release_result('big', threshold=1024))
+        self.assertEqual(1, len(blob_store))
+        self.assertEqual(big, s.fetch('big'))
+        self.assertEqual(10, s.fetch('small'))
+
+    def test_buffered_atom_changes_saved_on_flow_state_change(self):
+        _lb, flow_detail = p_utils.temporary_flow_detail(self.backend)
+        s = storage.Storage(flow_detail=flow_detail, backend=self.backend,
+                            flush_policy=storage.FLUSH_ON_FLOW_STATE)
+        s.ensure_atom(test_utils.NoopTask('my task'))
+        s.set_flow_state(states.RUNNING)
+        s.set_atom_state('my task', states.FAILURE)
+        self.assertEqual(states.PENDING,
+                         self._get_saved_atom_state(s, 'my task'))
+        s.set_flow_state(states.FAILURE)
+        self.assertEqual(states.FAILURE,
+                         self._get_saved_atom_state(s, 'my task'))
+
 
 class StorageMemoryTest(StorageTestMixin, test.TestCase):
     def setUp(self):
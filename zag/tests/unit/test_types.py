@@ -18,6 +18,7 @@ import networkx as nx
 from six.moves import cPickle as pickle
 
 from zag import test
+from zag.types import cancellation
 from zag.types import graph
 from zag.types import sets
 from zag.types import timing
@@ -59,6 +60,34 @@ class TimingTest(test.TestCase):
                           timing.Timeout, -1)
 
 
+class CancellationTokenTest(test.TestCase):
+    def test_request_reset(self):
+        t = cancellation.CancellationToken()
+        self.assertFalse(t.requested)
+        self.assertFalse(t.wait(0))
+        t.request()
+        self.assertTrue(t.requested)
+        self.assertTrue(t.wait(0))
+        t.reset()
+        self.assertFalse(t.requested)
+
+    def test_pickle(self):
+        t = cancellation.CancellationToken()
+        self.assertFalse(pickle.loads(pickle.dumps(t)).requested)
+        t.request()
+        self.assertTrue(pickle.loads(pickle.dumps(t)).requested)
+
+    def test_first_reason_kept(self):
+        t = cancellation.CancellationToken()
+        self.assertIsNone(t.reason)
+        t.request(reason='timeout')
+        t.request(reason='failure')
+        self.assertEqual('timeout', t.reason)
+        self.assertEqual('timeout', pickle.loads(pickle.dumps(t)).reason)
+        t.reset()
+        self.assertIsNone(t.reason)
+
+
 class GraphTest(test.TestCase):
     def test_no_successors_no_predecessors(self):
         g = graph.DiGraph()
@@ -204,7 +204,8 @@ class TestWorkerTaskExecutor(test.MockTestCase):
         expected_calls = [
             mock.call.Request(self.task, self.task_uuid, 'execute',
                               self.task_args, timeout=self.timeout,
-                              result=mock.ANY, failures=mock.ANY),
+                              result=mock.ANY, failures=mock.ANY,
+                              profile=False),
             mock.call.request.transition_and_log_error(pr.PENDING,
                                                        logger=mock.ANY),
             mock.call.request.attach_worker(worker),
@@ -225,7 +226,7 @@ class TestWorkerTaskExecutor(test.MockTestCase):
             mock.call.Request(self.task, self.task_uuid, 'revert',
                               self.task_args, timeout=self.timeout,
                               failures=self.task_failures,
-                              result=self.task_result),
+                              result=self.task_result, profile=False),
             mock.call.request.transition_and_log_error(pr.PENDING,
                                                        logger=mock.ANY),
             mock.call.request.attach_worker(worker),
@@ -243,7 +244,8 @@ class TestWorkerTaskExecutor(test.MockTestCase):
         expected_calls = [
             mock.call.Request(self.task, self.task_uuid, 'execute',
                               self.task_args, timeout=self.timeout,
-                              result=mock.ANY, failures=mock.ANY),
+                              result=mock.ANY, failures=mock.ANY,
+                              profile=False),
         ]
         self.assertEqual(expected_calls, self.master_mock.mock_calls)
 
@@ -256,7 +258,8 @@ class TestWorkerTaskExecutor(test.MockTestCase):
         expected_calls = [
             mock.call.Request(self.task, self.task_uuid, 'execute',
                               self.task_args, timeout=self.timeout,
-                              result=mock.ANY, failures=mock.ANY),
+                              result=mock.ANY, failures=mock.ANY,
+                              profile=False),
             mock.call.request.transition_and_log_error(pr.PENDING,
                                                        logger=mock.ANY),
             mock.call.request.attach_worker(worker),
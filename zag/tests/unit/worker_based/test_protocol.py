@@ -197,3 +197,23 @@ class TestProtocol(test.TestCase):
         request.set_result(111)
         result = request.future.result()
         self.assertEqual((executor.EXECUTED, 111), result)
+
+    def test_timings(self):
+        request = self.request()
+        self.assertEqual({}, request.future.timings)
+        request.transition(pr.PENDING)
+        request.transition(pr.RUNNING)
+        self.assertIn('started', request.future.timings)
+        request.transition(pr.SUCCESS)
+        request.set_result(111)
+        self.assertLessEqual(request.future.timings['started'],
+                             request.future.timings['finished'])
+
+    def test_to_dict_from_dict_with_profile(self):
+        request = self.request(profile=True)
+        data = request.to_dict()
+        self.assertTrue(data['profile'])
+        pr.Request.validate(data)
+        work = pr.Request.from_dict(data)
+        self.assertTrue(work.arguments['profile'])
+        self.assertNotIn('profile', self.request().to_dict())
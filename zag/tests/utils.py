@@ -23,6 +23,7 @@ from oslo_utils import timeutils
 import redis
 import six
 
+from zag.engines.action_engine import shared_buffers
 from zag import exceptions
 from zag.listeners import capturing
 from zag.patterns import linear_flow as lf
@@ -351,6 +352,41 @@ class TaskRevertExtraArgs(task.Task):
         pass
 
 
+class EchoTask(task.Task):
+
+    def execute(self, value):
+        return value
+
+
+class SharedArgumentTask(task.Task):
+    """Returns its value and whether it was rebuilt from shared memory."""
+
+    def execute(self, value):
+        return (value, bool(shared_buffers._attached))
+
+
+class EventuallySucceedingTask(task.Task):
+    """Fails until it (this copy of it) has been ran a few times."""
+
+    def __init__(self, *args, **kwargs):
+        self.succeed_on = kwargs.pop('succeed_on', 3)
+        super(EventuallySucceedingTask, self).__init__(*args, **kwargs)
+        self.runs = 0
+
+    def execute(self):
+        self.runs += 1
+        if self.runs < self.succeed_on:
+            raise RuntimeError('Woot with %s' % self.runs)
+        return self.runs
+
+
+class UniqueResultTask(task.Task):
+    cacheable = True
+
+    def execute(self, x):
+        return (x, time.time())
+
+
 class SleepTask(task.Task):
     def execute(self, duration, **kwargs):
         time.sleep(duration)
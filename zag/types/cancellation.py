@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+
+class CancellationToken(object):
+    """A (cooperative) request for some piece of work to stop early.
+
+    Whoever is doing the work is expected to check (or wait on) the token
+    and stop what it is doing (as soon as it can) once cancellation has been
+    requested; nothing is forcefully stopped.
+
+    When pickled (for example to be sent to another process) only whether
+    cancellation was requested (at that point in time) is retained; later
+    requests made on the original token will **not** be seen by the unpickled
+    copy.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._reason = None
+
+    def request(self, reason=None):
+        """Requests cancellation (releases any waiters).
+
+        The reason given with the first request is the one kept (later
+        requests do not replace it).
+        """
+        if not self._event.is_set():
+            self._reason = reason
+        self._event.set()
+
+    @property
+    def reason(self):
+        """Why cancellation was (first) requested (if a reason was given)."""
+        return self._reason
+
+    @property
+    def requested(self):
+        """Returns if cancellation has been requested."""
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Waits (up to timeout) for cancellation to be requested.
+
+        Returns if cancellation has been requested (which may be false if
+        the timeout was reached before it was).
+        """
+        return self._event.wait(timeout)
+
+    def reset(self):
+        """Resets so that cancellation can be requested again."""
+        self._event.clear()
+        self._reason = None
+
+    def __getstate__(self):
+        return {'requested': self.requested, 'reason': self._reason}
+
+    def __setstate__(self, state):
+        self._event = threading.Event()
+        self._reason = state.get('reason')
+        if state.get('requested'):
+            self._event.set()
@@ -18,8 +18,10 @@ import collections
 import contextlib
 import copy
 import logging
+import threading
 
 from oslo_utils import reflection
+from oslo_utils import timeutils
 import six
 
 LOG = logging.getLogger(__name__)
@@ -127,6 +129,169 @@ class Listener(object):
         return not self.__eq__(other)
 
 
+#: Overflow policy that makes notifying wait until there is room.
+BLOCK = 'block'
+
+#: Overflow policy that discards the oldest pending call to make room.
+DROP_OLDEST = 'drop_oldest'
+
+#: Overflow policy that replaces a pending call (to the same listener, for the
+#: same event type and about the same subject) with the newer one (if there is
+#: no such call it waits until there is room, like :py:data:`.BLOCK` does).
+COALESCE = 'coalesce'
+
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, COALESCE)
+
+
+def _default_subject(details):
+    for key in ('task_uuid', 'retry_uuid', 'atom_uuid', 'flow_uuid'):
+        try:
+            return details[key]
+        except (KeyError, TypeError):
+            pass
+    return None
+
+
+class Dispatcher(object):
+    """Calls listeners (in order) from a thread of its own.
+
+    Notifiers that are given a dispatcher place listener calls in its
+    (bounded) queue instead of calling listeners themselves, so that slow
+    listeners do not slow down whoever is notifying. Calls are made in the
+    order they were queued in, so (unless the overflow policy discards or
+    coalesces them) a listener receives the events about a subject, which
+    by default is the atom or flow the event is about, in the order they
+    happened in.
+
+    :param max_size: the maximum number of pending calls.
+    :param overflow: what to do when a call is queued while ``max_size``
+                     calls are pending (one of :py:data:`.OVERFLOW_POLICIES`).
+    :param subject_func: function that extracts the subject of an event from
+                         its details (used when coalescing).
+    """
+
+    def __init__(self, max_size=1024, overflow=BLOCK, subject_func=None):
+        if max_size <= 0:
+            raise ValueError("Maximum size must be greater than zero")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy '%s' expected one"
+                             " of %s" % (overflow, list(OVERFLOW_POLICIES)))
+        if subject_func is None:
+            subject_func = _default_subject
+        self._max_size = max_size
+        self._overflow = overflow
+        self._subject_func = subject_func
+        self._pending = collections.deque()
+        # (listener id, subject) -> the last pending call for them.
+        self._last = {}
+        self._calling = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self.dropped = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _forget(self, call):
+        last_key = (id(call[0]), call[3])
+        if self._last.get(last_key) is call:
+            del self._last[last_key]
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run,
+                                            name='notifier-dispatcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def submit(self, listener, event_type, details):
+        """Queues a call of the listener with the event type and details."""
+        subject = self._subject_func(details)
+        last_key = (id(listener), subject)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Can not queue calls into a closed"
+                                   " dispatcher")
+            self._ensure_thread()
+            while len(self._pending) >= self._max_size:
+                if self._overflow == DROP_OLDEST:
+                    self._forget(self._pending.popleft())
+                    self.dropped += 1
+                    break
+                if self._overflow == COALESCE:
+                    # Only the last pending call (to the listener about the
+                    # subject) can be replaced, otherwise the listener would
+                    # see events about the subject out of order.
+                    last = self._last.get(last_key)
+                    if last is not None and last[1] == event_type:
+                        last[2] = details
+                        self.coalesced += 1
+                        return
+                self._cond.wait()
+            call = [listener, event_type, details, subject]
+            self._pending.append(call)
+            self._last[last_key] = call
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                call = self._pending.popleft()
+                self._forget(call)
+                self._calling = True
+                self._cond.notify_all()
+            listener, event_type, details, _subject = call
+            try:
+                listener(event_type, details.copy())
+            except Exception:
+                LOG.warning("Failure calling listener %s to notify about event"
+                            " %s, details: %s", listener, event_type,
+                            details, exc_info=True)
+            finally:
+                with self._cond:
+                    self._calling = False
+                    self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Waits (up to timeout) for all pending calls to have been made.
+
+        Returns if all of them were made (which may be false if the timeout
+        was reached before they were).
+        """
+        if self._thread is threading.current_thread():
+            # A listener can not wait for itself to finish...
+            return False
+        deadline = None
+        with self._cond:
+            while self._pending or self._calling:
+                if timeout is not None:
+                    if deadline is None:
+                        deadline = timeutils.now() + timeout
+                    remaining = deadline - timeutils.now()
+                    if remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                else:
+                    self._cond.wait()
+            return True
+
+    def close(self):
+        """Makes the pending calls then stops the thread making them."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+
 class Notifier(object):
     """A notification (`pub/sub`_ *like*) helper class.
 
@@ -142,6 +307,9 @@ class Notifier(object):
     only :py:meth:`.notify` calls or other read-only actions (like calling
     into :py:meth:`.is_registered`) are occurring at the same time.
 
+    When a :py:class:`.Dispatcher` is provided listeners are called from
+    its thread (instead of from the thread calling :py:meth:`.notify`).
+
     .. _pub/sub: http://en.wikipedia.org/wiki/Publish%E2%80%93subscribe_pattern
     """
 
@@ -154,8 +322,9 @@ class Notifier(object):
     #: Events which can *not* be used to trigger notifications
     _DISALLOWED_NOTIFICATION_EVENTS = set([ANY])
 
-    def __init__(self):
+    def __init__(self, dispatcher=None):
         self._topics = collections.defaultdict(list)
+        self.dispatcher = dispatcher
 
     def __len__(self):
         """Returns how many callbacks are registered.
@@ -208,6 +377,13 @@ class Notifier(object):
             return
         if not details:
             details = {}
+        if self.dispatcher is not None:
+            # Only one copy is made here (each listener still gets its own
+            # copy, but those are made in the dispatchers thread).
+            details = details.copy()
+            for listener in listeners:
+                self.dispatcher.submit(listener, event_type, details)
+            return
         for listener in listeners:
             try:
                 listener(event_type, details.copy())
@@ -321,8 +497,8 @@ class RestrictedNotifier(Notifier):
     when constructing the notifier.
     """
 
-    def __init__(self, watchable_events, allow_any=True):
-        super(RestrictedNotifier, self).__init__()
+    def __init__(self, watchable_events, allow_any=True, dispatcher=None):
+        super(RestrictedNotifier, self).__init__(dispatcher=dispatcher)
         self._watchable_events = frozenset(watchable_events)
         self._allow_any = allow_any
 